@@ -1,7 +1,29 @@
-from flask import Flask, request, jsonify
-import json
+from flask import Flask, Response, request, jsonify
 from services.sheets import GoogleSheetsService
-from utils.flow_handler import FlowHandler
+from services.offline import OfflineGoogleSheetsService, OfflineWhatsAppAPI, OfflineRazorpayAPI
+from services.media_manager import MediaManager
+from utils.flow_handler import FlowHandler, user_sessions
+from utils.reminder_scheduler import ReminderScheduler
+from utils.webhook_recorder import WebhookRecorder
+from utils.profiling import RequestProfiler, tag_action, profile_job
+from utils.dispatcher import MessageDispatcher
+from utils.admission import AdmissionController
+from utils.delivery_tracker import DeliveryTracker
+from utils.prefork import acquire_process_lock, claim_slot
+from utils.payment_reconciliation import PaymentReconciler
+from utils.worker_routing import WorkerRouter, OwnerTimeout, ROUTED_HEADER
+from concurrent.futures import TimeoutError as FutureTimeout
+from utils.admin_auth import is_admin_request
+from utils import analytics
+from utils.flow_handler import BOOKING_AMOUNT_PAISE
+import datetime
+from utils.json_codec import dumps
+from utils.webhook_parsing import (
+    parse_json_body, parse_incoming_message, parse_statuses, parse_paid_payment_event, load_flow_private_key,
+    build_init_response
+)
+from utils.flow_screens import FlowScreenServer
+from utils import deadline
 import os
 import logging
 from dotenv import load_dotenv
@@ -16,17 +38,156 @@ logger = logging.getLogger(__name__)
 
 # Initialize Services
 # Please ensure credentials.json is in the root or specified path
-sheets_service = GoogleSheetsService()
-flow_handler = FlowHandler(sheets_service)
+# OFFLINE_MODE=true swaps Sheets and the Graph API for in-memory stand-ins (load testing)
+OFFLINE_MODE = os.getenv("OFFLINE_MODE", "false").lower() == "true"
+if OFFLINE_MODE:
+    sheets_service = OfflineGoogleSheetsService()
+    offline_wa_api = OfflineWhatsAppAPI()
+    # Stand-in media IDs must never reach (or be loaded from) the real media cache file
+    flow_handler = FlowHandler(sheets_service, wa_api=offline_wa_api, rz_api=OfflineRazorpayAPI(),
+                               media=MediaManager(offline_wa_api, path=None))
+else:
+    sheets_service = GoogleSheetsService()
+    flow_handler = FlowHandler(sheets_service)
+
+# Messages from one user are handled in order; different users in parallel
+message_dispatcher = MessageDispatcher(workers=int(os.getenv("DISPATCH_WORKERS", "8")))
+DISPATCH_WAIT_SECONDS = float(os.getenv("DISPATCH_WAIT_SECONDS", "10"))
+
+# Sent/delivered/read/failed events matched to our sends (latency per message type)
+delivery_tracker = DeliveryTracker()
+flow_handler.wa_api.tracker = delivery_tracker
+
+# Per-phone and global token buckets in front of handle_message
+admission = AdmissionController()
+
+# Date and slot screens of the booking Flow, served from in-memory availability
+flow_screens = FlowScreenServer(flow_handler)
+
+# PREFORK=true (set by gunicorn.conf.py) means this module is imported once in the
+# gunicorn master: connections and threads are then created in init_worker(),
+# after fork, and only the read-only counselor catalog is loaded up front.
+PREFORK = os.getenv("PREFORK", "false").lower() == "true"
+reminder_scheduler = None
+# Set when several workers run: forwards each phone's requests to the worker holding its state
+worker_router = None
+
+def init_worker(workers=1):
+    """Per-process connections and background threads. Runs in each worker after fork."""
+    global reminder_scheduler, worker_router
+    if PREFORK:
+        sheets_service.connect()
+        flow_handler.rz_api = type(flow_handler.rz_api)()
+
+    # Sessions, dispatch queues, admission buckets and Flow tokens are per worker:
+    # each phone (and each Flow token) is served by one worker, the rest forward to it
+    if PREFORK and workers > 1:
+        worker_router = WorkerRouter.claim(workers)
+        if worker_router:
+            flow_handler.flow_tokens.prefix = worker_router.token_prefix
+            admission.share_global(workers)
+            worker_router.serve(app)
+        else:
+            logger.error(f"No free worker slot of {workers}; handling requests without routing")
+
+    # Booking mutations go to a local fsync'd journal first and are applied in the background
+    journal_path = os.getenv("BOOKING_JOURNAL_PATH")
+    if journal_path:
+        if PREFORK:
+            # One journal per worker; a restarted worker takes over a dead one's file
+            journal_path = (claim_slot(journal_path, 2 * workers)
+                            or f"{journal_path}.{os.getpid()}")
+        sheets_service.enable_journal(journal_path)
+
+    # Counselor photos are uploaded once and sent by media ID. One worker prewarms and
+    # refreshes them; the others pick the IDs up from the shared cache file.
+    media = flow_handler.media
+    if not PREFORK or not media.path or acquire_process_lock(f"{media.path}.prewarm.lock"):
+        media.start(prewarm_urls=[c['image_url'] for c in sheets_service.get_active_counselors()]
+                                 if sheets_service.cache else [])
+
+    # Conversation state is snapshotted so restarts don't drop users mid-booking
+    if os.getenv("SESSION_SNAPSHOT_PATH"):
+        user_sessions.start(interval=float(os.getenv("SESSION_SNAPSHOT_INTERVAL", "30")))
+
+    # Offers slots freed by cancellations and reschedules to waitlisted users. The
+    # waitlist state file is shared, so one worker sends the offers.
+    waitlist = flow_handler.waitlist
+    if not PREFORK or not waitlist.path or acquire_process_lock(f"{waitlist.path}.sender.lock"):
+        waitlist.start()
+
+    # Appointment reminders (background thread, opt-in); only one worker runs them
+    if os.getenv("ENABLE_REMINDERS", "false").lower() == "true":
+        reminder_scheduler = ReminderScheduler(sheets_service, flow_handler.wa_api)
+        if not PREFORK or acquire_process_lock(reminder_scheduler.ledger_path + ".lock"):
+            reminder_scheduler.start()
+
+    # Catch payments whose webhook was missed (opt-in); likewise one worker only
+    if os.getenv("ENABLE_RECONCILIATION", "false").lower() == "true":
+        if not PREFORK or acquire_process_lock(os.getenv("RECONCILE_LOCK_PATH", "payment_reconciler.lock")):
+            PaymentReconciler(sheets_service, flow_handler.rz_api, flow_handler.wa_api).start()
+
+if PREFORK:
+    sheets_service.prepare_fork()
+else:
+    init_worker()
+
+# Capture sanitized inbound bodies for replay (scripts/load_test.py replay)
+WEBHOOK_RECORD_PATH = os.getenv("WEBHOOK_RECORD_PATH")
+if WEBHOOK_RECORD_PATH:
+    webhook_recorder = WebhookRecorder(WEBHOOK_RECORD_PATH, float(os.getenv("WEBHOOK_RECORD_SAMPLE", "1.0")))
+
+    @app.before_request
+    def record_webhook():
+        # A forwarded request was recorded by the worker it first landed on
+        if (request.method == "POST" and request.path in ("/webhook", "/flow", "/payment-webhook")
+                and not request.headers.get(ROUTED_HEADER)):
+            webhook_recorder.record(request.path, request.get_data())
+
+# On-demand profiling (PROFILE_REQUESTS or PROFILE_ON_DEMAND); no hooks at all when unset
+request_profiler = RequestProfiler.from_env()
+if request_profiler:
+    request_profiler.install(app)
 
 # WhatsApp Configuration
 VERIFY_TOKEN = os.getenv("VERIFY_TOKEN", "my_secure_token_123") 
 
+# Passed on to the owning worker, which does its own signature checks
+FORWARDED_HEADERS = ("Content-Type", "X-Hub-Signature-256", "X-Razorpay-Signature")
+
+def forward_to_owner(owner, path, on_timeout):
+    """
+    The owning worker's response to this request, or None to handle it here (one
+    worker, this worker owns it, already forwarded, or the owner is unreachable).
+    `on_timeout` is returned if the owner took the request but didn't answer in time.
+    """
+    if not worker_router or not worker_router.is_remote(owner) or request.headers.get(ROUTED_HEADER):
+        return None
+    headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    try:
+        forwarded = worker_router.forward(owner, request.method, path, request.get_data(), headers)
+    except OwnerTimeout:
+        logger.warning(f"Worker {owner} didn't answer {path} in time")
+        return on_timeout
+    if forwarded is None:
+        return None
+    status, content_type, body = forwarded
+    return Response(body, status=status, content_type=content_type)
+
+def webhook_phone(data):
+    """The phone a webhook body is about: the sender of a message, or the recipient of a status."""
+    message = parse_incoming_message(data)
+    if message:
+        return message[0]
+    statuses = parse_statuses(data)
+    return statuses[0].get('recipient_id') if statuses else None
+
 @app.route("/", methods=["GET"])
 def home():
     return "WhatsApp Wellness Bot is Running!"
 
 @app.route("/webhook", methods=["GET", "POST"])
+@deadline.within(deadline.REQUEST_DEADLINE_SECONDS, "webhook")
 def webhook():
     if request.method == "GET":
         # Verification verification
@@ -44,51 +205,51 @@ def webhook():
 
     if request.method == "POST":
         # Handle Incoming Message
-        data = request.json
+        data = parse_json_body(request.get_data())
         if data:
             # 1. Check if this is a FLOW Data Request
             if "encrypted_flow_data" in data:
                 logger.info("🔥 encrypted_flow_data Endpoint Hit!")
                 return process_flow_request(data)
 
+            if worker_router:
+                phone = webhook_phone(data)
+                # Meta retries anything but a 200, so a slow owner is still acknowledged
+                forwarded = forward_to_owner(worker_router.owner(phone) if phone else None, "/webhook",
+                                             (jsonify({"status": "success"}), 200))
+                if forwarded is not None:
+                    return forwarded
+
             logger.info(f"Received JSON: {data}")
             # Process standard WhatsApp Message Structure
             # Note: This parsing depends on the specific API provider structure (Meta Cloud API).
             try:
-                entry = data.get('entry', [])[0]
-                changes = entry.get('changes', [])[0]
-                value = changes.get('value', {})
-                messages = value.get('messages', [])
-                
-                if messages:
+                statuses = parse_statuses(data)
+                if statuses:
+                    tag_action("statuses")
+                    delivery_tracker.ingest(statuses)
+
+                message = parse_incoming_message(data)
+                if message:
                     response = None
-                    msg = messages[0]
-                    from_number = msg.get('from') # User Phone
-                    msg_type = msg.get('type')
-                    if msg_type == 'text':
-                        msg_body = msg.get('text', {}).get('body', '')
-                    elif msg_type == 'interactive':
-                        interactive = msg.get('interactive', {})
-                        if interactive.get('type') == 'button_reply':
-                            msg_body = interactive.get('button_reply', {}).get('id')
-                        elif interactive.get('type') == 'list_reply':
-                            msg_body = interactive.get('list_reply', {}).get('id')
-                        elif interactive.get('type') == 'nfm_reply':
-                            # WhatsApp Flow response - process directly
-                            nfm_reply = interactive.get('nfm_reply', {})
-                            flow_response = json.loads(nfm_reply.get('response_json', '{}'))
-                            logger.info(f"Flow Response: {flow_response}")
-                            response = flow_handler.process_flow_booking(from_number, flow_response)
-                            # Don't process as regular message
-                            msg_body = None
-                        else:
-                            msg_body = ""
-                    else:
-                        msg_body = ""
-                    
-                    # Pass to Flow Handler (skip if Flow already processed)
-                    if msg_body is not None:
-                        response = flow_handler.handle_message(from_number, msg_body)
+                    from_number, msg_body, flow_response = message
+                    delivery_tracker.note_inbound(from_number)
+                    tag_action("flow_reply" if flow_response is not None else "message")
+                    # Flow replies complete a booking and are always let through
+                    shed = admission.admit(from_number) if flow_response is None else None
+                    if shed:
+                        tag_action(f"shed_{shed}")
+                        admission.reply_throttled(flow_handler.wa_api, from_number, shed)
+                        return jsonify({"status": "success"}), 200
+                    # Serialized per phone: a double tap can't race its own session. A profiled
+                    # request profiles the job on the dispatcher thread that runs it.
+                    future = message_dispatcher.submit(from_number, profile_job(flow_handler.handle_incoming),
+                                                       from_number, msg_body, flow_response)
+                    try:
+                        response = future.result(timeout=DISPATCH_WAIT_SECONDS)
+                    except FutureTimeout:
+                        # Still queued behind this user's earlier messages; ack Meta anyway
+                        logger.warning(f"Message from {from_number} still queued, acknowledging")
                     
                     # For MVP: Log the response we WOULD send
                     # In real app: call send_message(from_number, response)
@@ -101,7 +262,16 @@ def webhook():
         return jsonify({"status": "success"}), 200
 
 @app.route("/payment-webhook", methods=["POST"])
+@deadline.within(deadline.REQUEST_DEADLINE_SECONDS, "payment_webhook")
 def payment_webhook():
+    # Handled by the payer's worker, like their messages (in OFFLINE_MODE it also holds their hold)
+    if worker_router:
+        paid = parse_paid_payment_event(parse_json_body(request.data) or {})
+        forwarded = forward_to_owner(worker_router.owner(paid[2]) if paid and paid[2] else None,
+                                     "/payment-webhook", (jsonify({"status": "ok"}), 200))
+        if forwarded is not None:
+            return forwarded
+
     # 1. Get Signature and Secret
     webhook_secret = os.getenv("RAZORPAY_WEBHOOK_SECRET")
     signature = request.headers.get('X-Razorpay-Signature')
@@ -121,82 +291,154 @@ def payment_webhook():
         logger.warning("Skipping Webhook Signature Verification (Secret or Signature missing)")
     
     # 3. Process Event
-    event = request.json
-    if event.get('event') == 'payment_link.paid':
-        try:
-            payload = event.get('payload', {})
-            payment_link = payload.get('payment_link', {})
-            entity = payment_link.get('entity', {})
-            
-            # We stored booking_id in 'notes' -> 'booking_id' OR in 'reference_id'
-            # Let's check 'notes'
-            notes = entity.get('notes', {})
-            booking_id = notes.get('booking_id')
-            
-            # Also get order_id if available
-            order_id = entity.get('order_id') or entity.get('id') # fallback to plink id
+    event = parse_json_body(request.data) or {}
+    tag_action(event.get('event', 'unknown'))
+    try:
+        paid = parse_paid_payment_event(event)
+        if paid:
+            booking_id, order_id, phone = paid
+            logger.info(f"Payment Received for Booking: {booking_id}")
+            # Update Sheet (searches by booking_id, Col 1)
+            sheets_service.update_booking_status(booking_id, 'PAID', order_id)
             
-            if booking_id:
-                logger.info(f"Payment Received for Booking: {booking_id}")
-                # Update Sheet
-                # Note: our sheets function expects 'order_id' to find the row. 
-                # But we might have stored a temporary ID or nothing.
-                # Let's assume create_booking_hold used booking_id as reference or we search by booking_id
-                
-                # REFACTOR SHEET UPDATE: We need to update BY booking_id, not order_id, 
-                # because we didn't have a real order_id when we created the row.
-                # Since we don't have a 'update_by_booking_id' method, let's add logic to sheets.py or modify app.py
-                # For now, let's assume update_booking_payment searches by booking_id if we pass it? 
-                # Wait, sheets.py strictly searches 'order_id' column 6? No, wait.
-                # update_booking_payment(order_id, status) -> searches for 'order_id'.
-                # In create_booking_hold, we put 'razorpay_order_id' which was empty?
-                # Ah, we need to fix sheets.py to allow finding by booking_id (Col 1).
-                
-                # Let's implement a direct update here assuming we fix sheets.py next step
-                sheets_service.update_booking_status(booking_id, 'PAID', order_id)
+            # Optional: Send WhatsApp Confirmation
+            if phone:
+                flow_handler.send_payment_confirmation(phone, booking_id)
                 
-                # Optional: Send WhatsApp Confirmation
-                phone = entity.get('customer', {}).get('contact')
-                if phone:
-                    flow_handler.wa_api.send_text(phone, f"✅ Payment Received! Your Booking {booking_id} is Confirmed.")
-                    
-        except Exception as e:
-            logger.error(f"Error processing payment event: {e}")
+    except Exception as e:
+        logger.error(f"Error processing payment event: {e}")
 
     return jsonify({"status": "ok"}), 200
 
+analytics_cache = analytics.ReportCache(ttl=int(os.getenv("ANALYTICS_CACHE_TTL", "300")))
+
+def analytics_report(args):
+    """(payload, status) of the analytics report for query `args`; shared with asgi_app.py."""
+    start, end = analytics.default_range()
+    try:
+        start = datetime.date.fromisoformat(args.get("start", str(start)))
+        end = datetime.date.fromisoformat(args.get("end", str(end)))
+    except ValueError:
+        return {"error": "Dates must be YYYY-MM-DD"}, 400
+    period = args.get("period", "week")
+    if period not in ("day", "week"):
+        return {"error": "period must be day or week"}, 400
+
+    bookings = sheets_service.cache.get('Bookings')
+    # Any reload, append or cell update of Bookings gets a new key
+    key = (start, end, period, bookings.version)
+
+    def build():
+        counselor_ids = [c['id'] for c in sheets_service.get_active_counselors()]
+        return analytics.build_report(
+            bookings.values, sheets_service.get_slot_calendar(), counselor_ids,
+            start, end, period, price_rupees=BOOKING_AMOUNT_PAISE // 100
+        )
+
+    try:
+        return analytics_cache.get_or_build(key, build), 200
+    except analytics.AnalyticsUnavailable as e:
+        return {"error": str(e)}, 501
+
+def metrics_report():
+    """Operational counters of this worker; shared with asgi_app.py."""
+    return {
+        "admission": admission.stats(),
+        "delivery": delivery_tracker.report(),
+        "waitlist": flow_handler.waitlist.stats(),
+        # Counters are per worker; each also answers on 127.0.0.1:(ROUTE_PORT_BASE + slot)
+        "routing": worker_router.stats() if worker_router else None,
+        # Calls that ran out of request budget, per operation
+        "deadlines": deadline.stats()
+    }
+
+def last_hold_report(phone):
+    """(payload, status): booking ID of a phone's latest offline hold; shared with asgi_app.py."""
+    holds = getattr(sheets_service, "last_holds", None)
+    if holds is None:
+        return {"error": "Not Found"}, 404
+    return {"booking_id": holds.get(phone)}, 200
+
+def last_flow_token_report(phone):
+    """(payload, status): flow_token of the latest booking Flow sent offline to a phone; shared with asgi_app.py."""
+    tokens = getattr(flow_handler.wa_api, "last_flow_tokens", None)
+    if tokens is None:
+        return {"error": "Not Found"}, 404
+    return {"flow_token": tokens.get(phone)}, 200
+
+@app.route("/admin/analytics", methods=["GET"])
+def admin_analytics():
+    """Utilization, conversion, reschedule, revenue and peak-hour report (X-Admin-Token required)."""
+    if not is_admin_request(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+    payload, status = analytics_report(request.args)
+    return jsonify(payload), status
+
+@app.route("/offline/last-hold", methods=["GET"])
+def offline_last_hold():
+    """Booking ID of a phone's latest hold (OFFLINE_MODE only, for load_test.py)."""
+    phone = request.args.get("phone", "")
+    if worker_router:
+        # Each worker's stand-in sheet only has the holds of the phones it owns
+        forwarded = forward_to_owner(worker_router.owner(phone), request.full_path, None)
+        if forwarded is not None:
+            return forwarded
+    payload, status = last_hold_report(phone)
+    return jsonify(payload), status
+
+@app.route("/offline/last-flow-token", methods=["GET"])
+def offline_last_flow_token():
+    """flow_token of the latest booking Flow sent to a phone (OFFLINE_MODE only, for load_test.py)."""
+    phone = request.args.get("phone", "")
+    if worker_router:
+        # The Flow was sent (and its token issued) by the phone's worker
+        forwarded = forward_to_owner(worker_router.owner(phone), request.full_path, None)
+        if forwarded is not None:
+            return forwarded
+    payload, status = last_flow_token_report(phone)
+    return jsonify(payload), status
+
+@app.route("/admin/metrics", methods=["GET"])
+def admin_metrics():
+    """Operational counters (X-Admin-Token required)."""
+    if not is_admin_request(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(metrics_report()), 200
+
 from utils.flow_encryption import decrypt_request, encrypt_response
 import base64
 
 @app.route("/flow", methods=["POST"])
+@deadline.within(deadline.FLOW_DEADLINE_SECONDS, "flows")
 def flows():
-    return process_flow_request(request.json)
+    return process_flow_request(parse_json_body(request.get_data()))
 
 def process_flow_request(body):
     logger.info("🔥 FLOW LOGIC HIT (via Webhook or Flow Endpoint)!")
     
     # 1. Get Private Key
-    private_key = os.getenv("FLOW_PRIVATE_KEY")
-    if private_key:
-        private_key = private_key.replace('\\n', '\n')
-    
+    private_key = load_flow_private_key()
     if not private_key:
-        try:
-            with open("private.pem", "r") as f:
-                private_key = f.read()
-        except FileNotFoundError:
-            logger.error("Private Key not found!")
-            return jsonify({"error": "Configuration error"}), 500
+        logger.error("Private Key not found!")
+        return jsonify({"error": "Configuration error"}), 500
 
     # 2. Decrypt Request
     try:
         decrypted_payload, aes_key, iv = decrypt_request(body, private_key)
-        logger.info(f"Decrypted Flow Request: {json.dumps(decrypted_payload, indent=2)}")
+        logger.info(f"Decrypted Flow Request: {dumps(decrypted_payload)}")
     except Exception as e:
         logger.error(f"Decryption failed: {e}")
         return jsonify({"error": "Decryption failed"}), 401
 
+    # The Flow's token entry (and its prefetch) lives on the worker that issued it
+    if worker_router:
+        forwarded = forward_to_owner(worker_router.owner_of_token(decrypted_payload.get("flow_token")), "/flow",
+                                     (jsonify({"error": "Timed out"}), 504))
+        if forwarded is not None:
+            return forwarded
+
     action = decrypted_payload.get("action")
+    tag_action(action)
     response_payload = {}
     
     # 3. Handle Actions
@@ -204,55 +446,20 @@ def process_flow_request(body):
         response_payload = {"data": {"status": "active"}}
 
     elif action == "INIT":
-        counselors = sheets_service.get_active_counselors()
-        department_data = []
-        for c in counselors:
-            department_data.append({
-                "id": str(c['id']),
-                "title": str(c['name'])
-            })
-            
-        if not department_data:
-            logger.warning("No counselors found in Sheet! Adding dummy data.")
-            department_data.append({
-                "id": "DUMMY",
-                "title": "Dr. Placeholder"
-            })
-        
-        logger.info(f"INIT Payload Data (Department): {json.dumps(department_data)}")
-            
-        response_payload = {
-            "screen": "COUNSELLOR_SELECT", 
-            "data": {
-                "department": department_data,
-                "counsellor": department_data,
-                "counselors": department_data
-            }
-        }
+        counselors = flow_handler.counselors_for_flow(decrypted_payload.get("flow_token"))
+        response_payload = build_init_response(counselors)
         
     elif action == "data_exchange":
-        request_data = decrypted_payload.get("data", {})
-        response_payload = {
-            "screen": "SUCCESS", 
-            "data": {
-                "extension_message_response": {
-                    "params": {
-                        "flow_token": decrypted_payload.get("flow_token"),
-                        "counsellor_id": request_data.get("counsellor") if request_data.get("counsellor") != "DEBUG_ID" else "1"
-                    }
-                }
-            }
-        }
+        response_payload = flow_screens.respond(decrypted_payload)
         
     else:
         logger.warning(f"Unknown Flow Action: {action}")
         return jsonify({"error": "Unknown action"}), 400
 
     # 4. Encrypt Response
-    logger.info(f"Flow Response Payload: {json.dumps(response_payload)}")   
+    logger.info(f"Flow Response Payload: {dumps(response_payload)}")   
     try:
         encrypted_b64 = encrypt_response(response_payload, aes_key, iv)
-        from flask import Response
         return Response(encrypted_b64, status=200, mimetype='text/plain')
     except Exception as e:
         logger.error(f"Encryption failed: {e}")
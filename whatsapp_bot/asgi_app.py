@@ -0,0 +1,262 @@
+from quart import Quart, request, jsonify, Response
+import asyncio
+import os
+import logging
+import app as sync_app
+from app import (
+    sheets_service, flow_handler, message_dispatcher, DISPATCH_WAIT_SECONDS, delivery_tracker, admission,
+    flow_screens, VERIFY_TOKEN, FORWARDED_HEADERS, OFFLINE_MODE, init_worker, webhook_phone,
+    analytics_report, metrics_report, last_hold_report, last_flow_token_report
+)
+from services.async_sheets import AsyncGoogleSheetsService
+from services.async_whatsapp_api import AsyncWhatsAppAPI
+from services.async_http import close_async_client
+from services.offline import AsyncOfflineWhatsAppAPI
+from utils.admin_auth import is_admin_request
+from utils.worker_routing import OwnerTimeout, ROUTED_HEADER
+from utils.flow_encryption import decrypt_request, encrypt_response
+from utils.json_codec import dumps
+from utils.webhook_parsing import (
+    parse_json_body, parse_incoming_message, parse_statuses, parse_paid_payment_event, load_flow_private_key,
+    build_init_response
+)
+from utils import deadline
+
+# Async (ASGI) serving mode. Same routes as app.py, whose services, background
+# work (journal, media, sessions, waitlist, reminders, reconciliation) and
+# OFFLINE_MODE it imports; requests wait on the event loop instead of holding a
+# thread, and WhatsApp sends made here go out on the shared httpx client.
+# Run with: uvicorn asgi_app:app --port 5000
+# or across cores: gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi_app:app
+# (init_worker is app.py's; requests forwarded between workers are served by its Flask app)
+
+app = Quart(__name__)
+
+logger = logging.getLogger(__name__)
+
+async_sheets = AsyncGoogleSheetsService(sheets_service)
+async_wa_api = AsyncOfflineWhatsAppAPI() if OFFLINE_MODE else AsyncWhatsAppAPI()
+async_wa_api.tracker = delivery_tracker
+
+@app.after_serving
+async def shutdown():
+    await close_async_client()
+
+async def forward_to_owner(owner, path, on_timeout):
+    """Async app.forward_to_owner: the owning worker's response, or None to handle it here."""
+    router = sync_app.worker_router
+    if not router or not router.is_remote(owner) or request.headers.get(ROUTED_HEADER):
+        return None
+    headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    try:
+        forwarded = await router.forward_async(owner, request.method, path, await request.get_data(), headers)
+    except OwnerTimeout:
+        logger.warning(f"Worker {owner} didn't answer {path} in time")
+        return on_timeout
+    if forwarded is None:
+        return None
+    status, content_type, body = forwarded
+    return Response(body, status=status, content_type=content_type)
+
+@app.route("/", methods=["GET"])
+async def home():
+    return "WhatsApp Wellness Bot is Running!"
+
+@app.route("/webhook", methods=["GET", "POST"])
+@deadline.within(deadline.REQUEST_DEADLINE_SECONDS, "webhook")
+async def webhook():
+    if request.method == "GET":
+        mode = request.args.get("hub.mode")
+        token = request.args.get("hub.verify_token")
+        challenge = request.args.get("hub.challenge")
+
+        if mode and token:
+            if mode == "subscribe" and token == VERIFY_TOKEN:
+                logger.info("Webhook Verified!")
+                return challenge, 200
+            else:
+                return "Forbidden", 403
+        return "Hello World", 200
+
+    data = parse_json_body(await request.get_data())
+    if data:
+        if "encrypted_flow_data" in data:
+            logger.info("🔥 encrypted_flow_data Endpoint Hit!")
+            return await process_flow_request(data)
+
+        if sync_app.worker_router:
+            phone = webhook_phone(data)
+            # Meta retries anything but a 200, so a slow owner is still acknowledged
+            forwarded = await forward_to_owner(sync_app.worker_router.owner(phone) if phone else None, "/webhook",
+                                               (jsonify({"status": "success"}), 200))
+            if forwarded is not None:
+                return forwarded
+
+        logger.info(f"Received JSON: {data}")
+        try:
+            statuses = parse_statuses(data)
+            if statuses:
+                delivery_tracker.ingest(statuses)
+
+            message = parse_incoming_message(data)
+            if message:
+                response = None
+                from_number, msg_body, flow_response = message
+                delivery_tracker.note_inbound(from_number)
+                # Flow replies complete a booking and are always let through
+                shed = admission.admit(from_number) if flow_response is None else None
+                if shed:
+                    template = admission.throttle_reply(from_number, shed)
+                    if template:
+                        await async_wa_api.send_template(from_number, template)
+                    return jsonify({"status": "success"}), 200
+                # The conversation state machine is shared with the sync app; it runs
+                # on the dispatcher's workers (in order per phone) so the loop stays
+                # free while it talks to Sheets.
+                future = message_dispatcher.submit(from_number, flow_handler.handle_incoming, from_number, msg_body, flow_response)
+                try:
+                    response = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), DISPATCH_WAIT_SECONDS)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Message from {from_number} still queued, acknowledging")
+
+                if response:
+                    logger.info(f"TO USER {from_number}: {response}")
+
+        except Exception as e:
+            logger.error(f"Error processing webhook: {e}")
+
+    return jsonify({"status": "success"}), 200
+
+@app.route("/payment-webhook", methods=["POST"])
+@deadline.within(deadline.REQUEST_DEADLINE_SECONDS, "payment_webhook")
+async def payment_webhook():
+    raw_body = await request.get_data()
+    # Handled by the payer's worker, like their messages (in OFFLINE_MODE it also holds their hold)
+    if sync_app.worker_router:
+        paid = parse_paid_payment_event(parse_json_body(raw_body) or {})
+        forwarded = await forward_to_owner(sync_app.worker_router.owner(paid[2]) if paid and paid[2] else None,
+                                           "/payment-webhook", (jsonify({"status": "ok"}), 200))
+        if forwarded is not None:
+            return forwarded
+
+    webhook_secret = os.getenv("RAZORPAY_WEBHOOK_SECRET")
+    signature = request.headers.get('X-Razorpay-Signature')
+
+    if webhook_secret and signature:
+        try:
+            # HMAC check only, no I/O - safe to call from the event loop
+            flow_handler.rz_api.client.utility.verify_webhook_signature(raw_body.decode('utf-8'), signature, webhook_secret)
+        except Exception as e:
+            logger.error(f"Webhook Signature Verification Failed: {e}")
+            return jsonify({"error": "Invalid Signature"}), 400
+    else:
+        logger.warning("Skipping Webhook Signature Verification (Secret or Signature missing)")
+
+    event = parse_json_body(raw_body) or {}
+    try:
+        paid = parse_paid_payment_event(event)
+        if paid:
+            booking_id, order_id, phone = paid
+            logger.info(f"Payment Received for Booking: {booking_id}")
+            await async_sheets.update_booking_status(booking_id, 'PAID', order_id)
+
+            if phone:
+                await flow_handler.send_payment_confirmation(phone, booking_id, wa_api=async_wa_api)
+
+    except Exception as e:
+        logger.error(f"Error processing payment event: {e}")
+
+    return jsonify({"status": "ok"}), 200
+
+@app.route("/admin/analytics", methods=["GET"])
+async def admin_analytics():
+    """Utilization, conversion, reschedule, revenue and peak-hour report (X-Admin-Token required)."""
+    if not is_admin_request(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+    payload, status = await asyncio.to_thread(analytics_report, request.args)
+    return jsonify(payload), status
+
+@app.route("/offline/last-hold", methods=["GET"])
+async def offline_last_hold():
+    """Booking ID of a phone's latest hold (OFFLINE_MODE only, for load_test.py)."""
+    phone = request.args.get("phone", "")
+    if sync_app.worker_router:
+        # Each worker's stand-in sheet only has the holds of the phones it owns
+        forwarded = await forward_to_owner(sync_app.worker_router.owner(phone), request.full_path, None)
+        if forwarded is not None:
+            return forwarded
+    payload, status = last_hold_report(phone)
+    return jsonify(payload), status
+
+@app.route("/offline/last-flow-token", methods=["GET"])
+async def offline_last_flow_token():
+    """flow_token of the latest booking Flow sent to a phone (OFFLINE_MODE only, for load_test.py)."""
+    phone = request.args.get("phone", "")
+    if sync_app.worker_router:
+        # The Flow was sent (and its token issued) by the phone's worker
+        forwarded = await forward_to_owner(sync_app.worker_router.owner(phone), request.full_path, None)
+        if forwarded is not None:
+            return forwarded
+    payload, status = last_flow_token_report(phone)
+    return jsonify(payload), status
+
+@app.route("/admin/metrics", methods=["GET"])
+async def admin_metrics():
+    """Operational counters (X-Admin-Token required)."""
+    if not is_admin_request(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(metrics_report()), 200
+
+@app.route("/flow", methods=["POST"])
+@deadline.within(deadline.FLOW_DEADLINE_SECONDS, "flows")
+async def flows():
+    return await process_flow_request(parse_json_body(await request.get_data()))
+
+async def process_flow_request(body):
+    logger.info("🔥 FLOW LOGIC HIT (via Webhook or Flow Endpoint)!")
+
+    private_key = load_flow_private_key()
+    if not private_key:
+        logger.error("Private Key not found!")
+        return jsonify({"error": "Configuration error"}), 500
+
+    try:
+        decrypted_payload, aes_key, iv = decrypt_request(body, private_key)
+        logger.info(f"Decrypted Flow Request: {dumps(decrypted_payload)}")
+    except Exception as e:
+        logger.error(f"Decryption failed: {e}")
+        return jsonify({"error": "Decryption failed"}), 401
+
+    # The Flow's token entry (and its prefetch) lives on the worker that issued it
+    if sync_app.worker_router:
+        forwarded = await forward_to_owner(sync_app.worker_router.owner_of_token(decrypted_payload.get("flow_token")),
+                                           "/flow", (jsonify({"error": "Timed out"}), 504))
+        if forwarded is not None:
+            return forwarded
+
+    action = decrypted_payload.get("action")
+
+    if action == "ping":
+        response_payload = {"data": {"status": "active"}}
+
+    elif action == "INIT":
+        counselors = await asyncio.to_thread(flow_handler.counselors_for_flow, decrypted_payload.get("flow_token"))
+        response_payload = build_init_response(counselors)
+
+    elif action == "data_exchange":
+        response_payload = await asyncio.to_thread(flow_screens.respond, decrypted_payload)
+
+    else:
+        logger.warning(f"Unknown Flow Action: {action}")
+        return jsonify({"error": "Unknown action"}), 400
+
+    logger.info(f"Flow Response Payload: {dumps(response_payload)}")
+    try:
+        encrypted_b64 = encrypt_response(response_payload, aes_key, iv)
+        return Response(encrypted_b64, status=200, mimetype='text/plain')
+    except Exception as e:
+        logger.error(f"Encryption failed: {e}")
+        return jsonify({"error": "Encryption failed"}), 500
+
+if __name__ == "__main__":
+    app.run(port=5000, debug=True)
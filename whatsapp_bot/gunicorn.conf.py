@@ -0,0 +1,37 @@
+import os
+import multiprocessing
+
+# Multi-process serving: gunicorn -c gunicorn.conf.py app:app
+# (or the async app: gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi_app:app)
+#
+# The app is imported once in the master (preload) with PREFORK=true, which loads
+# the counselor catalog and then drops every connection. After fork, each worker
+# builds its own Sheets/Razorpay clients, journal and background threads in
+# app.init_worker(), so workers share nothing but the copy-on-write catalog.
+#
+# Conversation state (user_sessions), per-phone dispatch queues, admission
+# buckets and Flow tokens stay in worker memory, and gunicorn hands a request
+# to any worker. With more than one worker each phone is owned by one of them
+# and the others forward its webhooks there (utils/worker_routing.py, loopback
+# ports ROUTE_PORT_BASE + slot). The waitlist is shared through a state file.
+
+os.environ.setdefault("PREFORK", "true")
+os.environ.setdefault("WEB_CONCURRENCY", str(multiprocessing.cpu_count()))
+os.environ.setdefault("WAITLIST_STATE_PATH", "waitlist_state.json")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.environ["WEB_CONCURRENCY"])
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+preload_app = True
+timeout = 60
+
+def when_ready(server):
+    from utils.prefork import freeze_shared_state
+    freeze_shared_state()
+
+def post_fork(server, worker):
+    import importlib
+    # app:app, or asgi_app:app with -k uvicorn.workers.UvicornWorker (both export init_worker)
+    module = importlib.import_module(server.app.app_uri.split(":")[0])
+    # -w on the command line overrides `workers` above
+    module.init_worker(workers=server.cfg.workers)
@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services.sheets import GoogleSheetsService
+from services.offline import OfflineGoogleSheetsService
+from utils import analytics
+from utils.flow_handler import BOOKING_AMOUNT_PAISE
+
+# Booking analytics from the command line.
+#   python booking_report.py --start 2024-10-01 --end 2024-10-31 --period week
+#   python booking_report.py --json > report.json
+
+def print_tables(values, calendar, counselor_ids, start, end, period, price_rupees):
+    frame = analytics.load_bookings_frame(values)
+    print(f"\n=== Utilization per counselor per {period} ({start} .. {end}) ===")
+    print(analytics.utilization(frame, calendar, counselor_ids, start, end, period).to_string(index=False))
+
+    conv = analytics.conversion(frame)
+    print(f"\n=== Hold -> payment conversion: {conv['paid']}/{conv['holds']} = {conv['conversion']:.1%} ===")
+    print(conv['per_counselor'].to_string(index=False))
+
+    print("\n=== Reschedule rates ===")
+    print(analytics.reschedule_rates(frame).to_string(index=False))
+
+    print(f"\n=== Revenue per {period} (₹) ===")
+    print(analytics.revenue(frame, price_rupees, period).to_string(index=False))
+
+    heatmaps = analytics.peak_hours(frame)
+    print("\n=== Holds created (weekday x hour) ===")
+    print(heatmaps['created'].to_string())
+    print("\n=== Paid appointment slots (weekday x hour) ===")
+    print(heatmaps['slots'].to_string())
+
+def main():
+    default_start, default_end = analytics.default_range()
+    parser = argparse.ArgumentParser(description="Counselor utilization, conversion and revenue report")
+    parser.add_argument("--start", default=str(default_start))
+    parser.add_argument("--end", default=str(default_end))
+    parser.add_argument("--period", choices=["day", "week"], default="week")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    parser.add_argument("--offline", action="store_true", help="use the in-memory stand-in sheet")
+    args = parser.parse_args()
+
+    service = OfflineGoogleSheetsService() if args.offline else GoogleSheetsService()
+    if not service.connect():
+        print("❌ Connection Failed.")
+        sys.exit(1)
+
+    start = datetime.date.fromisoformat(args.start)
+    end = datetime.date.fromisoformat(args.end)
+    values = service.cache.values('Bookings')
+    calendar = service.get_slot_calendar()
+    counselor_ids = [c['id'] for c in service.get_active_counselors()]
+    price_rupees = BOOKING_AMOUNT_PAISE // 100
+
+    try:
+        if args.json:
+            report = analytics.build_report(values, calendar, counselor_ids, start, end, args.period, price_rupees)
+            print(json.dumps(report, indent=2, default=str))
+        else:
+            print_tables(values, calendar, counselor_ids, start, end, args.period, price_rupees)
+    except analytics.AnalyticsUnavailable as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services.sheets import GoogleSheetsService
+from services.offline import OfflineGoogleSheetsService
+from utils.bulk_io import BulkImporter, export_sheet
+
+# Bulk import/export of Counselors and Bookings (CSV or JSONL).
+#   python bulk_sheets.py import Counselors counselors.csv
+#   python bulk_sheets.py import Bookings history.jsonl --chunk-size 1000   # re-run to resume after a failure
+#   python bulk_sheets.py export Bookings bookings.csv
+# Invalid rows are written to <file>.rejects.jsonl and the import goes on.
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import/export of Counselors and Bookings")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("sheet", choices=["Counselors", "Bookings"])
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=500, help="rows per batched write")
+    parser.add_argument("--upsert", action="store_true", help="overwrite rows whose id/booking_id already exists")
+    parser.add_argument("--restart", action="store_true", help="ignore a saved checkpoint and start from the top")
+    parser.add_argument("--pause", type=float, default=1.0, help="seconds between chunk writes (write quota)")
+    parser.add_argument("--offline", action="store_true", help="use the in-memory stand-in sheet")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    service = OfflineGoogleSheetsService() if args.offline else GoogleSheetsService()
+    if not service.connect():
+        print("❌ Connection Failed.")
+        sys.exit(1)
+    service.cache.stop()
+
+    if args.command == "export":
+        count = export_sheet(service, args.sheet, args.path, args.format)
+        print(f"✅ Exported {count} {args.sheet} rows to {args.path}")
+        return
+
+    importer = BulkImporter(service, args.sheet, chunk_size=args.chunk_size, upsert=args.upsert,
+                            pause=0 if args.offline else args.pause)
+    stats = importer.run(args.path, args.format, resume=not args.restart)
+    print(json.dumps(stats, indent=2))
+    if stats["rejected"]:
+        print(f"⚠️ {stats['rejected']} rows rejected, see {args.path}.rejects.jsonl")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+import os
+import json
+import time
+import uuid
+import base64
+import random
+import argparse
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Synthetic load generator and webhook replay tool.
+#
+# Start the bot against the offline stand-ins first:
+#   OFFLINE_MODE=true OFFLINE_LATENCY_MS=150 gunicorn -c gunicorn.conf.py -w 4 app:app
+#
+# Then, from this directory:
+#   python load_test.py run --concurrency 50 --rate 20 --duration 60
+#   python load_test.py ramp --levels 10,25,50,100,200 --duration 30
+#   python load_test.py replay --file ../webhooks.jsonl --speeds 1,5,10
+#
+# Flow requests are encrypted with ../public.pem from generate_keys.py, so the
+# server must be running with the matching private.pem. They carry the flow_token
+# of the Flow message the server sent, read back from its /offline/ endpoints.
+
+SLOTS = ["09:00", "10:00", "11:00", "12:00", "14:00", "15:00", "16:00"]
+
+# --- REQUEST BUILDERS ---
+
+def _message_webhook(phone, message):
+    message = dict(message, **{
+        "from": phone,
+        "id": f"wamid.load-{uuid.uuid4().hex}",
+        "timestamp": str(int(time.time()))
+    })
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "LOAD_TEST",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "contacts": [{"profile": {"name": "Load Test"}, "wa_id": phone}],
+                    "messages": [message]
+                }
+            }]
+        }]
+    }
+
+def text(phone, body):
+    return _message_webhook(phone, {"type": "text", "text": {"body": body}})
+
+def button_reply(phone, button_id):
+    return _message_webhook(phone, {
+        "type": "interactive",
+        "interactive": {"type": "button_reply", "button_reply": {"id": button_id, "title": button_id}}
+    })
+
+def list_reply(phone, row_id):
+    return _message_webhook(phone, {
+        "type": "interactive",
+        "interactive": {"type": "list_reply", "list_reply": {"id": row_id, "title": row_id}}
+    })
+
+def flow_reply(phone, response):
+    return _message_webhook(phone, {
+        "type": "interactive",
+        "interactive": {"type": "nfm_reply", "nfm_reply": {"response_json": json.dumps(response), "name": "flow"}}
+    })
+
+def payment_paid(phone, booking_id):
+    return {
+        "event": "payment_link.paid",
+        "payload": {"payment_link": {"entity": {
+            "id": f"plink_{uuid.uuid4().hex[:14]}",
+            "notes": {"booking_id": booking_id},
+            "customer": {"contact": phone}
+        }}}
+    }
+
+class FlowCrypto:
+    """Encrypts Flow requests the way Meta does, against our public key."""
+
+    def __init__(self, public_key_path):
+        with open(public_key_path, "rb") as f:
+            self.public_key = serialization.load_pem_public_key(f.read())
+
+    def encrypt(self, payload):
+        aes_key = AESGCM.generate_key(bit_length=128)
+        iv = os.urandom(16)
+        encrypted = AESGCM(aes_key).encrypt(iv, json.dumps(payload).encode("utf-8"), None)
+        encrypted_key = self.public_key.encrypt(
+            aes_key,
+            padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+        )
+        body = {
+            "encrypted_flow_data": base64.b64encode(encrypted).decode("utf-8"),
+            "encrypted_aes_key": base64.b64encode(encrypted_key).decode("utf-8"),
+            "initial_vector": base64.b64encode(iv).decode("utf-8")
+        }
+        return body, aes_key, iv
+
+    @staticmethod
+    def decrypt_response(text_body, aes_key, iv):
+        flipped_iv = bytes(b ^ 0xFF for b in iv)
+        return json.loads(AESGCM(aes_key).decrypt(flipped_iv, base64.b64decode(text_body), None))
+
+# --- CONVERSATION SCRIPTS ---
+
+def booking_conversation(phone):
+    """Hi -> Book -> Flow INIT -> date screen -> slot screen -> Flow reply -> payment."""
+    counsellor = random.choice(["1", "2"])
+    date = str(datetime.date.today() + datetime.timedelta(days=random.randint(1, 3)))
+    slot = random.choice(SLOTS)
+    issued = {}
+
+    def flow_token(driver):
+        # The token of the Flow message "Book" sent (looked up on the offline server),
+        # so the Flow requests take the same warm path as a real user's
+        if "token" not in issued:
+            issued["token"] = driver.last_flow_token(phone) or f"load-{phone}"
+        return issued["token"]
+
+    return [
+        ("/webhook", text(phone, "hi")),
+        ("/webhook", button_reply(phone, "book_btn")),
+        ("/flow", lambda driver: {"action": "INIT", "flow_token": flow_token(driver), "version": "3.0"}),
+        ("/flow", lambda driver: {"action": "data_exchange", "flow_token": flow_token(driver), "version": "3.0",
+                                  "screen": "COUNSELLOR_SELECT", "data": {"counsellor": counsellor, "flow_version": "2"}}),
+        ("/flow", lambda driver: {"action": "data_exchange", "flow_token": flow_token(driver), "version": "3.0",
+                                  "screen": "DATE_SELECT", "data": {"counsellor": counsellor, "date": date}}),
+        ("/webhook", lambda driver: flow_reply(phone, {"counsellor": counsellor, "date": date, "slot": slot,
+                                                       "flow_token": flow_token(driver)})),
+        # Pays for the hold the Flow reply created (looked up on the offline server)
+        ("/payment-webhook", lambda driver: payment_paid(phone, driver.last_hold(phone))),
+    ]
+
+def reschedule_conversation(phone):
+    return [
+        ("/webhook", text(phone, "hi")),
+        ("/webhook", button_reply(phone, "reschedule_btn")),
+    ]
+
+def contact_conversation(phone):
+    return [
+        ("/webhook", text(phone, "hi")),
+        ("/webhook", button_reply(phone, "talk_btn")),
+    ]
+
+# Weighted mix of conversations
+SCRIPTS = [(booking_conversation, 0.7), (reschedule_conversation, 0.2), (contact_conversation, 0.1)]
+
+def pick_script():
+    r = random.random()
+    for script, weight in SCRIPTS:
+        if r < weight:
+            return script
+        r -= weight
+    return SCRIPTS[0][0]
+
+# --- STATS ---
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.finished = None
+
+    def add(self, route, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def all_latencies(self):
+        return sorted(l for values in self.latencies.values() for l in values)
+
+    @staticmethod
+    def percentile(sorted_values, pct):
+        if not sorted_values:
+            return 0.0
+        idx = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+        return sorted_values[idx]
+
+    def throughput(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return sum(len(v) for v in self.latencies.values()) / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        rows = []
+        for route in sorted(self.latencies):
+            values = sorted(self.latencies[route])
+            rows.append({
+                "route": route,
+                "count": len(values),
+                "errors": self.errors.get(route, 0),
+                "p50_ms": round(self.percentile(values, 50) * 1000, 1),
+                "p95_ms": round(self.percentile(values, 95) * 1000, 1),
+                "p99_ms": round(self.percentile(values, 99) * 1000, 1),
+                "max_ms": round(values[-1] * 1000, 1)
+            })
+        return rows
+
+    def print_report(self, title):
+        print(f"\n=== {title} ===")
+        print(f"{'route':<18}{'count':>8}{'errors':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for r in self.summary():
+            print(f"{r['route']:<18}{r['count']:>8}{r['errors']:>8}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+        print(f"throughput: {self.throughput():.1f} req/s")
+
+# --- DRIVER ---
+
+class LoadDriver:
+    def __init__(self, base_url, crypto=None, think_ms=0, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.crypto = crypto
+        self.think_ms = think_ms
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _offline_lookup(self, path, phone, field):
+        """`field` of an /offline/ lookup for `phone` (server must run with OFFLINE_MODE=true)."""
+        try:
+            response = self._session().get(f"{self.base_url}{path}", params={"phone": phone}, timeout=self.timeout)
+            return response.json().get(field) if response.status_code == 200 else None
+        except Exception:
+            return None
+
+    def last_hold(self, phone):
+        """Booking ID of the phone's latest hold."""
+        return self._offline_lookup("/offline/last-hold", phone, "booking_id")
+
+    def last_flow_token(self, phone):
+        """flow_token of the latest booking Flow sent to the phone."""
+        return self._offline_lookup("/offline/last-flow-token", phone, "flow_token")
+
+    def send(self, route, body, stats, encrypt=True):
+        session = self._session()
+        aes_key = iv = None
+        if route == "/flow" and encrypt:
+            if not self.crypto:
+                return
+            body, aes_key, iv = self.crypto.encrypt(body)
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = session.post(self.base_url + route, json=body, timeout=self.timeout)
+            ok = response.status_code == 200
+            if ok and aes_key:
+                FlowCrypto.decrypt_response(response.text, aes_key, iv)
+        except Exception:
+            ok = False
+        stats.add(route, time.perf_counter() - start, ok)
+
+    def run_conversation(self, stats):
+        phone = "99" + str(random.randint(10 ** 9, 10 ** 10 - 1))
+        for route, body in pick_script()(phone):
+            if callable(body):
+                body = body(self)
+            self.send(route, body, stats)
+            if self.think_ms:
+                time.sleep(random.uniform(0, self.think_ms) / 1000.0)
+
+    def run(self, concurrency, duration, rate=None):
+        """
+        rate=None: closed loop, every worker runs conversations back to back.
+        rate=N: open loop, conversations arrive as a Poisson process at N/s.
+        """
+        stats = Stats()
+        deadline = time.monotonic() + duration
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            if rate:
+                while time.monotonic() < deadline:
+                    pool.submit(self.run_conversation, stats)
+                    time.sleep(random.expovariate(rate))
+            else:
+                def worker():
+                    while time.monotonic() < deadline:
+                        self.run_conversation(stats)
+                for _ in range(concurrency):
+                    pool.submit(worker)
+        stats.finished = time.monotonic()
+        return stats
+
+def find_saturation(results, p99_limit_ms):
+    """First level where throughput stops scaling (<10% gain) or p99 exceeds the limit."""
+    previous = None
+    for level, stats in results:
+        p99_ms = Stats.percentile(stats.all_latencies(), 99) * 1000
+        if p99_ms > p99_limit_ms:
+            return level, f"p99 {p99_ms:.0f}ms > {p99_limit_ms}ms"
+        if previous and stats.throughput() < previous * 1.10:
+            return level, f"throughput flat ({stats.throughput():.1f} vs {previous:.1f} req/s)"
+        previous = stats.throughput()
+    return None, "not reached"
+
+# --- REPLAY ---
+
+def load_recording(path):
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    records.sort(key=lambda r: r["t"])
+    return records
+
+def replay(driver, records, speed, concurrency):
+    """Replay recorded bodies keeping their inter-arrival gaps, compressed by `speed`."""
+    stats = Stats()
+    if not records:
+        return stats, 0.0
+    t0 = records[0]["t"]
+    start = time.monotonic()
+    max_lag = 0.0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for r in records:
+            due = start + (r["t"] - t0) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+            # Recorded Flow bodies are already encrypted, post them verbatim
+            pool.submit(driver.send, r["path"], r["body"], stats, False)
+    stats.finished = time.monotonic()
+    return stats, max_lag
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator and webhook replay for the wellness bot")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--public-key", default="../public.pem")
+    parser.add_argument("--think-ms", type=int, default=0, help="max random pause between conversation steps")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="fixed concurrency / arrival rate")
+    run_p.add_argument("--concurrency", type=int, default=20)
+    run_p.add_argument("--rate", type=float, default=None, help="conversations per second (open loop)")
+    run_p.add_argument("--duration", type=int, default=30)
+
+    ramp_p = sub.add_parser("ramp", help="step concurrency to find the saturation point")
+    ramp_p.add_argument("--levels", default="5,10,25,50,100")
+    ramp_p.add_argument("--duration", type=int, default=20)
+    ramp_p.add_argument("--p99-limit-ms", type=float, default=2000)
+
+    replay_p = sub.add_parser("replay", help="replay recorded webhook bodies (WEBHOOK_RECORD_PATH)")
+    replay_p.add_argument("--file", required=True)
+    replay_p.add_argument("--speeds", default="1", help="comma separated speed-up factors, e.g. 1,5,10")
+    replay_p.add_argument("--concurrency", type=int, default=200)
+    replay_p.add_argument("--p99-limit-ms", type=float, default=2000)
+
+    args = parser.parse_args()
+
+    crypto = None
+    if os.path.exists(args.public_key):
+        crypto = FlowCrypto(args.public_key)
+    else:
+        print(f"⚠️ {args.public_key} not found, Flow steps are skipped. Run generate_keys.py first.")
+
+    if args.command == "run":
+        driver = LoadDriver(args.url, crypto, args.think_ms)
+        stats = driver.run(args.concurrency, args.duration, args.rate)
+        stats.print_report(f"concurrency={args.concurrency} rate={args.rate or 'closed-loop'}")
+
+    elif args.command == "ramp":
+        driver = LoadDriver(args.url, crypto, args.think_ms)
+        results = []
+        for level in [int(l) for l in args.levels.split(",")]:
+            stats = driver.run(level, args.duration)
+            stats.print_report(f"concurrency={level}")
+            results.append((level, stats))
+        level, reason = find_saturation(results, args.p99_limit_ms)
+        print(f"\nSaturation point: concurrency={level} ({reason})")
+
+    elif args.command == "replay":
+        driver = LoadDriver(args.url, crypto, args.think_ms)
+        records = load_recording(args.file)
+        results = []
+        for speed in [float(s) for s in args.speeds.split(",")]:
+            stats, max_lag = replay(driver, records, speed, args.concurrency)
+            stats.print_report(f"replay {len(records)} requests at {speed}x")
+            print(f"max scheduling lag: {max_lag * 1000:.0f}ms")
+            results.append((speed, stats))
+        speed, reason = find_saturation(results, args.p99_limit_ms)
+        print(f"\nSaturation point: speed={speed}x ({reason})")
+
+if __name__ == "__main__":
+    main()
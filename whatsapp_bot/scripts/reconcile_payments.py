@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services.sheets import GoogleSheetsService
+from services.razorpay_api import RazorpayAPI
+from services.offline import OfflineGoogleSheetsService, OfflineRazorpayAPI
+from services.razorpay_api import PAYMENT_LINK_EXPIRY_SECONDS
+from utils.payment_reconciliation import PaymentReconciler, RECONCILE_GRACE_SECONDS
+from utils.flow_handler import BOOKING_AMOUNT_PAISE
+
+# Mark bookings PAID whose payment_link.paid webhook never arrived.
+#   python reconcile_payments.py --dry-run
+#   python reconcile_payments.py
+#   python reconcile_payments.py --offline 5000     # against the local Razorpay stand-in
+
+def seed_offline(sheets, rz_api, holds, paid_share):
+    """
+    Create `holds` PENDING holds with payment links, within the window the
+    reconciler still checks; pay `paid_share` of them without a webhook.
+    """
+    now = datetime.datetime.now()
+    window_minutes = (PAYMENT_LINK_EXPIRY_SECONDS + RECONCILE_GRACE_SECONDS) // 60 - 1
+    paid = set()
+    for i in range(holds):
+        booking_id = f"{i:08x}"
+        created = now - datetime.timedelta(minutes=random.randint(0, window_minutes))
+        rz_api.create_payment_link(BOOKING_AMOUNT_PAISE, f"Booking {booking_id}", f"9100{i:06d}", booking_id,
+                                   created_at=created.timestamp())
+        sheets._create_booking_hold({
+            "booking_id": booking_id, "user_phone": f"9100{i:06d}", "counselor_id": str(i % 2 + 1),
+            "date": str(created.date()), "time_slot": "10:00", "timestamp": str(created)
+        })
+        if random.random() < paid_share:
+            rz_api.mark_paid(booking_id)
+            paid.add(booking_id)
+    return paid
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile open holds against Razorpay payment links")
+    parser.add_argument("--dry-run", action="store_true", help="report corrections without writing them")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--offline", type=int, metavar="HOLDS",
+                        help="seed HOLDS holds into the in-memory sheet and Razorpay stand-in first")
+    parser.add_argument("--paid-share", type=float, default=0.3, help="(offline) share of holds paid without a webhook")
+    args = parser.parse_args()
+
+    if args.offline:
+        sheets, rz_api = OfflineGoogleSheetsService(), OfflineRazorpayAPI()
+    else:
+        sheets, rz_api = GoogleSheetsService(), RazorpayAPI()
+        if not rz_api.client:
+            print("❌ RAZORPAY_KEY_ID / RAZORPAY_KEY_SECRET not set.")
+            sys.exit(1)
+    if not sheets.connect():
+        print("❌ Connection Failed.")
+        sys.exit(1)
+
+    expected = None
+    if args.offline:
+        sheets.cache.records('Bookings')
+        expected = seed_offline(sheets, rz_api, args.offline, args.paid_share)
+
+    result = PaymentReconciler(sheets, rz_api, page_size=args.page_size).run_once(dry_run=args.dry_run)
+    corrected = result.pop("corrected")
+    result["corrected_count"] = len(corrected)
+    print(json.dumps(result, indent=2))
+
+    if expected is not None:
+        missing = expected - set(corrected)
+        print(f"{'✅' if not missing else '❌'} {len(expected) - len(missing)}/{len(expected)} missed payments found")
+    else:
+        for booking_id in corrected:
+            print(f"  {booking_id} -> PAID")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gspread.exceptions import APIError
+from services.sheets import GoogleSheetsService, BOOKINGS_COLUMNS
+from services.offline import OfflineGoogleSheetsService
+from utils.booking_ids import new_booking_id
+
+# Sheets health and latency probe (replaces verify_db.py, verify_sheet_data.py, debug_counselors.py).
+#   python sheets_probe.py                          # health checks + latency at 1000 scratch rows
+#   python sheets_probe.py --rows 1000,5000,20000   # how latency grows with the sheet
+#   python sheets_probe.py --offline --offline-latency-ms 80
+# Latency is measured on a scratch worksheet shaped like Bookings, deleted afterwards (--keep to leave it).
+
+SCRATCH_TITLE = "_probe_scratch"
+SEED_CHUNK = 500
+BATCH_RANGES = 10
+
+# Google's per-user limits; the bot's service account is one user
+READ_QUOTA_PER_MIN = int(os.getenv("SHEETS_READ_QUOTA_PER_MIN", "60"))
+WRITE_QUOTA_PER_MIN = int(os.getenv("SHEETS_WRITE_QUOTA_PER_MIN", "60"))
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))]
+
+def synthetic_row(when):
+    return [new_booking_id(when.timestamp()), f"91{random.randint(10 ** 9, 10 ** 10 - 1)}", str(random.randint(1, 5)),
+            str(when.date()), f"{random.randint(9, 17):02d}:00", random.choice(['PENDING', 'PAID']), '',
+            str(when), 'ACTIVE', '']
+
+class Pacer:
+    """Spaces calls so the probe itself stays under the per-minute quotas."""
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.calls = {"read": 0, "write": 0}
+        self.throttled = 0
+        self._next = {"read": 0.0, "write": 0.0}
+        self._gap = {"read": 60.0 / READ_QUOTA_PER_MIN, "write": 60.0 / WRITE_QUOTA_PER_MIN}
+
+    def call(self, kind, fn, *args, **kwargs):
+        return self.timed(kind, fn, *args, **kwargs)[0]
+
+    def timed(self, kind, fn, *args, **kwargs):
+        """(result, seconds): only the successful call is timed, not pacing or 429 backoff."""
+        if self.enabled:
+            wait = self._next[kind] - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._next[kind] = time.monotonic() + self._gap[kind]
+        self.calls[kind] += 1
+        for attempt in range(4):
+            try:
+                started = time.perf_counter()
+                result = fn(*args, **kwargs)
+                return result, time.perf_counter() - started
+            except APIError as e:
+                if getattr(e, "code", None) != 429 or attempt == 3:
+                    raise
+                self.throttled += 1
+                time.sleep(2 ** attempt * 5)
+
+def open_scratch(spreadsheet, pacer):
+    try:
+        return pacer.call("read", spreadsheet.worksheet, SCRATCH_TITLE)
+    except Exception:
+        ws = pacer.call("write", spreadsheet.add_worksheet, title=SCRATCH_TITLE, rows=1000, cols=len(BOOKINGS_COLUMNS))
+        pacer.call("write", ws.append_row, BOOKINGS_COLUMNS)
+        return ws
+
+def grow_to(ws, rows, pacer, have):
+    """Append synthetic bookings until the scratch sheet has `rows` data rows."""
+    start = datetime.datetime.now() - datetime.timedelta(days=365)
+    while have < rows:
+        chunk = min(SEED_CHUNK, rows - have)
+        batch = [synthetic_row(start + datetime.timedelta(minutes=have + i)) for i in range(chunk)]
+        pacer.call("write", ws.append_rows, batch)
+        have += chunk
+    return have
+
+def measure(ws, spreadsheet, iterations, pacer):
+    """{op: [latency seconds]} for each probed operation."""
+    ids = pacer.call("read", ws.col_values, 1)
+    last_row = len(ids)
+    operations = {
+        "open": ("read", lambda: spreadsheet.worksheet(SCRATCH_TITLE)),
+        "get_all_values": ("read", ws.get_all_values),
+        "get_all_records": ("read", ws.get_all_records),
+        # Worst case: the newest booking, so the search walks the whole sheet
+        "find": ("read", lambda: ws.find(ids[-1], in_column=1)),
+        "row_values": ("read", lambda: ws.row_values(random.randint(2, last_row))),
+        "update_cell": ("write", lambda: ws.update_cell(random.randint(2, last_row), 6, random.choice(['PENDING', 'PAID']))),
+        "append_row": ("write", lambda: ws.append_row(synthetic_row(datetime.datetime.now()))),
+        "batch_update": ("write", lambda: ws.batch_update([
+            {'range': f'F{row}', 'values': [['PAID']]} for row in random.sample(range(2, last_row + 1), min(BATCH_RANGES, last_row - 1))
+        ])),
+    }
+    samples = {}
+    for name, (kind, fn) in operations.items():
+        samples[name] = []
+        for _ in range(iterations):
+            samples[name].append(pacer.timed(kind, fn)[1])
+    return samples, {name: kind for name, (kind, _) in operations.items()}
+
+def summarize(samples, kinds):
+    report = {}
+    for name, values in samples.items():
+        mean = sum(values) / len(values)
+        quota = READ_QUOTA_PER_MIN if kinds[name] == "read" else WRITE_QUOTA_PER_MIN
+        report[name] = {
+            "kind": kinds[name],
+            "p50_ms": round(percentile(values, 0.5) * 1000, 1),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+            "max_ms": round(max(values) * 1000, 1),
+            # Calls per minute one worker can make: bound by latency or by quota, whichever is lower
+            "max_per_min": round(min(quota, 60.0 / mean) if mean else quota, 1),
+        }
+    return report
+
+def health(sheets, pacer):
+    """Row counts per worksheet and the checks the old verify/debug scripts printed."""
+    spreadsheet = sheets.spreadsheet
+    rows = {}
+    for ws in pacer.call("read", spreadsheet.worksheets):
+        if ws.title != SCRATCH_TITLE:
+            rows[ws.title] = max(0, len(pacer.call("read", ws.col_values, 1)) - 1)
+
+    problems = []
+    header = pacer.call("read", spreadsheet.worksheet('Bookings').row_values, 1)
+    missing = [h for h in BOOKINGS_COLUMNS if h not in header]
+    if missing:
+        problems.append(f"Bookings is missing columns: {', '.join(missing)}")
+
+    counselors = pacer.call("read", spreadsheet.worksheet('Counselors').get_all_values)
+    for idx, r in enumerate(counselors[1:], start=2):
+        if len(r) < 5:
+            problems.append(f"Counselors row {idx} has {len(r)} columns, needs 5 (id, name, image_url, description, is_active)")
+        elif str(r[4]).strip().upper() not in ('TRUE', 'FALSE'):
+            problems.append(f"Counselors row {idx}: is_active is '{r[4]}', expected TRUE or FALSE")
+    active = sheets.get_active_counselors()
+    if not active:
+        problems.append("No active counselors: the booking Flow will show a placeholder")
+    return {"rows": rows, "active_counselors": len(active), "problems": problems}
+
+def print_report(result):
+    print(f"\nRow counts: {', '.join(f'{t}={n}' for t, n in result['health']['rows'].items())}")
+    print(f"Active counselors: {result['health']['active_counselors']}")
+    for problem in result['health']['problems']:
+        print(f"  ⚠️ {problem}")
+    for size, ops in result["latency"].items():
+        print(f"\nScratch sheet with {size} rows ({result['iterations']} iterations per op)")
+        print(f"  {'operation':<16}{'kind':<7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'max/min':>9}")
+        for name, s in ops.items():
+            print(f"  {name:<16}{s['kind']:<7}{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}{s['max_ms']:>9}{s['max_per_min']:>9}")
+    q = result["quota"]
+    print(f"\nQuota: {q['read_per_min']} reads/min, {q['write_per_min']} writes/min per user. "
+          f"Probe used {q['reads_used']} reads, {q['writes_used']} writes; {q['throttled']} throttled (429).")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Google Sheets latency and check the bot's worksheets")
+    parser.add_argument("--iterations", type=int, default=20, help="calls per operation and sheet size")
+    parser.add_argument("--rows", default="1000", help="comma-separated scratch sheet sizes, probed in increasing order")
+    parser.add_argument("--offline", action="store_true", help="probe the in-memory stand-in instead of Google")
+    parser.add_argument("--offline-latency-ms", type=float, help="(offline) simulated latency per call")
+    parser.add_argument("--no-pace", action="store_true", help="don't space calls to stay under quota")
+    parser.add_argument("--skip-latency", action="store_true", help="health checks only")
+    parser.add_argument("--keep", action="store_true", help="leave the scratch worksheet in place")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.offline_latency_ms is not None:
+        os.environ["OFFLINE_LATENCY_MS"] = str(args.offline_latency_ms)
+    sheets = OfflineGoogleSheetsService() if args.offline else GoogleSheetsService()
+    if not sheets.connect():
+        print("❌ Connection Failed.")
+        sys.exit(1)
+    # The probe counts its own calls; the cache's background polling would skew them
+    sheets.cache.stop()
+
+    pacer = Pacer(enabled=not (args.offline or args.no_pace))
+    result = {"iterations": args.iterations, "health": health(sheets, pacer), "latency": {}}
+
+    if not args.skip_latency:
+        ws = open_scratch(sheets.spreadsheet, pacer)
+        have = max(0, len(pacer.call("read", ws.col_values, 1)) - 1)
+        try:
+            for size in sorted(int(s) for s in args.rows.split(",")):
+                have = grow_to(ws, size, pacer, have)
+                samples, kinds = measure(ws, sheets.spreadsheet, args.iterations, pacer)
+                # append_row added rows while measuring
+                have += args.iterations
+                result["latency"][size] = summarize(samples, kinds)
+        finally:
+            if not args.keep:
+                pacer.call("write", sheets.spreadsheet.del_worksheet, ws)
+
+    result["quota"] = {
+        "read_per_min": READ_QUOTA_PER_MIN, "write_per_min": WRITE_QUOTA_PER_MIN,
+        "reads_used": pacer.calls["read"], "writes_used": pacer.calls["write"], "throttled": pacer.throttled
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+    sys.exit(1 if result["health"]["problems"] else 0)
+
+if __name__ == "__main__":
+    main()
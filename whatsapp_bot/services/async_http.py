@@ -0,0 +1,23 @@
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+# One AsyncClient per process, shared by every async service so connections
+# to graph.facebook.com and api.razorpay.com are pooled and kept alive.
+_client = None
+
+def get_async_client():
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+            timeout=httpx.Timeout(30.0)
+        )
+    return _client
+
+async def close_async_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
@@ -0,0 +1,27 @@
+import asyncio
+import functools
+import logging
+from services.sheets import GoogleSheetsService
+
+logger = logging.getLogger(__name__)
+
+class AsyncGoogleSheetsService:
+    """
+    Async facade over GoogleSheetsService, for the writes asgi_app.py makes on
+    the event loop (conversations run on the dispatcher's threads and call the
+    sync service directly). gspread has no async transport, so each call runs on
+    a worker thread. A semaphore bounds how many Sheets calls are in flight so a
+    burst of payment webhooks queues on the event loop instead of exhausting the
+    thread pool (and the Sheets quota).
+    """
+
+    def __init__(self, sheets_service: GoogleSheetsService, max_concurrency=16):
+        self.sync = sheets_service
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _call(self, method, *args, **kwargs):
+        async with self._semaphore:
+            return await asyncio.to_thread(functools.partial(method, *args, **kwargs))
+
+    async def update_booking_status(self, booking_id, status, razorpay_order_id=None):
+        return await self._call(self.sync.update_booking_status, booking_id, status, razorpay_order_id)
@@ -0,0 +1,41 @@
+import time
+import httpx
+import logging
+from services.whatsapp_api import WhatsAppAPI, GRAPH_TIMEOUT_SECONDS
+from services.async_http import get_async_client
+from utils import deadline
+
+logger = logging.getLogger(__name__)
+
+class AsyncWhatsAppAPI(WhatsAppAPI):
+    """
+    Async variant of WhatsAppAPI on the shared httpx client.
+    Only _send and post_body are overridden, so every send_* helper builds the
+    exact same payload as the sync class and returns an awaitable.
+    """
+
+    async def _send(self, to_phone, body, kind):
+        sent_at = time.time()
+        response = await self.post_body(body)
+        if self.tracker:
+            self.tracker.record_send(to_phone, kind, response, sent_at)
+        return response
+
+    async def post_body(self, body):
+        if not self.token or not self.phone_number_id:
+            logger.error("WhatsApp Credentials missing in .env")
+            return None
+
+        try:
+            response = await get_async_client().post(
+                self.base_url, headers=self.headers, content=body,
+                timeout=deadline.timeout("graph.send", GRAPH_TIMEOUT_SECONDS)
+            )
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to send WhatsApp message: {e}")
+            if isinstance(e, httpx.HTTPStatusError):
+                logger.error(f"Response Body: {e.response.text}")
+                logger.error(f"Request Payload: {body.decode('utf-8')}")
+            return None
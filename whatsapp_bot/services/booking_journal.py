@@ -0,0 +1,289 @@
+import os
+import time
+import logging
+import threading
+from utils.json_codec import dumps, loads, JSONDecodeError
+
+logger = logging.getLogger(__name__)
+
+class JournalEntryRejected(Exception):
+    """Raised by an apply function for an entry the store will never accept (e.g. no such booking)."""
+
+class BookingJournal:
+    """
+    Durable write-ahead journal for booking mutations.
+
+    submit() appends one JSON line and fsyncs it before returning, so the caller
+    can acknowledge the user as soon as the mutation is on local disk. A background
+    applier replays entries to the store strictly in order and records the last
+    applied sequence number in a checkpoint file. On restart, everything after the
+    checkpoint is replayed again (crash recovery); the apply function must therefore
+    be idempotent for entries it may have already applied.
+
+    An entry the apply function rejects (JournalEntryRejected) may depend on
+    another worker's journal, so it is moved aside to `<path>.parked` and the
+    entries behind it go on applying; later entries for the same booking are
+    parked behind it to keep their order. Parked entries are retried with
+    backoff and after `max_rejects` attempts moved to `<path>.deadletter`.
+    """
+
+    def __init__(self, path, apply_fn, retry_delay=2.0, max_retry_delay=60.0, compact_bytes=1024 * 1024,
+                 max_rejects=5):
+        self.path = path
+        self.checkpoint_path = path + ".checkpoint"
+        self.parked_path = path + ".parked"
+        self.deadletter_path = path + ".deadletter"
+        self.apply_fn = apply_fn
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.compact_bytes = compact_bytes
+        self.max_rejects = max_rejects
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._repair_tail()
+        self.applied_seq = self._read_checkpoint()
+        self.next_seq = max(self.applied_seq, self._last_journal_seq()) + 1
+        # Entries that were journaled but maybe not applied before the last shutdown
+        self.recovery_until = self.next_seq - 1
+        self.failures = 0
+        self.dead_lettered = 0
+        # Rejected entries waiting for a retry, in journal order; each has "rejects" and "retry_at"
+        self._parked = self._read_parked()
+        # Booking IDs of holds journaled but not applied yet (they aren't in the sheet)
+        self._pending_holds = {e["args"][0].get("booking_id") for e in self.pending_entries()
+                               if e["op"] == "create_booking_hold"}
+
+    # --- PERSISTENCE ---
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_checkpoint(self, seq):
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+        self.applied_seq = seq
+
+    def _read_parked(self):
+        try:
+            with open(self.parked_path, "r", encoding="utf-8") as f:
+                return [loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+        except JSONDecodeError as e:
+            logger.error(f"Ignoring unreadable {self.parked_path}: {e}")
+            return []
+
+    def _write_parked(self):
+        tmp = self.parked_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self._parked:
+                f.write(dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.parked_path)
+
+    def _repair_tail(self):
+        """Cut a torn final line (crash mid-append) so the next entry starts on a line of its own."""
+        try:
+            with open(self.path, "rb+") as f:
+                data = f.read()
+                if not data or data.endswith(b"\n"):
+                    return
+                f.truncate(data.rfind(b"\n") + 1)
+                f.flush()
+                os.fsync(f.fileno())
+        except FileNotFoundError:
+            return
+        logger.warning("Dropped a truncated journal entry (never acknowledged)")
+
+    def _read_entries(self):
+        entries = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        entries.append(loads(line))
+                    except JSONDecodeError:
+                        # Only the final line can be torn, and _repair_tail cuts it at open
+                        logger.error("Ignoring unreadable journal entry")
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _last_journal_seq(self):
+        entries = self._read_entries()
+        return entries[-1]["seq"] if entries else 0
+
+    def pending_entries(self):
+        # An entry parked just before a crash is also still after the checkpoint
+        parked = {e["seq"] for e in self._parked}
+        return [e for e in self._read_entries() if e["seq"] > self.applied_seq and e["seq"] not in parked]
+
+    def has_pending_hold(self, booking_id):
+        return booking_id in self._pending_holds
+
+    # --- WRITE PATH ---
+
+    def submit(self, op, *args):
+        """Durably record a mutation. Returns once it is fsync'd; applied later in order."""
+        with self._lock:
+            entry = {"seq": self.next_seq, "ts": time.time(), "op": op, "args": list(args)}
+            with open(self.path, "ab") as f:
+                start = f.tell()
+                try:
+                    f.write((dumps(entry) + "\n").encode("utf-8"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                except OSError:
+                    # Don't leave a partial line for the next entry to be appended onto
+                    f.truncate(start)
+                    raise
+            self.next_seq += 1
+            if op == "create_booking_hold":
+                self._pending_holds.add(args[0].get("booking_id"))
+        self._wakeup.set()
+        return True
+
+    # --- APPLIER ---
+
+    def apply_pending(self):
+        """Retry due parked entries, then apply every pending entry in order. Stops at the first store error."""
+        applied, ok = self._retry_parked()
+        if not ok:
+            return applied, False
+        for entry in self.pending_entries():
+            recovering = entry["seq"] <= self.recovery_until
+            try:
+                if self._parked_bookings() & self._booking_ids(entry):
+                    raise JournalEntryRejected("an earlier entry for this booking is parked")
+                self.apply_fn(entry["op"], entry["args"], recovering)
+            except JournalEntryRejected as e:
+                self._park(entry, e)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Journal apply failed at seq {entry['seq']} ({entry['op']}): {e}")
+                return applied, False
+            else:
+                applied += 1
+            self._write_checkpoint(entry["seq"])
+            if entry["op"] == "create_booking_hold":
+                self._pending_holds.discard(entry["args"][0].get("booking_id"))
+        self._maybe_compact()
+        return applied, True
+
+    @staticmethod
+    def _booking_ids(entry):
+        if entry["op"] == "batch_update_booking_status":
+            return {str(u[0]) for u in entry["args"][0]}
+        if entry["op"] == "create_booking_hold":
+            return {str(entry["args"][0].get("booking_id"))}
+        return {str(entry["args"][0])} if entry["args"] else set()
+
+    def _parked_bookings(self):
+        return set().union(*(self._booking_ids(e) for e in self._parked))
+
+    def _park(self, entry, error):
+        """Move a rejected entry aside (durably, before the checkpoint passes it)."""
+        self._parked.append(dict(entry, rejects=1, retry_at=time.time() + self.retry_delay))
+        self._write_parked()
+        logger.warning(f"Journal entry {entry['seq']} ({entry['op']}) rejected (1/{self.max_rejects}), parked: {error}")
+
+    def _retry_parked(self):
+        """Retry parked entries whose backoff is up, oldest first. Returns (applied, ok)."""
+        applied = 0
+        now = time.time()
+        blocked = set()
+        for entry in list(self._parked):
+            ids = self._booking_ids(entry)
+            # Keep per-booking order: nothing passes an older parked entry for the same booking
+            if ids & blocked or entry["retry_at"] > now:
+                blocked |= ids
+                continue
+            args = (entry["op"], entry["args"], entry["seq"] <= self.recovery_until)
+            try:
+                self.apply_fn(*args)
+            except JournalEntryRejected as e:
+                entry["rejects"] += 1
+                if entry["rejects"] >= self.max_rejects:
+                    self._parked.remove(entry)
+                    self._dead_letter(entry, e)
+                else:
+                    entry["retry_at"] = now + min(self.retry_delay * 2 ** entry["rejects"], self.max_retry_delay)
+                    blocked |= ids
+                self._write_parked()
+                continue
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Journal apply failed at parked seq {entry['seq']} ({entry['op']}): {e}")
+                return applied, False
+            self._parked.remove(entry)
+            self._write_parked()
+            applied += 1
+        return applied, True
+
+    def _dead_letter(self, entry, error):
+        entry = {k: v for k, v in entry.items() if k != "retry_at"}
+        with open(self.deadletter_path, "a", encoding="utf-8") as f:
+            f.write(dumps(dict(entry, error=str(error))) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.dead_lettered += 1
+        logger.error(f"Journal entry {entry['seq']} ({entry['op']}) moved to {self.deadletter_path}: {error}")
+
+    def _maybe_compact(self):
+        """Truncate the journal once everything in it has been applied."""
+        try:
+            if os.path.getsize(self.path) < self.compact_bytes:
+                return
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self.next_seq - 1 != self.applied_seq:
+                return
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.flush()
+                os.fsync(f.fileno())
+        logger.info(f"Journal compacted at seq {self.applied_seq}")
+
+    def _loop(self):
+        delay = self.retry_delay
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            _, ok = self.apply_pending()
+            if ok:
+                delay = self.retry_delay
+                self._wakeup.wait(timeout=5)
+            else:
+                # Store is unhealthy: back off, preserving order
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name="booking-journal", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def lag(self):
+        """Number of journaled mutations not yet applied to the store (parked ones included)."""
+        return self.next_seq - 1 - self.applied_seq + len(self._parked)
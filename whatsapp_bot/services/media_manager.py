@@ -0,0 +1,177 @@
+import os
+import fcntl
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.whatsapp_api import WhatsAppAPI
+from utils.json_codec import dumps, loads, JSONDecodeError
+
+logger = logging.getLogger(__name__)
+
+# Uploaded WhatsApp media IDs stay valid for 30 days
+MEDIA_TTL_SECONDS = 29 * 24 * 3600
+# Re-upload this long before an ID expires
+REFRESH_MARGIN_SECONDS = 2 * 24 * 3600
+
+# Default for MediaManager(path=...): MEDIA_CACHE_PATH
+_ENV_PATH = object()
+
+class MediaManager:
+    """
+    Uploads images (counselor photos, header media) to the Graph media endpoint
+    once and hands out media IDs, so Meta doesn't fetch our URLs on every send.
+
+    Entries are keyed by content hash, so several URLs serving the same bytes
+    share one upload. The cache is persisted to `path` and IDs are re-uploaded
+    in the background before they expire. media_id_for() never blocks a send: on
+    a miss it queues the upload and returns None, and the caller falls back to
+    the link (or plain text) this once.
+
+    Several processes (gunicorn workers) can share `path`: saves merge with what
+    is on disk under a file lock, and an upload first checks whether another
+    process already saved that image. path=None keeps the cache in memory only.
+    """
+
+    def __init__(self, wa_api: WhatsAppAPI, path=_ENV_PATH, ttl=MEDIA_TTL_SECONDS, refresh_margin=REFRESH_MARGIN_SECONDS):
+        self.wa_api = wa_api
+        self.path = os.getenv("MEDIA_CACHE_PATH", "media_cache.json") if path is _ENV_PATH else path
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="media-upload")
+        self._stop = threading.Event()
+        self._thread = None
+        # url -> content hash; content hash -> {"media_id", "uploaded_at", "mime_type", "url"}
+        self.by_url, self.by_hash = self._load()
+
+    # --- PERSISTENCE ---
+
+    def _load(self):
+        if not self.path:
+            return {}, {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = loads(f.read())
+            return data.get("by_url", {}), data.get("by_hash", {})
+        except (FileNotFoundError, JSONDecodeError):
+            return {}, {}
+
+    def _merge(self, by_url, by_hash):
+        """Adopt entries another process saved: unknown URLs, and newer uploads of the same bytes."""
+        with self._lock:
+            for url, digest in by_url.items():
+                self.by_url.setdefault(url, digest)
+            for digest, entry in by_hash.items():
+                mine = self.by_hash.get(digest)
+                if mine is None or entry["uploaded_at"] > mine["uploaded_at"]:
+                    self.by_hash[digest] = entry
+
+    def _reload(self):
+        if self.path:
+            self._merge(*self._load())
+
+    def _save(self):
+        if not self.path:
+            return
+        with open(f"{self.path}.lock", "a+") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Merge first so one worker's save doesn't drop another's uploads
+            self._merge(*self._load())
+            with self._lock:
+                data = dumps({"by_url": self.by_url, "by_hash": self.by_hash})
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+
+    # --- LOOKUP ---
+
+    def _fresh(self, entry, now=None):
+        return entry is not None and (now or time.time()) - entry["uploaded_at"] < self.ttl
+
+    def media_id_for(self, url):
+        """Cached, unexpired media ID for `url`, or None (an upload is then queued)."""
+        if not url:
+            return None
+        with self._lock:
+            entry = self.by_hash.get(self.by_url.get(url))
+        if self._fresh(entry):
+            return entry["media_id"]
+        self.ensure_uploaded(url)
+        return None
+
+    # --- UPLOADS ---
+
+    def ensure_uploaded(self, url):
+        with self._lock:
+            if url in self._pending:
+                return
+            self._pending.add(url)
+        self._executor.submit(self._upload, url)
+
+    def _upload(self, url, force=False):
+        try:
+            if not force:
+                # Another process may have uploaded it since we loaded the cache
+                self._reload()
+                with self._lock:
+                    entry = self.by_hash.get(self.by_url.get(url))
+                if self._fresh(entry):
+                    return entry["media_id"]
+            content, mime_type = self.wa_api.download_media(url)
+            digest = hashlib.sha256(content).hexdigest()
+            with self._lock:
+                self.by_url[url] = digest
+                entry = self.by_hash.get(digest)
+            if not force and self._fresh(entry):
+                # Same bytes already uploaded under another URL
+                self._save()
+                return entry["media_id"]
+
+            media_id = self.wa_api.upload_media(content, mime_type, filename=os.path.basename(url) or "media")
+            if not media_id:
+                return None
+            with self._lock:
+                self.by_hash[digest] = {"media_id": media_id, "uploaded_at": time.time(), "mime_type": mime_type, "url": url}
+            self._save()
+            logger.info(f"Uploaded media for {url} -> {media_id}")
+            return media_id
+        except Exception as e:
+            logger.error(f"Media upload for {url} failed: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+    def refresh_expiring(self):
+        """Re-upload every cached image whose ID expires within the refresh margin."""
+        cutoff = time.time() - (self.ttl - self.refresh_margin)
+        self._reload()
+        with self._lock:
+            urls = [e["url"] for e in self.by_hash.values() if e["uploaded_at"] < cutoff]
+        for url in urls:
+            self._upload(url, force=True)
+        return len(urls)
+
+    def _loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh_expiring()
+            except Exception as e:
+                logger.error(f"Media refresh failed: {e}")
+
+    def start(self, prewarm_urls=(), interval=3600):
+        """Upload `prewarm_urls` now (background) and keep IDs refreshed."""
+        for url in prewarm_urls:
+            # Queues an upload for anything not cached yet
+            self.media_id_for(url)
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name="media-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
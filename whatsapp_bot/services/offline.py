@@ -0,0 +1,268 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import a1_to_rowcol
+from services.sheets import GoogleSheetsService
+from services.whatsapp_api import WhatsAppAPI
+from services.async_whatsapp_api import AsyncWhatsAppAPI
+from services.razorpay_api import RazorpayAPI
+
+logger = logging.getLogger(__name__)
+
+# Offline stand-ins for Google Sheets, the Graph API and Razorpay. Enabled in app.py (and asgi_app.py) with
+# OFFLINE_MODE=true so the bot can be load-tested and probed without touching
+# the real spreadsheet or messaging real users.
+# OFFLINE_LATENCY_MS adds a fixed delay to every simulated API call.
+
+def _simulated_latency():
+    return float(os.getenv("OFFLINE_LATENCY_MS", "0")) / 1000.0
+
+class OfflineCell:
+    def __init__(self, row, col, value):
+        self.row = row
+        self.col = col
+        self.value = value
+
+class OfflineWorksheet:
+    """In-memory worksheet implementing the subset of gspread.Worksheet the bot uses. Values are kept as strings."""
+
+    def __init__(self, title, rows=None, latency=None):
+        self.title = title
+        self.id = abs(hash(title)) % (10 ** 9)
+        self._rows = [list(map(str, r)) for r in (rows or [])]
+        self._lock = threading.Lock()
+        self.latency = _simulated_latency() if latency is None else latency
+        self.call_count = 0
+
+    def _call(self):
+        self.call_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def row_count(self):
+        return len(self._rows)
+
+    def get_all_values(self):
+        self._call()
+        with self._lock:
+            return [list(r) for r in self._rows]
+
+    def get_all_records(self):
+        self._call()
+        with self._lock:
+            if not self._rows:
+                return []
+            headers = self._rows[0]
+            records = []
+            for r in self._rows[1:]:
+                padded = r + [''] * (len(headers) - len(r))
+                records.append(dict(zip(headers, padded)))
+            return records
+
+    def row_values(self, row):
+        self._call()
+        with self._lock:
+            if row - 1 < len(self._rows):
+                return list(self._rows[row - 1])
+            return []
+
+    def col_values(self, col):
+        self._call()
+        with self._lock:
+            return [r[col - 1] if col - 1 < len(r) else '' for r in self._rows]
+
+    def find(self, query, in_column=None):
+        self._call()
+        query = str(query)
+        with self._lock:
+            for r_idx, r in enumerate(self._rows):
+                for c_idx, value in enumerate(r):
+                    if value == query and in_column in (None, c_idx + 1):
+                        return OfflineCell(r_idx + 1, c_idx + 1, value)
+        return None
+
+    def update_cell(self, row, col, value):
+        self._call()
+        with self._lock:
+            self._set(row, col, value)
+
+    def _set(self, row, col, value):
+        while len(self._rows) < row:
+            self._rows.append([])
+        r = self._rows[row - 1]
+        while len(r) < col:
+            r.append('')
+        r[col - 1] = str(value)
+
+    def batch_update(self, data, **kwargs):
+        self._call()
+        with self._lock:
+            for item in data:
+                row, col = a1_to_rowcol(item['range'].split(':')[0])
+                for r_off, values in enumerate(item['values']):
+                    for c_off, value in enumerate(values):
+                        self._set(row + r_off, col + c_off, value)
+
+    def append_row(self, values, **kwargs):
+        self._call()
+        with self._lock:
+            self._rows.append(['' if v is None else str(v) for v in values])
+
+    def add_rows(self, rows):
+        # The in-memory grid grows on write
+        self._call()
+
+    def append_rows(self, rows, **kwargs):
+        self._call()
+        with self._lock:
+            for values in rows:
+                self._rows.append(['' if v is None else str(v) for v in values])
+
+class OfflineSpreadsheet:
+    def __init__(self, title):
+        self.title = title
+        self.id = f"offline-{title}"
+        self._worksheets = {}
+
+    def worksheet(self, title):
+        try:
+            return self._worksheets[title]
+        except KeyError:
+            raise WorksheetNotFound(title)
+
+    def worksheets(self):
+        return list(self._worksheets.values())
+
+    def add_worksheet(self, title, rows=100, cols=10):
+        ws = OfflineWorksheet(title)
+        self._worksheets[title] = ws
+        return ws
+
+    def del_worksheet(self, worksheet):
+        self._worksheets.pop(worksheet.title, None)
+
+class OfflineGoogleSheetsService(GoogleSheetsService):
+    """GoogleSheetsService backed by an in-memory spreadsheet seeded by setup_schema()."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # phone -> booking_id of their latest hold, so load_test.py can pay for it
+        self.last_holds = {}
+
+    def create_booking_hold(self, booking_data):
+        self.last_holds[str(booking_data.get('user_phone'))] = booking_data.get('booking_id')
+        return super().create_booking_hold(booking_data)
+
+    def connect(self):
+        if self.spreadsheet is None:
+            self.spreadsheet = OfflineSpreadsheet(self.sheet_name)
+            self.setup_schema()
+            self.init_cache()
+        return True
+
+class OfflineWhatsAppAPI(WhatsAppAPI):
+    """WhatsAppAPI that accepts every message without calling Meta."""
+
+    def __init__(self):
+        super().__init__()
+        self.sent_count = 0
+        self.upload_count = 0
+        self.latency = _simulated_latency()
+        # phone -> flow_token of the latest booking Flow sent to them, so load_test.py can use it
+        self.last_flow_tokens = {}
+
+    def send_flow_message(self, to_phone, *args, flow_token=None, **kwargs):
+        if flow_token:
+            self.last_flow_tokens[str(to_phone)] = flow_token
+        return super().send_flow_message(to_phone, *args, flow_token=flow_token, **kwargs)
+
+    def upload_media(self, content, mime_type, filename="media"):
+        if self.latency:
+            time.sleep(self.latency)
+        self.upload_count += 1
+        return f"offline-media-{uuid.uuid4().hex[:12]}"
+
+    def download_media(self, url):
+        return f"offline-image:{url}".encode("utf-8"), "image/jpeg"
+
+    def post_body(self, body):
+        if self.latency:
+            time.sleep(self.latency)
+        self.sent_count += 1
+        return {
+            "messaging_product": "whatsapp",
+            "messages": [{"id": f"wamid.offline-{uuid.uuid4().hex}"}]
+        }
+
+class AsyncOfflineWhatsAppAPI(AsyncWhatsAppAPI):
+    """AsyncWhatsAppAPI that accepts every message without calling Meta."""
+
+    def __init__(self):
+        super().__init__()
+        self.sent_count = 0
+        self.latency = _simulated_latency()
+
+    async def post_body(self, body):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent_count += 1
+        return {
+            "messaging_product": "whatsapp",
+            "messages": [{"id": f"wamid.offline-{uuid.uuid4().hex}"}]
+        }
+
+class OfflineRazorpayAPI(RazorpayAPI):
+    """
+    RazorpayAPI backed by an in-memory list of payment links. mark_paid() flips a
+    link to paid without sending the webhook, which is how reconciliation is tested.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+        self.list_calls = 0
+        self.latency = _simulated_latency()
+        self._lock = threading.Lock()
+
+    def create_payment_link(self, amount_in_paise, description, customer_phone, reference_id, created_at=None):
+        payload = self.build_payment_link_payload(amount_in_paise, description, customer_phone, reference_id)
+        link_id = f"plink_{uuid.uuid4().hex[:14]}"
+        created_at = int(created_at or time.time())
+        link = {
+            "id": link_id,
+            "amount": payload["amount"],
+            "status": "created",
+            "created_at": created_at,
+            "expire_by": created_at + (payload["expire_by"] - int(time.time())),
+            "notes": payload["notes"],
+            "customer": payload["customer"],
+            "order_id": "",
+            "short_url": f"https://rzp.offline/{link_id}"
+        }
+        with self._lock:
+            self.links.append(link)
+        return link["short_url"]
+
+    def mark_paid(self, booking_id):
+        with self._lock:
+            for link in self.links:
+                if link["notes"].get("booking_id") == booking_id:
+                    link["status"] = "paid"
+                    link["order_id"] = f"order_{uuid.uuid4().hex[:14]}"
+                    return link
+        return None
+
+    def list_payment_links(self, from_ts=None, to_ts=None, count=100, skip=0):
+        if self.latency:
+            time.sleep(self.latency)
+        self.list_calls += 1
+        with self._lock:
+            matching = [l for l in self.links
+                        if (not from_ts or l["created_at"] >= from_ts) and (not to_ts or l["created_at"] <= to_ts)]
+        matching.sort(key=lambda l: l["created_at"], reverse=True)
+        return [dict(l) for l in matching[skip:skip + count]]
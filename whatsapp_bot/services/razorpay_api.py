@@ -2,9 +2,17 @@ import razorpay
 import os
 import logging
 import time
+from utils import deadline
 
 logger = logging.getLogger(__name__)
 
+# Upper bound per Razorpay call; inside a request the deadline cuts it shorter
+RAZORPAY_TIMEOUT_SECONDS = float(os.getenv("RAZORPAY_TIMEOUT_SECONDS", "10"))
+
+# Payment links stop accepting payments this long after creation (sent as expire_by).
+# Razorpay rejects an expire_by less than 15 minutes ahead, so allow a minute of clock skew.
+PAYMENT_LINK_EXPIRY_SECONDS = 16 * 60
+
 class RazorpayAPI:
     def __init__(self):
         self.key_id = os.getenv("RAZORPAY_KEY_ID")
@@ -14,38 +22,50 @@ class RazorpayAPI:
         if self.key_id and self.key_secret:
             self.client = razorpay.Client(auth=(self.key_id, self.key_secret))
 
+    def build_payment_link_payload(self, amount_in_paise, description, customer_phone, reference_id):
+        expire_by = int(time.time()) + PAYMENT_LINK_EXPIRY_SECONDS
+        
+        return {
+            "amount": amount_in_paise,
+            "currency": "INR",
+            "accept_partial": False,
+            "description": description,
+            "customer": {
+                "contact": customer_phone,
+            },
+            "notify": {
+                "sms": True,
+                "email": False
+            },
+            "reminder_enable": True,
+            "expire_by": expire_by,
+            "notes": {
+                "booking_id": reference_id
+            },
+            "callback_url": "https://google.com", # Should be our webhook/callback
+            "callback_method": "get"
+        }
+
     def create_payment_link(self, amount_in_paise, description, customer_phone, reference_id):
         if not self.client:
             logger.error("Razorpay Client not initialized. Check credentials.")
             return f"https://mock-payment-link.com/{reference_id}" # Fallback for demo
 
         try:
-            # Expire in 15 mins
-            expire_by = int(time.time()) + (15 * 60)
-            
-            payload = {
-                "amount": amount_in_paise,
-                "currency": "INR",
-                "accept_partial": False,
-                "description": description,
-                "customer": {
-                    "contact": customer_phone,
-                },
-                "notify": {
-                    "sms": True,
-                    "email": False
-                },
-                "reminder_enable": True,
-                "notes": {
-                    "booking_id": reference_id
-                },
-                "callback_url": "https://google.com", # Should be our webhook/callback
-                "callback_method": "get"
-            }
-            
-            payment_link = self.client.payment_link.create(payload)
+            payload = self.build_payment_link_payload(amount_in_paise, description, customer_phone, reference_id)
+            payment_link = self.client.payment_link.create(payload, timeout=deadline.timeout("razorpay.create_link", RAZORPAY_TIMEOUT_SECONDS))
             return payment_link.get('short_url')
             
         except Exception as e:
             logger.error(f"Razorpay Error: {e}")
             return None
+
+    def list_payment_links(self, from_ts=None, to_ts=None, count=100, skip=0):
+        """One page of payment links (newest first) created in [from_ts, to_ts] (unix seconds)."""
+        params = {"count": count, "skip": skip}
+        if from_ts:
+            params["from"] = int(from_ts)
+        if to_ts:
+            params["to"] = int(to_ts)
+        response = self.client.payment_link.all(params, timeout=deadline.timeout("razorpay.list_links", RAZORPAY_TIMEOUT_SECONDS))
+        return response.get('payment_links', response.get('items', []))
@@ -0,0 +1,323 @@
+import time
+import hashlib
+import itertools
+import logging
+import threading
+from services.sheet_snapshot import save_snapshot, load_snapshot
+
+logger = logging.getLogger(__name__)
+
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files/{}"
+
+# Shared by every CachedWorksheet, so a version is never reused, even by a reloaded sheet
+_versions = itertools.count(1)
+
+def checksum(values):
+    digest = hashlib.blake2b(digest_size=16)
+    for row in values:
+        digest.update("\x1f".join(row).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+def build_records(values):
+    """Same shape as gspread's get_all_records(), but values stay as strings."""
+    if not values:
+        return []
+    headers = values[0]
+    width = len(headers)
+    return [dict(zip(headers, row + [''] * (width - len(row)))) for row in values[1:]]
+
+class CachedWorksheet:
+    def __init__(self, title, values, digest=None):
+        self.title = title
+        self.values = values
+        self.checksum = digest or checksum(values)
+        self.loaded_at = time.time()
+        # Changes on reload and on every local write (keys derived caches like analytics)
+        self.version = next(_versions)
+        self._records = None
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._records = build_records(self.values)
+        return self._records
+
+    # Local writes patch the cache in place. The checksum is left as loaded, so
+    # the next poll sees the sheet differ and notifies listeners once.
+    def append(self, row):
+        self.version = next(_versions)
+        self.values.append(row)
+        if self._records is not None and self.values:
+            self._records.append(build_records([self.values[0], row])[0])
+
+    def set_cell(self, row, col, value):
+        self.version = next(_versions)
+        new_row = list(self.values[row - 1])
+        while len(new_row) < col:
+            new_row.append('')
+        new_row[col - 1] = value
+        self.values[row - 1] = new_row
+        if self._records is not None and row >= 2:
+            self._records[row - 2] = build_records([self.values[0], new_row])[0]
+
+class SheetCache:
+    """
+    Read-through cache of whole worksheets with cheap change detection.
+
+    Reads are served from memory. A background poller asks Drive for the file's
+    version (one small metadata call) every `poll_interval` seconds. Only when it
+    changes are the cached worksheets re-read, all in one values batchGet, and only
+    worksheets whose checksum differs are swapped in and reported to listeners.
+    Local writes made while that read is in flight are replayed onto the reloaded
+    worksheets, since the read may have been served before they reached the sheet.
+    If the revision can't be read (e.g. the offline stand-in), every poll falls
+    back to the batch read + checksum comparison.
+
+    With `snapshot_path` set, the cache is seeded from a local snapshot at startup
+    and the first poll runs immediately to catch up with edits made since; the
+    snapshot is rewritten at most every `snapshot_interval` seconds while dirty.
+    """
+
+    def __init__(self, spreadsheet, client=None, poll_interval=5.0, snapshot_path=None, snapshot_interval=60.0):
+        self.spreadsheet = spreadsheet
+        self.client = client
+        self.poll_interval = poll_interval
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.revision = None
+        self.seeded = False
+        self.api_calls = 0
+        self._dirty = False
+        self._saved_at = 0.0
+        self._sheets = {}
+        self._listeners = []
+        # (title, row, col, value) local writes since the in-flight reload started (col None: append)
+        self._writes_during_reload = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- READS ---
+
+    def get(self, title):
+        cached = self._sheets.get(title)
+        if cached is None:
+            cached = self._load([title]).get(title)
+        return cached
+
+    def values(self, title):
+        return self.get(title).values
+
+    def records(self, title):
+        return self.get(title).records
+
+    def find_row(self, title, value, col=1):
+        """1-based row number of the first row whose `col` equals value, or None."""
+        value = str(value)
+        for idx, row in enumerate(self.values(title)):
+            if len(row) >= col and row[col - 1] == value:
+                return idx + 1
+        return None
+
+    def _fetch(self, titles):
+        self.api_calls += 1
+        if hasattr(self.spreadsheet, "values_batch_get"):
+            ranges = [f"'{t}'" for t in titles]
+            response = self.spreadsheet.values_batch_get(ranges)
+            return {
+                title: [[str(v) for v in row] for row in vr.get("values", [])]
+                for title, vr in zip(titles, response.get("valueRanges", []))
+            }
+        return {t: self.spreadsheet.worksheet(t).get_all_values() for t in titles}
+
+    def _load(self, titles):
+        fetched = self._fetch(titles)
+        with self._lock:
+            for title, values in fetched.items():
+                self._sheets[title] = CachedWorksheet(title, values)
+            return {t: self._sheets[t] for t in fetched}
+
+    # --- LOCAL WRITES (read-your-writes) ---
+
+    def apply_append(self, title, row):
+        with self._lock:
+            cached = self._sheets.get(title)
+            if cached:
+                row = ['' if v is None else str(v) for v in row]
+                cached.append(row)
+                self._dirty = True
+                if self._writes_during_reload is not None:
+                    self._writes_during_reload.append((title, row, None, None))
+
+    def apply_update(self, title, row, col, value):
+        with self._lock:
+            cached = self._sheets.get(title)
+            if cached and row - 1 < len(cached.values):
+                value = '' if value is None else str(value)
+                cached.set_cell(row, col, value)
+                self._dirty = True
+                if self._writes_during_reload is not None:
+                    self._writes_during_reload.append((title, row, col, value))
+
+    def invalidate(self, title=None):
+        with self._lock:
+            if title is None:
+                self._sheets.clear()
+            else:
+                self._sheets.pop(title, None)
+
+    # --- CHANGE DETECTION ---
+
+    def add_listener(self, callback):
+        """callback(title) is called for every worksheet whose contents changed."""
+        self._listeners.append(callback)
+
+    def fetch_revision(self):
+        """Drive file version (bumps on every edit). None if it can't be read."""
+        if self.client is None:
+            return None
+        try:
+            request = getattr(self.client, "request", None) or self.client.http_client.request
+            response = request("get", DRIVE_FILES_URL.format(self.spreadsheet.id),
+                               params={"fields": "version,modifiedTime", "supportsAllDrives": True})
+            self.api_calls += 1
+            meta = response.json()
+            return meta.get("version") or meta.get("modifiedTime")
+        except Exception as e:
+            logger.warning(f"Could not read spreadsheet revision: {e}")
+            return None
+
+    def check_for_changes(self):
+        """Reload the worksheets that changed since the last check. Returns their titles."""
+        revision = self.fetch_revision()
+        if revision is not None and revision == self.revision:
+            return []
+        titles = list(self._sheets.keys())
+        if not titles:
+            self.revision = revision
+            return []
+        with self._lock:
+            self._writes_during_reload = []
+        try:
+            fetched = self._fetch(titles)
+        except Exception:
+            with self._lock:
+                self._writes_during_reload = None
+            raise
+        changed = []
+        with self._lock:
+            writes, self._writes_during_reload = self._writes_during_reload, None
+            for title, values in fetched.items():
+                old = self._sheets.get(title)
+                new = CachedWorksheet(title, values)
+                if old is None or old.checksum != new.checksum:
+                    self._replay(new, [w for w in writes if w[0] == title])
+                    self._sheets[title] = new
+                    changed.append(title)
+            if changed:
+                self._dirty = True
+        self.revision = revision
+        for title in changed:
+            logger.info(f"Worksheet '{title}' changed, reloaded")
+            for callback in self._listeners:
+                try:
+                    callback(title)
+                except Exception as e:
+                    logger.error(f"Sheet change listener failed: {e}")
+        return changed
+
+    @staticmethod
+    def _replay(cached, writes):
+        """Re-apply local writes the reload may predate. Appends already in the sheet aren't repeated."""
+        for _, row, col, value in writes:
+            if col is None:
+                if row not in cached.values:
+                    cached.append(row)
+            elif row - 1 < len(cached.values):
+                cached.set_cell(row, col, value)
+
+    # --- SEEDING ---
+
+    def seed(self, worksheets, revision):
+        """Adopt already-loaded {title: CachedWorksheet}; the first poll reconciles them."""
+        if not worksheets:
+            return []
+        with self._lock:
+            for title, cached in worksheets.items():
+                self._sheets.setdefault(title, cached)
+        self.revision = revision
+        self.seeded = True
+        return list(worksheets)
+
+    def export(self, titles):
+        """({title: CachedWorksheet}, revision) for seeding another cache."""
+        with self._lock:
+            return {t: self._sheets[t] for t in titles if t in self._sheets}, self.revision
+
+    # --- SNAPSHOT ---
+
+    def load_snapshot(self, titles):
+        """Seed `titles` from the local snapshot. Returns the titles that were seeded."""
+        if not self.snapshot_path:
+            return []
+        started = time.perf_counter()
+        snapshot = load_snapshot(self.snapshot_path)
+        if snapshot is None:
+            return []
+        revision, sheets = snapshot
+        seeded = self.seed({t: CachedWorksheet(t, *sheets[t]) for t in titles if t in sheets}, revision)
+        if seeded:
+            self._saved_at = time.monotonic()
+            logger.info(f"Loaded sheet snapshot ({', '.join(seeded)}) at revision {revision} "
+                        f"in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return seeded
+
+    def save_snapshot(self, force=False):
+        if not self.snapshot_path:
+            return False
+        if not force and (not self._dirty or time.monotonic() - self._saved_at < self.snapshot_interval):
+            return False
+        with self._lock:
+            sheets = {t: (list(c.values), c.checksum) for t, c in self._sheets.items()}
+            self._dirty = False
+        # Local writes leave the checksum as loaded, so a restart from this file
+        # still reconciles them with the sheet on its first poll.
+        save_snapshot(self.snapshot_path, sheets, self.revision)
+        self._saved_at = time.monotonic()
+        return True
+
+    def _poll(self):
+        try:
+            self.check_for_changes()
+        except Exception as e:
+            logger.error(f"Sheet change check failed: {e}")
+        try:
+            self.save_snapshot()
+        except Exception as e:
+            logger.error(f"Sheet snapshot save failed: {e}")
+
+    def _loop(self):
+        if self.seeded:
+            # The snapshot may be behind the sheet: sync straight away
+            self._poll()
+        while not self._stop.wait(self.poll_interval):
+            self._poll()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        if not self.seeded:
+            self.revision = self.fetch_revision()
+        self._thread = threading.Thread(target=self._loop, name="sheet-cache-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._dirty:
+            try:
+                self.save_snapshot(force=True)
+            except Exception as e:
+                logger.error(f"Sheet snapshot save failed: {e}")
@@ -1,7 +1,44 @@
 import gspread
+from gspread.http_client import HTTPClient
+from gspread.exceptions import APIError
 from oauth2client.service_account import ServiceAccountCredentials
 import os
 import json
+import datetime
+from utils.availability import AvailabilityCache, compute_availability
+from utils.slot_calendar import SlotCalendar
+from utils import booking_ids
+from utils import deadline
+from services.booking_journal import BookingJournal, JournalEntryRejected
+from services.sheet_cache import SheetCache
+
+# Column order of the worksheets (setup_schema writes these headers)
+COUNSELORS_COLUMNS = ['id', 'name', 'image_url', 'description', 'is_active']
+BOOKINGS_COLUMNS = ['booking_id', 'user_phone', 'counselor_id', 'date', 'time_slot', 'payment_status',
+                    'razorpay_order_id', 'timestamp', 'booking_status', 'reschedule_count']
+SCHEDULES_COLUMNS = ['counselor_id', 'kind', 'day', 'start', 'end', 'slot_minutes']
+
+# Upper bound per Sheets call; inside a request the deadline cuts it shorter
+SHEETS_TIMEOUT_SECONDS = float(os.getenv("SHEETS_TIMEOUT_SECONDS", "15"))
+
+class DeadlineHTTPClient(HTTPClient):
+    """gspread's HTTPClient with each request's timeout taken from the request deadline."""
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        op = "sheets.read" if method.upper() == "GET" else "sheets.write"
+        response = self.session.request(
+            method=method,
+            url=endpoint,
+            json=json,
+            params=params,
+            data=data,
+            files=files,
+            headers=headers,
+            timeout=deadline.timeout(op, self.timeout or SHEETS_TIMEOUT_SECONDS),
+        )
+        if response.ok:
+            return response
+        raise APIError(response)
 
 class GoogleSheetsService:
     def __init__(self, credentials_file='credentials.json', sheet_name='WellnessCenterBot'):
@@ -10,6 +47,16 @@ class GoogleSheetsService:
         self.sheet_name = sheet_name
         self.client = None
         self.spreadsheet = None
+        self.availability_cache = AvailabilityCache(ttl=int(os.getenv("AVAILABILITY_CACHE_TTL", "60")))
+        self._slot_calendar = None
+        self.journal = None
+        # booking_id -> reschedule_count of the latest journaled reschedule
+        self._reschedule_targets = {}
+        self.cache = None
+        # Read-only worksheets loaded before fork, adopted by each worker's cache
+        self._prefork_sheets = ({}, None)
+        # Called with (counselor_id, date, time_slot) when a paid booking gives up its slot
+        self.slot_listeners = []
 
     def connect(self):
         try:
@@ -28,7 +75,7 @@ class GoogleSheetsService:
                 # 3. Fallback to local file (Development)
                 creds = ServiceAccountCredentials.from_json_keyfile_name(self.credentials_file, self.scope)
             
-            self.client = gspread.authorize(creds)
+            self.client = gspread.authorize(creds, http_client=DeadlineHTTPClient)
             try:
                 self.spreadsheet = self.client.open(self.sheet_name)
                 # Ensure schema is up to date even if sheet exists
@@ -39,11 +86,58 @@ class GoogleSheetsService:
                 self.setup_schema()
                 print(f"Created new sheet: {self.sheet_name}")
             
+            self.init_cache()
             return True
         except Exception as e:
             print(f"Error connecting to Google Sheets: {e}")
             return False
 
+    def init_cache(self):
+        """
+        Serve reads from a worksheet cache kept fresh by polling the spreadsheet revision.
+        With SHEETS_SNAPSHOT_PATH set, Bookings and Counselors are seeded from a local
+        snapshot so the bot is ready before the first download.
+        """
+        self.cache = SheetCache(
+            self.spreadsheet, self.client,
+            poll_interval=float(os.getenv("SHEETS_POLL_INTERVAL", "5")),
+            snapshot_path=os.getenv("SHEETS_SNAPSHOT_PATH"),
+            snapshot_interval=float(os.getenv("SHEETS_SNAPSHOT_INTERVAL", "60"))
+        )
+        self.cache.seed(*self._prefork_sheets)
+        self.cache.load_snapshot(['Bookings', 'Counselors'])
+        # Loaded up front so the poller also watches it: edits to working hours
+        # reach the slot calendar without a restart
+        try:
+            self.cache.get('Schedules')
+        except Exception as e:
+            print(f"Error loading Schedules: {e}")
+        self.cache.add_listener(self._on_sheet_changed)
+        self.cache.start()
+
+    def prepare_fork(self, titles=('Counselors', 'Schedules')):
+        """
+        Called in the gunicorn master: load read-only worksheets once (shared with workers
+        copy-on-write) and drop the client, cache and poller so no socket, OAuth session or
+        thread crosses the fork. Each worker then calls connect() for its own.
+        """
+        if self.cache is not None:
+            for title in titles:
+                self.cache.get(title)
+            self._prefork_sheets = self.cache.export(titles)
+            self.cache.stop()
+        self.client = None
+        self.spreadsheet = None
+        self.cache = None
+        self._slot_calendar = None
+
+    def _on_sheet_changed(self, title):
+        if title == 'Schedules':
+            self._slot_calendar = None
+            self.availability_cache.invalidate()
+        elif title == 'Bookings':
+            self.availability_cache.invalidate()
+
     def ensure_bookings_schema(self):
         """Ensure Bookings sheet has all required columns."""
         try:
@@ -54,8 +148,26 @@ class GoogleSheetsService:
                 b_sheet.update_cell(1, 9, 'booking_status')
                 # Optional: Backfill existing rows?
                 # For now, our code defaults to ACTIVE so it's fine.
+            if 'reschedule_count' not in headers:
+                # Empty means never rescheduled
+                b_sheet.update_cell(1, 10, 'reschedule_count')
         except Exception as e:
             print(f"Error ensuring schema: {e}")
+        # Spreadsheets created before per-counselor schedules don't have the sheet yet
+        try:
+            self._ensure_schedules_sheet()
+        except Exception as e:
+            print(f"Error ensuring Schedules sheet: {e}")
+
+    def _ensure_schedules_sheet(self):
+        """Schedules sheet (per-counselor working hours, see utils/slot_calendar.py), created if missing."""
+        try:
+            s_sheet = self.spreadsheet.worksheet('Schedules')
+        except gspread.WorksheetNotFound:
+            s_sheet = self.spreadsheet.add_worksheet(title='Schedules', rows=1000, cols=6)
+        
+        if not s_sheet.row_values(1):
+            s_sheet.append_row(SCHEDULES_COLUMNS)
 
     def setup_schema(self):
         """Initializes the sheets with headers if they are empty."""
@@ -66,7 +178,7 @@ class GoogleSheetsService:
             c_sheet = self.spreadsheet.add_worksheet(title='Counselors', rows=100, cols=10)
         
         if not c_sheet.get_all_values():
-            c_sheet.append_row(['id', 'name', 'image_url', 'description', 'is_active'])
+            c_sheet.append_row(COUNSELORS_COLUMNS)
             # Add dummy data
             c_sheet.append_row(['1', 'Dr. Smith', 'https://example.com/dr_smith.jpg', 'Expert Psychologist', 'TRUE'])
             c_sheet.append_row(['2', 'Dr. Jane', 'https://example.com/dr_jane.jpg', 'Wellness Coach', 'TRUE'])
@@ -78,12 +190,14 @@ class GoogleSheetsService:
             b_sheet = self.spreadsheet.add_worksheet(title='Bookings', rows=1000, cols=10)
         
         if not b_sheet.get_all_values():
-            b_sheet.append_row(['booking_id', 'user_phone', 'counselor_id', 'date', 'time_slot', 'payment_status', 'razorpay_order_id', 'timestamp', 'booking_status'])
+            b_sheet.append_row(BOOKINGS_COLUMNS)
+
+        # 3. Schedules Sheet
+        self._ensure_schedules_sheet()
 
     def get_active_counselors(self):
-        sheet = self.spreadsheet.worksheet('Counselors')
         # get_all_records() fails if headers are duplicate/empty
-        rows = sheet.get_all_values()
+        rows = self.cache.values('Counselors')
         
         # Skip header
         if len(rows) < 2:
@@ -105,18 +219,65 @@ class GoogleSheetsService:
                 })
         return counselors
 
+    def get_schedule_rules(self):
+        """Raw rows of the Schedules sheet (empty if it couldn't be created, see ensure_bookings_schema)."""
+        try:
+            return self.cache.records('Schedules')
+        except Exception:
+            return []
+
+    def get_slot_calendar(self):
+        """Compiled SlotCalendar, rebuilt only when the Schedules sheet changes."""
+        if self._slot_calendar is None:
+            self._slot_calendar = SlotCalendar.compile(self.get_schedule_rules())
+            self.availability_cache.invalidate()
+        return self._slot_calendar
+
     def get_bookings_for_date(self, date_str, counselor_id):
-        sheet = self.spreadsheet.worksheet('Bookings')
-        records = sheet.get_all_records()
+        records = self.cache.records('Bookings')
         # Filter by date and counselor
         booked_slots = [
             r['time_slot'] for r in records 
             if r['date'] == date_str and str(r['counselor_id']) == str(counselor_id) and r['payment_status'] == 'PAID'
+            and r.get('booking_status', 'ACTIVE') != 'CANCELLED'
         ]
         return booked_slots
 
+    def get_booked_slots_by_date(self, counselor_id, dates):
+        """Booked (PAID, not cancelled) slots per date for one counselor, in a single read."""
+        records = self.cache.records('Bookings')
+        booked = {d: set() for d in dates}
+        for r in records:
+            date_str = str(r.get('date'))
+            if date_str in booked and str(r.get('counselor_id')) == str(counselor_id) \
+                    and r.get('payment_status') == 'PAID' and r.get('booking_status', 'ACTIVE') != 'CANCELLED':
+                booked[date_str].add(str(r.get('time_slot')))
+        return booked
+
+    def get_availability(self, counselor_id, days=7):
+        """Free slots per date for the next `days` days (cached per counselor)."""
+        calendar = self.get_slot_calendar()
+        today = datetime.date.today()
+        cached = self.availability_cache.get(counselor_id, today, days)
+        if cached is not None:
+            return {d: slots for d, slots in list(cached.items())[:days]}
+        dates = [str(today + datetime.timedelta(days=i)) for i in range(days)]
+        booked = self.get_booked_slots_by_date(counselor_id, dates)
+        availability = compute_availability(booked, today, days, lambda day: calendar.slots_for(counselor_id, day))
+        self.availability_cache.put(counselor_id, today, days, availability)
+        return availability
+
+    def _write_cell(self, sheet, row, col, value):
+        sheet.update_cell(row, col, value)
+        self.cache.apply_update(sheet.title, row, col, value)
+
     def create_booking_hold(self, booking_data):
         """Creates a temporary booking or 'HOLD' status before payment."""
+        if self.journal:
+            return self.journal.submit('create_booking_hold', booking_data)
+        return self._create_booking_hold(booking_data)
+
+    def _create_booking_hold(self, booking_data):
         sheet = self.spreadsheet.worksheet('Bookings')
         row = [
             booking_data.get('booking_id'),
@@ -130,41 +291,131 @@ class GoogleSheetsService:
             'ACTIVE' # booking_status
         ]
         sheet.append_row(row)
+        self.cache.apply_append('Bookings', row)
+        self.availability_cache.invalidate(booking_data.get('counselor_id'))
+
+    def enable_journal(self, path):
+        """Route booking mutations through a local write-ahead journal (see services/booking_journal.py)."""
+        self.journal = BookingJournal(path, self.apply_journal_entry)
+        for entry in self.journal.pending_entries():
+            if entry['op'] == 'update_booking_datetime' and len(entry['args']) > 3:
+                self._reschedule_targets[entry['args'][0]] = entry['args'][3]
+        self.journal.start()
+        return self.journal
+
+    def apply_journal_entry(self, op, args, recovering=False):
+        """Apply one journaled mutation directly to the sheet. Raises on store errors so it is retried."""
+        if op == 'create_booking_hold':
+            booking_data = args[0]
+            # After a crash the hold may already be in the sheet; don't append it twice
+            if recovering and self._booking_row(self.spreadsheet.worksheet('Bookings'), booking_data.get('booking_id')):
+                return True
+            self._create_booking_hold(booking_data)
+            return True
+        handlers = {
+            'update_booking_status': self._update_booking_status,
+            'batch_update_booking_status': self._batch_update_booking_status,
+            'update_booking_datetime': self._update_booking_datetime,
+            'cancel_booking': self._cancel_booking,
+        }
+        if op not in handlers:
+            raise JournalEntryRejected(f"unknown operation {op}")
+        if not handlers[op](*args):
+            raise JournalEntryRejected(f"no booking for {args[0]}")
+        return True
 
     def update_booking_payment(self, order_id, status='PAID'):
         # Legacy support or if order_id is known
         sheet = self.spreadsheet.worksheet('Bookings')
         cell = sheet.find(order_id)
         if cell:
-            sheet.update_cell(cell.row, 6, status)
+            self._write_cell(sheet, cell.row, 6, status)
+            self.availability_cache.invalidate()
             return True
         return False
 
+    def find_booking_row(self, booking_id):
+        """1-based row of a booking in the cached Bookings sheet, or None (see utils/booking_ids.py)."""
+        return booking_ids.locate(self.cache.values('Bookings'), booking_id)
+
+    def _booking_row(self, sheet, booking_id):
+        """Row of a booking in the live sheet: the cached row if the sheet still agrees, else a search."""
+        booking_id = str(booking_id)
+        row = self.find_booking_row(booking_id)
+        if row and sheet.row_values(row)[:1] == [booking_id]:
+            return row
+        cell = sheet.find(booking_id, in_column=1)
+        return cell.row if cell else None
+
+    def _known_booking(self, booking_id):
+        """In the sheet, or a hold still waiting in the journal."""
+        return bool(self.find_booking_row(booking_id)) or self.journal.has_pending_hold(booking_id)
+
     def update_booking_status(self, booking_id, status, razorpay_order_id=None):
         """Updates booking status found by booking_id (Col 1)."""
+        if self.journal:
+            known = self._known_booking(booking_id)
+            # Journaled even if unknown here: the hold may be in another worker's journal,
+            # and a payment must not be dropped (the applier dead-letters it if never found)
+            self.journal.submit('update_booking_status', booking_id, status, razorpay_order_id)
+            return known
+        return self._update_booking_status(booking_id, status, razorpay_order_id)
+
+    def _update_booking_status(self, booking_id, status, razorpay_order_id=None):
         sheet = self.spreadsheet.worksheet('Bookings')
-        cell = sheet.find(booking_id)
-        if cell:
+        row = self._booking_row(sheet, booking_id)
+        if row:
             # Update Payment Status (Col 6)
-            sheet.update_cell(cell.row, 6, status)
+            self._write_cell(sheet, row, 6, status)
             # Update Order ID (Col 7) if provided
             if razorpay_order_id:
-                sheet.update_cell(cell.row, 7, razorpay_order_id)
+                self._write_cell(sheet, row, 7, razorpay_order_id)
+            self.availability_cache.invalidate()
             return True
         return False
     
+    def batch_update_booking_status(self, updates):
+        """Apply many (booking_id, status, razorpay_order_id) updates in one sheet write."""
+        if self.journal:
+            return self.journal.submit('batch_update_booking_status', [list(u) for u in updates])
+        return self._batch_update_booking_status(updates)
+
+    def _batch_update_booking_status(self, updates):
+        sheet = self.spreadsheet.worksheet('Bookings')
+        # One fresh read of the ID column, so rows shifted by manual edits are still hit
+        rows = {booking_id: idx + 1 for idx, booking_id in enumerate(sheet.col_values(1))}
+        data = []
+        applied = []
+        for booking_id, status, razorpay_order_id in updates:
+            row = rows.get(str(booking_id))
+            if row is None or row == 1:
+                continue
+            if razorpay_order_id:
+                # Payment Status (Col 6) and Order ID (Col 7)
+                data.append({'range': f'F{row}:G{row}', 'values': [[status, razorpay_order_id]]})
+            else:
+                data.append({'range': f'F{row}', 'values': [[status]]})
+            applied.append((row, status, razorpay_order_id))
+        if not data:
+            return 0
+        sheet.batch_update(data)
+        for row, status, razorpay_order_id in applied:
+            self.cache.apply_update('Bookings', row, 6, status)
+            if razorpay_order_id:
+                self.cache.apply_update('Bookings', row, 7, razorpay_order_id)
+        self.availability_cache.invalidate()
+        return len(applied)
+    
     def get_user_booking_count(self, user_phone):
         """Count total PAID bookings for a user (lifetime limit)."""
-        sheet = self.spreadsheet.worksheet('Bookings')
-        records = sheet.get_all_records()
+        records = self.cache.records('Bookings')
         count = sum(1 for r in records 
                    if r.get('user_phone') == user_phone and r.get('payment_status') == 'PAID')
         return count
     
     def get_user_active_bookings(self, user_phone):
         """Get all ACTIVE bookings with PAID status for a user."""
-        sheet = self.spreadsheet.worksheet('Bookings')
-        records = sheet.get_all_records()
+        records = self.cache.records('Bookings')
         active_bookings = [
             r for r in records 
             if r.get('user_phone') == user_phone 
@@ -173,24 +424,91 @@ class GoogleSheetsService:
         ]
         return active_bookings
     
+    def get_paid_active_bookings(self):
+        """Get all ACTIVE bookings with PAID status across all users (single read)."""
+        records = self.cache.records('Bookings')
+        return [
+            r for r in records
+            if r.get('payment_status') == 'PAID'
+            and r.get('booking_status', 'ACTIVE') in ['ACTIVE', '']
+        ]
+    
     def update_booking_datetime(self, booking_id, new_date, new_time_slot):
         """Update date and time for an existing booking (for rescheduling)."""
+        if self.journal:
+            if not self._known_booking(booking_id):
+                return False
+            # The entry carries the resulting count, so replaying it doesn't bump it again;
+            # an earlier reschedule may still be waiting in the journal
+            row = self.find_booking_row(booking_id)
+            count = max(self._reschedule_count(row) if row else 0, self._reschedule_targets.get(booking_id, 0)) + 1
+            self._reschedule_targets[booking_id] = count
+            return self.journal.submit('update_booking_datetime', booking_id, new_date, new_time_slot, count)
+        return self._update_booking_datetime(booking_id, new_date, new_time_slot)
+
+    def _update_booking_datetime(self, booking_id, new_date, new_time_slot, reschedule_count=None):
         sheet = self.spreadsheet.worksheet('Bookings')
-        cell = sheet.find(booking_id)
-        if cell:
+        row = self._booking_row(sheet, booking_id)
+        if row:
+            freed = self._paid_slot(row)
             # Update Date (Col 4)
-            sheet.update_cell(cell.row, 4, new_date)
+            self._write_cell(sheet, row, 4, new_date)
             # Update Time Slot (Col 5)
-            sheet.update_cell(cell.row, 5, new_time_slot)
+            self._write_cell(sheet, row, 5, new_time_slot)
+            # Reschedule Count (Col 10): the journaled target, or a bump for direct writes
+            if reschedule_count is None:
+                reschedule_count = self._reschedule_count(row) + 1
+            self._write_cell(sheet, row, 10, reschedule_count)
+            self.availability_cache.invalidate()
+            if freed and freed[1:] != (new_date, new_time_slot):
+                self._notify_slot_freed(freed)
             return True
         return False
     
+    def _paid_slot(self, row):
+        """(counselor_id, date, time_slot) a cached Bookings row occupies, or None."""
+        values = self.cache.values('Bookings')
+        if row - 1 >= len(values):
+            return None
+        r = values[row - 1] + [''] * 9
+        if r[5] != 'PAID' or r[8] == 'CANCELLED':
+            return None
+        return r[2], r[3], r[4]
+
+    def _notify_slot_freed(self, freed):
+        if not freed:
+            return
+        for callback in self.slot_listeners:
+            try:
+                callback(*freed)
+            except Exception as e:
+                print(f"Slot listener failed: {e}")
+
+    def _reschedule_count(self, row):
+        values = self.cache.values('Bookings')
+        if row - 1 < len(values) and len(values[row - 1]) >= 10:
+            try:
+                return int(values[row - 1][9] or 0)
+            except ValueError:
+                return 0
+        return 0
+    
     def cancel_booking(self, booking_id):
         """Mark a booking as CANCELLED."""
+        if self.journal:
+            if not self._known_booking(booking_id):
+                return False
+            return self.journal.submit('cancel_booking', booking_id)
+        return self._cancel_booking(booking_id)
+
+    def _cancel_booking(self, booking_id):
         sheet = self.spreadsheet.worksheet('Bookings')
-        cell = sheet.find(booking_id)
-        if cell:
+        row = self._booking_row(sheet, booking_id)
+        if row:
+            freed = self._paid_slot(row)
             # Update Booking Status (Col 9)
-            sheet.update_cell(cell.row, 9, 'CANCELLED')
+            self._write_cell(sheet, row, 9, 'CANCELLED')
+            self.availability_cache.invalidate()
+            self._notify_slot_freed(freed)
             return True
         return False
@@ -1,53 +1,122 @@
 import requests
-import json
 import os
+import time
 import uuid
 import logging
+from utils.json_codec import dumps_bytes
+from utils.delivery_tracker import message_kind
+from utils import deadline
 
 logger = logging.getLogger(__name__)
 
+# Upper bound per Graph call; inside a request the deadline cuts it shorter
+GRAPH_TIMEOUT_SECONDS = float(os.getenv("GRAPH_TIMEOUT_SECONDS", "10"))
+
 class WhatsAppAPI:
     def __init__(self):
         self.token = os.getenv("WHATSAPP_ACCESS_TOKEN")
         self.phone_number_id = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
         self.api_version = "v21.0"
         self.base_url = f"https://graph.facebook.com/{self.api_version}/{self.phone_number_id}/messages"
-    
-    def send_message(self, to_phone, message_data):
-        if not self.token or not self.phone_number_id:
-            logger.error("WhatsApp Credentials missing in .env")
-            return None
-
-        headers = {
+        self.headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
         }
-        
+        # Optional DeliveryTracker (utils/delivery_tracker.py), told about every send
+        self.tracker = None
+
+    @staticmethod
+    def build_payload(to_phone, message_data):
         payload = {
             "messaging_product": "whatsapp",
             "to": to_phone,
             "type": message_data.get("type", "text"),
         }
-        
+
         # Merge specific message type data (text, interactive, etc.)
         payload.update(message_data)
-        
+        return payload
+
+    def send_message(self, to_phone, message_data):
+        return self._send(to_phone, dumps_bytes(self.build_payload(to_phone, message_data)), message_kind(message_data))
+
+    def send_template(self, to_phone, template):
+        """Send a prebuilt MessageTemplate (see utils/message_templates.py)."""
+        return self._send(to_phone, template.render(to_phone), template.kind)
+
+    def _send(self, to_phone, body, kind):
+        sent_at = time.time()
+        response = self.post_body(body)
+        if self.tracker:
+            self.tracker.record_send(to_phone, kind, response, sent_at)
+        return response
+
+    def post_body(self, body):
+        """POST an already-encoded JSON message body to the Graph API."""
+        if not self.token or not self.phone_number_id:
+            logger.error("WhatsApp Credentials missing in .env")
+            return None
+
         try:
-            response = requests.post(self.base_url, headers=headers, json=payload)
+            response = requests.post(self.base_url, headers=self.headers, data=body,
+                                     timeout=deadline.timeout("graph.send", GRAPH_TIMEOUT_SECONDS))
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to send WhatsApp message: {e}")
             if e.response:
                 logger.error(f"Response Body: {e.response.text}")
-                logger.error(f"Request Payload: {json.dumps(payload, indent=2)}")
+                logger.error(f"Request Payload: {body.decode('utf-8')}")
+            return None
+
+    def upload_media(self, content, mime_type, filename="media"):
+        """Upload bytes to the Graph media endpoint. Returns the media ID, or None on failure."""
+        if not self.token or not self.phone_number_id:
+            logger.error("WhatsApp Credentials missing in .env")
             return None
 
+        try:
+            response = requests.post(
+                f"https://graph.facebook.com/{self.api_version}/{self.phone_number_id}/media",
+                headers={"Authorization": f"Bearer {self.token}"},
+                data={"messaging_product": "whatsapp", "type": mime_type},
+                files={"file": (filename, content, mime_type)},
+                timeout=deadline.timeout("graph.upload", 30)
+            )
+            response.raise_for_status()
+            return response.json().get("id")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to upload media: {e}")
+            return None
+
+    def download_media(self, url):
+        """Fetch a public media URL. Returns (content, mime_type)."""
+        response = requests.get(url, timeout=deadline.timeout("graph.download", 15))
+        response.raise_for_status()
+        return response.content, response.headers.get("Content-Type", "image/jpeg").split(";")[0]
+
+    def send_image(self, to_phone, media_id=None, link=None, caption=None):
+        return self.send_message(to_phone, self.build_image(media_id, link, caption))
+
+    @staticmethod
+    def build_image(media_id=None, link=None, caption=None):
+        image = {"id": media_id} if media_id else {"link": link}
+        if caption:
+            image["caption"] = caption
+        return {
+            "type": "image",
+            "image": image
+        }
+
     def send_text(self, to_phone, text):
-        return self.send_message(to_phone, {
+        return self.send_message(to_phone, self.build_text(text))
+
+    @staticmethod
+    def build_text(text):
+        return {
             "type": "text",
             "text": {"body": text}
-        })
+        }
 
     def send_interactive_list(self, to_phone, body_text, button_text, sections):
         """
@@ -62,7 +131,11 @@ class WhatsAppAPI:
             }
         ]
         """
-        payload = {
+        return self.send_message(to_phone, self.build_interactive_list(body_text, button_text, sections))
+
+    @staticmethod
+    def build_interactive_list(body_text, button_text, sections):
+        return {
             "type": "interactive",
             "interactive": {
                 "type": "list",
@@ -75,12 +148,19 @@ class WhatsAppAPI:
                 }
             }
         }
-        return self.send_message(to_phone, payload)
 
-    def send_interactive_buttons(self, to_phone, body_text, buttons, header_image_url=None, footer_text=None):
+    def send_interactive_buttons(self, to_phone, body_text, buttons, header_image_url=None, footer_text=None, header_image_id=None):
         """
         buttons structure: [{"id": "btn_1", "title": "Button Title"}] (Max 3)
+        header_image_id (an uploaded media ID) is preferred over header_image_url.
         """
+        return self.send_message(
+            to_phone,
+            self.build_interactive_buttons(body_text, buttons, header_image_url, footer_text, header_image_id)
+        )
+
+    @staticmethod
+    def build_interactive_buttons(body_text, buttons, header_image_url=None, footer_text=None, header_image_id=None):
         formatted_buttons = []
         for btn in buttons:
             formatted_buttons.append({
@@ -101,30 +181,36 @@ class WhatsAppAPI:
             }
         }
 
-        if header_image_url:
+        if header_image_id:
+            interactive_obj["header"] = {
+                "type": "image",
+                "image": {"id": header_image_id}
+            }
+        elif header_image_url:
             interactive_obj["header"] = {
                 "type": "image",
                 "image": {"link": header_image_url}
             }
-        
+
         if footer_text:
             interactive_obj["footer"] = {
                 "text": footer_text
             }
 
-        payload = {
+        return {
             "type": "interactive",
             "interactive": interactive_obj
         }
-        return self.send_message(to_phone, payload)
-    
-    
-    def send_flow_message(self, to_phone, flow_id, flow_cta, header_text, body_text, footer_text=None, flow_data=None):
+
+
+    def send_flow_message(self, to_phone, flow_id, flow_cta, header_text, body_text, footer_text=None, flow_data=None,
+                          flow_token=None):
         """
-        Send a WhatsApp Flow message with optional data context
+        Send a WhatsApp Flow message with optional data context.
+        The Flow endpoint receives `flow_token` with every request (random if not given).
         """
         flow_action_payload = {
-            "screen": "COUNSELLOR_SELECT" 
+            "screen": "COUNSELLOR_SELECT"
         }
         if flow_data:
             flow_action_payload["data"] = flow_data
@@ -142,7 +228,7 @@ class WhatsAppAPI:
                 "name": "flow",
                 "parameters": {
                     "flow_message_version": "3",
-                    "flow_token": str(uuid.uuid4()),
+                    "flow_token": flow_token or str(uuid.uuid4()),
                     "flow_id": flow_id,
                     "flow_cta": flow_cta,
                     "flow_action": "navigate",
@@ -150,15 +236,14 @@ class WhatsAppAPI:
                 }
             }
         }
-        
+
         if footer_text:
             interactive_obj["footer"] = {
                 "text": footer_text
             }
-        
+
         payload = {
             "type": "interactive",
             "interactive": interactive_obj
         }
         return self.send_message(to_phone, payload)
-
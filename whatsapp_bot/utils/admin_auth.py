@@ -0,0 +1,8 @@
+import os
+import hmac
+
+def is_admin_request(headers, header_name="X-Admin-Token"):
+    """True when the request carries the ADMIN_TOKEN. Always False if ADMIN_TOKEN isn't configured."""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    supplied = headers.get(header_name)
+    return bool(admin_token and supplied and hmac.compare_digest(supplied, admin_token))
@@ -0,0 +1,102 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from utils.rate_limit import TokenBucket
+from utils import message_templates
+
+logger = logging.getLogger(__name__)
+
+SHED_PHONE = "phone"
+SHED_GLOBAL = "global"
+
+class AdmissionController:
+    """
+    Token-bucket admission in front of FlowHandler.handle_message.
+
+    Each phone gets its own bucket (`phone_rate` messages/sec, bursts of
+    `phone_burst`) and all phones share a global bucket, so one looping client
+    can't spend the Sheets and Graph quota of everyone else. Per-phone buckets
+    live in an LRU capped at `max_phones`; an evicted bucket comes back full,
+    which is what an idle phone's bucket would be anyway.
+
+    A throttled phone gets one prebuilt reply per `reply_cooldown` seconds (no
+    Sheets reads), and everything else it sends in that time is dropped.
+    """
+
+    def __init__(self, phone_rate=None, phone_burst=None, global_rate=None, global_burst=None,
+                 max_phones=None, reply_cooldown=60):
+        self.phone_rate = phone_rate or float(os.getenv("INBOUND_PHONE_RATE", "0.5"))
+        self.phone_burst = phone_burst or float(os.getenv("INBOUND_PHONE_BURST", "5"))
+        self.global_bucket = TokenBucket(
+            global_rate or float(os.getenv("INBOUND_GLOBAL_RATE", "50")),
+            global_burst or float(os.getenv("INBOUND_GLOBAL_BURST", "100"))
+        )
+        self.max_phones = max_phones or int(os.getenv("INBOUND_MAX_TRACKED_PHONES", "10000"))
+        self.reply_cooldown = reply_cooldown
+
+        # phone -> [bucket, last throttled reply (monotonic)]
+        self._phones = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"admitted": 0, "shed_phone": 0, "shed_global": 0, "throttle_replies": 0}
+
+    def share_global(self, workers):
+        """Split the global bucket evenly across `workers` processes, each with its own controller."""
+        bucket = self.global_bucket
+        self.global_bucket = TokenBucket(bucket.rate / workers, bucket.capacity / workers)
+
+    def _entry(self, phone):
+        with self._lock:
+            entry = self._phones.get(phone)
+            if entry is None:
+                entry = [TokenBucket(self.phone_rate, self.phone_burst), 0.0]
+                self._phones[phone] = entry
+                if len(self._phones) > self.max_phones:
+                    self._phones.popitem(last=False)
+            else:
+                self._phones.move_to_end(phone)
+            return entry
+
+    def admit(self, phone):
+        """None if the message may be handled, else SHED_PHONE or SHED_GLOBAL."""
+        bucket = self._entry(phone)[0]
+        if not bucket.try_acquire():
+            self.counters["shed_phone"] += 1
+            return SHED_PHONE
+        if not self.global_bucket.try_acquire():
+            # The phone didn't get served, so it shouldn't pay for it
+            bucket.refund()
+            self.counters["shed_global"] += 1
+            return SHED_GLOBAL
+        self.counters["admitted"] += 1
+        return None
+
+    def throttle_reply(self, phone, reason):
+        """The cached slow-down/busy template to send, or None if this phone got one recently."""
+        entry = self._entry(phone)
+        now = time.monotonic()
+        with self._lock:
+            if now - entry[1] < self.reply_cooldown:
+                return None
+            entry[1] = now
+        self.counters["throttle_replies"] += 1
+        return message_templates.SLOW_DOWN if reason == SHED_PHONE else message_templates.BUSY
+
+    def reply_throttled(self, wa_api, phone, reason):
+        """Send the cached slow-down/busy reply unless this phone got one recently."""
+        template = self.throttle_reply(phone, reason)
+        if template is None:
+            return False
+        try:
+            wa_api.send_template(phone, template)
+        except Exception as e:
+            logger.error(f"Throttle reply to {phone} failed: {e}")
+        return True
+
+    def stats(self):
+        with self._lock:
+            tracked = len(self._phones)
+        total = sum(self.counters[k] for k in ("admitted", "shed_phone", "shed_global"))
+        shed = self.counters["shed_phone"] + self.counters["shed_global"]
+        return {**self.counters, "tracked_phones": tracked, "shed_ratio": shed / total if total else 0.0}
@@ -0,0 +1,164 @@
+import time
+import datetime
+import threading
+
+# pandas is optional: only the analytics CLI and admin endpoint need it.
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError:
+    np = None
+    pd = None
+
+BOOKING_COLUMNS = ['booking_id', 'user_phone', 'counselor_id', 'date', 'time_slot', 'payment_status',
+                   'razorpay_order_id', 'timestamp', 'booking_status', 'reschedule_count']
+
+class AnalyticsUnavailable(RuntimeError):
+    pass
+
+def _require_pandas():
+    if pd is None:
+        raise AnalyticsUnavailable("Booking analytics need pandas and numpy (pip install pandas)")
+
+def load_bookings_frame(values):
+    """Columnar frame from raw Bookings values (header row first), with parsed dates and flags."""
+    _require_pandas()
+    if len(values) < 2:
+        return pd.DataFrame(columns=BOOKING_COLUMNS + ['day', 'paid', 'cancelled'])
+    headers = values[0]
+    width = len(headers)
+    frame = pd.DataFrame([row + [''] * (width - len(row)) for row in values[1:]], columns=headers)
+    for column in BOOKING_COLUMNS:
+        if column not in frame:
+            frame[column] = ''
+
+    frame['counselor_id'] = frame['counselor_id'].astype(str)
+    frame['payment_status'] = frame['payment_status'].astype('category')
+    frame['booking_status'] = frame['booking_status'].replace('', 'ACTIVE').astype('category')
+    frame['day'] = pd.to_datetime(frame['date'], format='%Y-%m-%d', errors='coerce')
+    frame['created'] = pd.to_datetime(frame['timestamp'], errors='coerce')
+    frame['reschedule_count'] = pd.to_numeric(frame['reschedule_count'], errors='coerce').fillna(0).astype(np.int32)
+    frame['paid'] = (frame['payment_status'] == 'PAID').to_numpy()
+    frame['cancelled'] = (frame['booking_status'] == 'CANCELLED').to_numpy()
+    return frame
+
+def _period_key(days, period):
+    if period == 'week':
+        return days.dt.to_period('W-SUN').dt.start_time
+    return days.dt.normalize()
+
+def utilization(frame, calendar, counselor_ids, start, end, period='day'):
+    """Booked (paid, not cancelled) slots / scheduled slots per counselor per day or week."""
+    _require_pandas()
+    dates = pd.date_range(start, end, freq='D')
+    capacity = pd.DataFrame(
+        [(str(cid), d, len(calendar.slots_for(cid, d.date()))) for cid in counselor_ids for d in dates],
+        columns=['counselor_id', 'day', 'capacity']
+    )
+    in_range = frame[(frame['day'] >= dates[0]) & (frame['day'] <= dates[-1]) & frame['paid'] & ~frame['cancelled']]
+    booked = in_range.groupby(['counselor_id', 'day'], observed=True).size().rename('booked').reset_index()
+
+    merged = capacity.merge(booked, on=['counselor_id', 'day'], how='left').fillna({'booked': 0})
+    merged['period'] = _period_key(merged['day'], period)
+    result = merged.groupby(['counselor_id', 'period'], observed=True)[['booked', 'capacity']].sum().reset_index()
+    result['utilization'] = np.where(result['capacity'] > 0, result['booked'] / result['capacity'].clip(lower=1), 0.0)
+    return result
+
+def conversion(frame):
+    """Hold -> payment conversion, overall and per counselor."""
+    _require_pandas()
+    per_counselor = frame.groupby('counselor_id', observed=True).agg(holds=('paid', 'size'), paid=('paid', 'sum'))
+    per_counselor['conversion'] = per_counselor['paid'] / per_counselor['holds'].clip(lower=1)
+    holds = int(len(frame))
+    paid = int(frame['paid'].sum())
+    return {
+        'holds': holds,
+        'paid': paid,
+        'conversion': paid / holds if holds else 0.0,
+        'per_counselor': per_counselor.reset_index()
+    }
+
+def reschedule_rates(frame):
+    """Share of paid bookings rescheduled at least once, per counselor."""
+    _require_pandas()
+    paid = frame[frame['paid']]
+    grouped = paid.assign(rescheduled=paid['reschedule_count'] > 0).groupby('counselor_id', observed=True).agg(
+        bookings=('rescheduled', 'size'), rescheduled=('rescheduled', 'sum'), reschedules=('reschedule_count', 'sum')
+    )
+    grouped['reschedule_rate'] = grouped['rescheduled'] / grouped['bookings'].clip(lower=1)
+    return grouped.reset_index()
+
+def revenue(frame, price_rupees, period='week'):
+    """Paid revenue per counselor per period (by appointment date)."""
+    _require_pandas()
+    paid = frame[frame['paid'] & frame['day'].notna()]
+    grouped = paid.groupby(['counselor_id', _period_key(paid['day'], period).rename('period')], observed=True).size()
+    return (grouped * price_rupees).rename('revenue').reset_index()
+
+def peak_hours(frame):
+    """
+    Two weekday x hour heatmaps: when holds are created (from timestamp) and
+    which appointment slots are paid for (from date + time_slot).
+    """
+    _require_pandas()
+    created = frame[frame['created'].notna()]
+    created_heatmap = pd.crosstab(created['created'].dt.day_name(), created['created'].dt.hour)
+
+    paid = frame[frame['paid'] & frame['day'].notna()]
+    slot_hour = pd.to_numeric(paid['time_slot'].str.slice(0, 2), errors='coerce')
+    slot_heatmap = pd.crosstab(paid['day'].dt.day_name(), slot_hour)
+    return {'created': created_heatmap, 'slots': slot_heatmap}
+
+def build_report(values, calendar, counselor_ids, start, end, period='week', price_rupees=500):
+    """Every metric in one dict of plain JSON-serializable values."""
+    frame = load_bookings_frame(values)
+    util = utilization(frame, calendar, counselor_ids, start, end, period)
+    conv = conversion(frame)
+    heatmaps = peak_hours(frame)
+
+    def records(df):
+        df = df.copy()
+        for column in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[column]):
+                df[column] = df[column].dt.strftime('%Y-%m-%d')
+        return df.to_dict(orient='records')
+
+    def heatmap(df):
+        return {str(day): {str(int(h)): int(v) for h, v in row.items()} for day, row in df.iterrows()}
+
+    return {
+        'range': {'start': str(start), 'end': str(end), 'period': period},
+        'utilization': records(util),
+        'conversion': {
+            'holds': conv['holds'], 'paid': conv['paid'], 'conversion': conv['conversion'],
+            'per_counselor': records(conv['per_counselor'])
+        },
+        'reschedules': records(reschedule_rates(frame)),
+        'revenue': records(revenue(frame, price_rupees, period)),
+        'peak_hours': {name: heatmap(df) for name, df in heatmaps.items()}
+    }
+
+class ReportCache:
+    """Caches reports per (params, Bookings snapshot) for `ttl` seconds."""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] < self.ttl:
+                return entry[1]
+        report = build()
+        with self._lock:
+            # Keep the cache small: drop expired entries whenever we add one
+            self._entries = {k: v for k, v in self._entries.items() if now - v[0] < self.ttl}
+            self._entries[key] = (now, report)
+        return report
+
+def default_range(days=28):
+    end = datetime.date.today()
+    return end - datetime.timedelta(days=days - 1), end
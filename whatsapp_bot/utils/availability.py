@@ -0,0 +1,55 @@
+import time
+import datetime
+import threading
+
+class AvailabilityCache:
+    """
+    Per-counselor free-slot summaries for the next N days.
+    Entries expire after `ttl` seconds and are dropped whenever a booking changes.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, counselor_id, start_date, days):
+        key = str(counselor_id)
+        with self._lock:
+            entry = self._entries.get(key)
+        if not entry:
+            return None
+        computed_at, entry_start, entry_days, availability = entry
+        if time.monotonic() - computed_at > self.ttl or entry_start != start_date or entry_days < days:
+            return None
+        return availability
+
+    def put(self, counselor_id, start_date, days, availability):
+        with self._lock:
+            self._entries[str(counselor_id)] = (time.monotonic(), start_date, days, availability)
+
+    def invalidate(self, counselor_id=None):
+        with self._lock:
+            if counselor_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(counselor_id), None)
+
+def compute_availability(booked_by_date, start_date, days, slots_for_day, now=None):
+    """
+    Free slots per date: {date_str: [slot, ...]} for start_date .. start_date + days - 1.
+    slots_for_day(date) returns the counselor's working slots for that date.
+    Slots that have already started today are not offered.
+    """
+    now = now or datetime.datetime.now()
+    availability = {}
+    for offset in range(days):
+        day = start_date + datetime.timedelta(days=offset)
+        date_str = str(day)
+        booked = booked_by_date.get(date_str, set())
+        free = [s for s in slots_for_day(day) if s not in booked]
+        if day == now.date():
+            current = now.strftime("%H:%M")
+            free = [s for s in free if s > current]
+        availability[date_str] = free
+    return availability
@@ -0,0 +1,71 @@
+import re
+import time
+import bisect
+import secrets
+import datetime
+import threading
+
+# Booking IDs look like "2610-mh1qk2a3b7x4f":
+#   2610       partition: year and month the booking was created (yymm)
+#   mh1qk2a3b  creation time, base36 milliseconds, fixed width so IDs sort by time
+#   7x4f       random, so IDs minted in the same millisecond by different workers differ
+# Bookings are appended in creation order, so the ID column is sorted and a row is
+# found by bisection. Older bookings carry 8-hex-char IDs and are found by scanning.
+
+ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+TIME_WIDTH = 9
+RANDOM_WIDTH = 4
+STRUCTURED_ID = re.compile(r"^\d{4}-[0-9a-z]{%d}$" % (TIME_WIDTH + RANDOM_WIDTH))
+
+# Rows checked either side of the bisection point: workers append a few ms out of order
+NEIGHBOURHOOD = 32
+
+_lock = threading.Lock()
+_last_ms = 0
+
+def _base36(value, width):
+    digits = []
+    while value:
+        value, rem = divmod(value, 36)
+        digits.append(ALPHABET[rem])
+    return "".join(reversed(digits)).rjust(width, "0")
+
+def new_booking_id(now=None):
+    """Time-ordered booking ID; strictly increasing within this process."""
+    global _last_ms
+    now = now if now is not None else time.time()
+    with _lock:
+        ms = max(int(now * 1000), _last_ms + 1)
+        _last_ms = ms
+    partition = datetime.datetime.fromtimestamp(ms / 1000).strftime("%y%m")
+    suffix = "".join(secrets.choice(ALPHABET) for _ in range(RANDOM_WIDTH))
+    return f"{partition}-{_base36(ms, TIME_WIDTH)}{suffix}"
+
+def is_structured(booking_id):
+    return bool(STRUCTURED_ID.match(str(booking_id)))
+
+def partition_of(booking_id):
+    """'yymm' for a structured ID, None for a legacy one."""
+    return str(booking_id)[:4] if is_structured(booking_id) else None
+
+def _sort_key(row):
+    # Legacy and blank IDs sort first; they only occur before the structured rows
+    booking_id = row[0] if row else ""
+    return booking_id if is_structured(booking_id) else ""
+
+def locate(rows, booking_id):
+    """
+    1-based row of `booking_id` in `rows` (a Bookings sheet including its header),
+    or None. Structured IDs are bisected and then checked in a small neighbourhood;
+    legacy IDs, and structured ones out of place (manual edits), fall back to a scan.
+    """
+    booking_id = str(booking_id)
+    if is_structured(booking_id):
+        idx = bisect.bisect_left(rows, booking_id, lo=1, key=_sort_key)
+        for i in range(max(1, idx - NEIGHBOURHOOD), min(len(rows), idx + NEIGHBOURHOOD)):
+            if rows[i] and rows[i][0] == booking_id:
+                return i + 1
+    for i, row in enumerate(rows):
+        if row and row[0] == booking_id:
+            return i + 1
+    return None
@@ -0,0 +1,279 @@
+import os
+import re
+import csv
+import time
+import logging
+import datetime
+from gspread.exceptions import APIError
+from gspread.utils import rowcol_to_a1
+from services.sheets import COUNSELORS_COLUMNS, BOOKINGS_COLUMNS
+from utils import booking_ids
+from utils.json_codec import dumps, loads, JSONDecodeError
+
+logger = logging.getLogger(__name__)
+
+PHONE = re.compile(r"^\d{8,15}$")
+TIME_SLOT = re.compile(r"^\d{2}:\d{2}$")
+TRUTHY = {'TRUE', 'YES', 'Y', '1'}
+FALSY = {'FALSE', 'NO', 'N', '0', ''}
+
+class RowError(ValueError):
+    pass
+
+# --- SCHEMAS ---
+
+def _required(record, field):
+    value = str(record.get(field) or '').strip()
+    if not value:
+        raise RowError(f"{field} is required")
+    return value
+
+def validate_counselor(record):
+    """Counselors row (COUNSELORS_COLUMNS order) for an input record; raises RowError."""
+    active = str(record.get('is_active', 'TRUE')).strip().upper()
+    if active not in TRUTHY | FALSY:
+        raise RowError(f"is_active must be TRUE or FALSE, got '{record.get('is_active')}'")
+    image_url = str(record.get('image_url') or '').strip()
+    if image_url and not image_url.startswith(('http://', 'https://')):
+        raise RowError(f"image_url must be an http(s) URL, got '{image_url}'")
+    return [_required(record, 'id'), _required(record, 'name'), image_url,
+            str(record.get('description') or '').strip(), 'TRUE' if active in TRUTHY else 'FALSE']
+
+def validate_booking(record):
+    """Bookings row (BOOKINGS_COLUMNS order) for an input record; raises RowError."""
+    phone = _required(record, 'user_phone').lstrip('+').replace(' ', '')
+    if not PHONE.match(phone):
+        raise RowError(f"user_phone must be 8-15 digits, got '{record.get('user_phone')}'")
+    date_str = _required(record, 'date')
+    try:
+        datetime.date.fromisoformat(date_str)
+    except ValueError:
+        raise RowError(f"date must be YYYY-MM-DD, got '{date_str}'")
+    time_slot = _required(record, 'time_slot')
+    if not TIME_SLOT.match(time_slot):
+        raise RowError(f"time_slot must be HH:MM, got '{time_slot}'")
+    payment_status = str(record.get('payment_status') or 'PENDING').strip().upper()
+    if payment_status not in ('PENDING', 'PAID'):
+        raise RowError(f"payment_status must be PENDING or PAID, got '{payment_status}'")
+    booking_status = str(record.get('booking_status') or 'ACTIVE').strip().upper()
+    if booking_status not in ('ACTIVE', 'CANCELLED'):
+        raise RowError(f"booking_status must be ACTIVE or CANCELLED, got '{booking_status}'")
+    reschedule_count = str(record.get('reschedule_count') or '').strip()
+    if reschedule_count and not reschedule_count.isdigit():
+        raise RowError(f"reschedule_count must be a whole number, got '{reschedule_count}'")
+    return [_required(record, 'booking_id'), phone, _required(record, 'counselor_id'), date_str, time_slot,
+            payment_status, str(record.get('razorpay_order_id') or '').strip(),
+            str(record.get('timestamp') or '').strip(), booking_status, reschedule_count]
+
+SCHEMAS = {
+    'Counselors': (COUNSELORS_COLUMNS, validate_counselor),
+    'Bookings': (BOOKINGS_COLUMNS, validate_booking),
+}
+
+# --- FILES ---
+
+def file_format(path, explicit=None):
+    fmt = explicit or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in ('csv', 'jsonl'):
+        raise ValueError(f"Unknown format '{fmt}': use .csv or .jsonl (or --format)")
+    return fmt
+
+def read_records(path, fmt):
+    """Yield (line_no, record or error string) without loading the whole file."""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            for line_no, record in enumerate(csv.DictReader(f), start=2):
+                yield line_no, record
+            return
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = loads(line)
+            except JSONDecodeError as e:
+                yield line_no, f"invalid JSON: {e}"
+                continue
+            yield line_no, record if isinstance(record, dict) else "expected a JSON object"
+
+# --- CHECKPOINTS ---
+
+def _read_checkpoint(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return loads(f.read())
+    except (FileNotFoundError, JSONDecodeError):
+        return None
+
+def _write_checkpoint(path, state):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(dumps(state))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+# --- IMPORT / EXPORT ---
+
+class BulkImporter:
+    """
+    Streams a CSV/JSONL file into Counselors or Bookings.
+
+    Rows are validated against the sheet's schema and written `chunk_size` at a
+    time with one batch_update of contiguous ranges (plus in-place ranges for
+    --upsert). Rows whose key (id / booking_id) is already in the sheet are
+    skipped, so a chunk re-sent after a crash isn't duplicated. After every chunk
+    the input position is saved to `<input>.<sheet>.checkpoint`; a later run
+    resumes from there. Invalid rows go to `<input>.rejects.jsonl`.
+
+    Bookings rows must name a counselor in Counselors, and new rows must keep
+    the ID column in order (utils/booking_ids.py bisects it): a time-ordered
+    booking_id older than the newest one already in the sheet, or a legacy ID
+    after time-ordered ones, is rejected. Import history in ID order.
+    """
+
+    def __init__(self, sheet_service, title, chunk_size=500, upsert=False, pause=1.0):
+        if title not in SCHEMAS:
+            raise ValueError(f"Import supports {', '.join(SCHEMAS)}, not {title}")
+        self.sheets = sheet_service
+        self.title = title
+        self.columns, self.validate = SCHEMAS[title]
+        self.chunk_size = chunk_size
+        self.upsert = upsert
+        # Seconds between chunk writes: each chunk is one write and at most one read
+        self.pause = pause
+        self.stats = {"read": 0, "written": 0, "updated": 0, "skipped": 0, "rejected": 0, "chunks": 0}
+        # Bookings only: known counselor IDs and the newest time-ordered booking_id so far
+        self.counselor_ids = None
+        self.tail_id = None
+
+    def _call(self, fn, *args, **kwargs):
+        for attempt in range(5):
+            try:
+                return fn(*args, **kwargs)
+            except APIError as e:
+                if getattr(e, "code", None) != 429 or attempt == 4:
+                    raise
+                time.sleep(2 ** attempt * 5)
+
+    def _sheet_state(self, sheet):
+        """(key -> row, next free row) from one read of the key column."""
+        keys = self._call(sheet.col_values, 1)
+        if not keys:
+            self._call(sheet.batch_update, [{'range': f"A1:{rowcol_to_a1(1, len(self.columns))}", 'values': [self.columns]}])
+            keys = [self.columns[0]]
+        return {k: i + 1 for i, k in enumerate(keys) if k}, len(keys) + 1
+
+    def _check_booking(self, row, keys):
+        if row[2] not in self.counselor_ids:
+            raise RowError(f"counselor_id '{row[2]}' is not in Counselors")
+        if row[0] in keys:
+            # Skipped, or updated in place (--upsert): its position doesn't change
+            return
+        if booking_ids.is_structured(row[0]):
+            if self.tail_id and row[0] < self.tail_id:
+                raise RowError(f"booking_id '{row[0]}' is older than '{self.tail_id}' already in Bookings; "
+                               f"rows must be imported in ID order")
+            self.tail_id = row[0]
+        elif self.tail_id:
+            raise RowError(f"legacy booking_id '{row[0]}' can't follow time-ordered IDs; import legacy bookings first")
+
+    def _write_chunk(self, sheet, rows, keys, next_row):
+        data = []
+        new_rows = []
+        for row in rows:
+            existing = keys.get(row[0])
+            if existing is None:
+                keys[row[0]] = -1
+                new_rows.append(row)
+            elif self.upsert and existing > 1:
+                data.append({'range': f"A{existing}:{rowcol_to_a1(existing, len(row))}", 'values': [row]})
+                self.stats["updated"] += 1
+            else:
+                self.stats["skipped"] += 1
+        if new_rows:
+            # The bot may have appended since our last read; never write over a row
+            if self._call(sheet.row_values, next_row):
+                keys_now, next_row = self._sheet_state(sheet)
+                keys.update(keys_now)
+            end = next_row + len(new_rows) - 1
+            if end > sheet.row_count:
+                self._call(sheet.add_rows, end - sheet.row_count)
+            data.append({'range': f"A{next_row}:{rowcol_to_a1(end, len(self.columns))}", 'values': new_rows})
+            for offset, row in enumerate(new_rows):
+                keys[row[0]] = next_row + offset
+            next_row = end + 1
+            self.stats["written"] += len(new_rows)
+        if data:
+            self._call(sheet.batch_update, data)
+        return next_row
+
+    def run(self, path, fmt=None, resume=True):
+        fmt = file_format(path, fmt)
+        checkpoint_path = f"{path}.{self.title}.checkpoint"
+        rejects_path = f"{path}.rejects.jsonl"
+        state = _read_checkpoint(checkpoint_path) if resume else None
+        done_through = state["line"] if state else 0
+        if state:
+            self.stats.update(state["stats"])
+            logger.info(f"Resuming {path} after line {done_through}")
+
+        sheet = self._call(self.sheets.spreadsheet.worksheet, self.title)
+        keys, next_row = self._sheet_state(sheet)
+        if self.title == 'Bookings':
+            counselors = self._call(self.sheets.spreadsheet.worksheet, 'Counselors')
+            self.counselor_ids = set(self._call(counselors.col_values, 1)[1:])
+            self.tail_id = max((k for k in keys if booking_ids.is_structured(k)), default=None)
+        chunk, last_line = [], done_through
+        with open(rejects_path, 'a' if state else 'w', encoding='utf-8') as rejects:
+            def flush():
+                nonlocal chunk, next_row
+                rejects.flush()
+                if chunk:
+                    next_row = self._write_chunk(sheet, chunk, keys, next_row)
+                    self.stats["chunks"] += 1
+                    chunk = []
+                    if self.pause:
+                        time.sleep(self.pause)
+                _write_checkpoint(checkpoint_path, {"line": last_line, "stats": self.stats})
+
+            for line_no, record in read_records(path, fmt):
+                if line_no <= done_through:
+                    continue
+                self.stats["read"] += 1
+                last_line = line_no
+                try:
+                    if isinstance(record, str):
+                        raise RowError(record)
+                    row = self.validate(record)
+                    if self.title == 'Bookings':
+                        self._check_booking(row, keys)
+                    chunk.append(row)
+                except RowError as e:
+                    self.stats["rejected"] += 1
+                    rejects.write(dumps({"line": line_no, "error": str(e), "record": record}) + "\n")
+                if len(chunk) >= self.chunk_size:
+                    flush()
+            flush()
+        os.remove(checkpoint_path)
+        return dict(self.stats)
+
+def export_sheet(sheet_service, title, path, fmt=None, chunk_size=1000):
+    """Write a worksheet to CSV/JSONL with one values read; returns the row count."""
+    fmt = file_format(path, fmt)
+    values = sheet_service.spreadsheet.worksheet(title).get_all_values()
+    if not values:
+        return 0
+    header, rows = values[0], values[1:]
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(header)
+        for start in range(0, len(rows), chunk_size):
+            block = rows[start:start + chunk_size]
+            if writer:
+                writer.writerows(block)
+            else:
+                f.write("".join(dumps(dict(zip(header, r + [''] * (len(header) - len(r))))) + "\n" for r in block))
+    os.replace(tmp, path)
+    return len(rows)
@@ -0,0 +1,103 @@
+import os
+import time
+import inspect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict
+
+# Request-scoped deadlines. A webhook or Flow request starts one on entry; every
+# Sheets, Graph and Razorpay call made on its behalf uses what is left of it as
+# its timeout, so a hung dependency costs one request's budget instead of a
+# worker thread. Contextvars don't cross into thread pools on their own: hand
+# work to another thread with bind(fn) (asyncio.to_thread already copies them).
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "10"))
+FLOW_DEADLINE_SECONDS = float(os.getenv("FLOW_DEADLINE_SECONDS", "8"))
+# Calls that must still happen after the deadline (the user's reply, a booking
+# write) get at least this long rather than being dropped
+MIN_IO_TIMEOUT = float(os.getenv("MIN_IO_TIMEOUT_SECONDS", "2"))
+# Nice-to-have work (a counselor photo, an intro message) is skipped with less left than this
+OPTIONAL_WORK_SECONDS = float(os.getenv("OPTIONAL_WORK_SECONDS", "3"))
+
+_current = contextvars.ContextVar("request_deadline", default=None)
+_misses = defaultdict(int)
+_lock = threading.Lock()
+
+class Deadline:
+    def __init__(self, seconds, name="request"):
+        self.name = name
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+@contextmanager
+def scope(seconds=None, name="request"):
+    """Run the block under a new deadline `seconds` from now."""
+    token = _current.set(Deadline(REQUEST_DEADLINE_SECONDS if seconds is None else seconds, name))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+def within(seconds=None, name="request"):
+    """Decorator: run a view (sync or async) under scope(seconds, name)."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with scope(seconds, name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with scope(seconds, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def current():
+    return _current.get()
+
+def remaining(default=None):
+    """Seconds left on the current deadline, or `default` outside a request."""
+    deadline = _current.get()
+    return deadline.remaining() if deadline else default
+
+def record_miss(op):
+    with _lock:
+        _misses[op] += 1
+
+def timeout(op, default, floor=MIN_IO_TIMEOUT):
+    """
+    Timeout for one outbound call: `default`, cut to the time left on the
+    request's deadline. A call that no longer fits is counted as a miss for `op`
+    and still gets `floor` seconds.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left < floor:
+        record_miss(op)
+        return min(default, floor)
+    return min(default, left)
+
+def has_budget(op, needed=OPTIONAL_WORK_SECONDS):
+    """False (and a miss for `op`) if less than `needed` seconds are left; callers skip optional work."""
+    left = remaining()
+    if left is None or left >= needed:
+        return True
+    record_miss(op)
+    return False
+
+def bind(fn):
+    """`fn` wrapped to run in a copy of the caller's context (deadline included), e.g. on another thread."""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+def stats():
+    with _lock:
+        return dict(_misses)
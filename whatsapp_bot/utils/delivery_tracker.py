@@ -0,0 +1,150 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds (ms); the last bucket is open-ended
+BUCKETS_MS = [100, 250, 500, 1000, 2000, 5000, 10000, 30000, 60000]
+
+# An outgoing message counts as the reply to the user's last inbound message within this window
+REPLY_WINDOW_SECONDS = 120
+
+def message_kind(message_data):
+    """text / list / buttons / flow / image ... for a Graph API message body."""
+    kind = message_data.get("type", "text")
+    if kind == "interactive":
+        kind = message_data.get("interactive", {}).get("type", "interactive")
+        if kind == "button":
+            kind = "buttons"
+    return kind
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS_MS, max(0.0, seconds) * 1000)] += 1
+        self.total += 1
+
+    def percentile(self, p):
+        """Upper bound (ms) of the bucket holding the p-th percentile; None past the last bound."""
+        if not self.total:
+            return None
+        rank = p * self.total
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS_MS[idx] if idx < len(BUCKETS_MS) else None
+        return None
+
+    def snapshot(self):
+        labels = [f"<={b}ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.total,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "buckets": {label: c for label, c in zip(labels, self.counts) if c}
+        }
+
+class DeliveryTracker:
+    """
+    Correlates outgoing messages with their status webhooks (sent, delivered,
+    read, failed) by wamid, and with the inbound message they answer.
+
+    Keeps at most `max_messages` in-flight messages and `max_phones` last-inbound
+    times (oldest evicted first). Per message kind it reports latency histograms
+    for inbound->send (our processing), send->delivered (Meta + network) and
+    inbound->delivered (what the user waits), plus send/delivery failure rates.
+    Status timestamps from Meta have one-second resolution.
+    """
+
+    def __init__(self, max_messages=None, max_phones=None):
+        self.max_messages = max_messages or int(os.getenv("DELIVERY_TRACKER_MAX_MESSAGES", "20000"))
+        self.max_phones = max_phones or int(os.getenv("DELIVERY_TRACKER_MAX_PHONES", "20000"))
+        self._messages = OrderedDict()
+        self._last_inbound = OrderedDict()
+        self._lock = threading.Lock()
+        self.histograms = defaultdict(lambda: {
+            "inbound_to_send": LatencyHistogram(),
+            "send_to_delivered": LatencyHistogram(),
+            "inbound_to_delivered": LatencyHistogram()
+        })
+        self.counts = defaultdict(lambda: {"sent": 0, "send_failed": 0, "delivered": 0, "read": 0, "failed": 0})
+        self.unmatched_statuses = 0
+
+    def note_inbound(self, phone, received_at=None):
+        with self._lock:
+            self._last_inbound[phone] = received_at or time.time()
+            self._last_inbound.move_to_end(phone)
+            if len(self._last_inbound) > self.max_phones:
+                self._last_inbound.popitem(last=False)
+
+    def record_send(self, phone, kind, response, sent_at):
+        """Called by WhatsAppAPI after every send with the Graph response (None on failure)."""
+        kind = kind or "unknown"
+        try:
+            wamid = response["messages"][0]["id"]
+        except (TypeError, KeyError, IndexError):
+            with self._lock:
+                self.counts[kind]["send_failed"] += 1
+            return
+        with self._lock:
+            inbound_at = self._last_inbound.get(phone)
+            if inbound_at is not None and not 0 <= sent_at - inbound_at <= REPLY_WINDOW_SECONDS:
+                inbound_at = None
+            self._messages[wamid] = {"kind": kind, "sent_at": sent_at, "inbound_at": inbound_at}
+            if len(self._messages) > self.max_messages:
+                self._messages.popitem(last=False)
+            self.counts[kind]["sent"] += 1
+            if inbound_at is not None:
+                self.histograms[kind]["inbound_to_send"].observe(sent_at - inbound_at)
+
+    def ingest(self, statuses):
+        """Apply the `value.statuses` entries of a webhook body."""
+        for status in statuses:
+            wamid = status.get("id")
+            state = status.get("status")
+            try:
+                ts = float(status.get("timestamp"))
+            except (TypeError, ValueError):
+                ts = time.time()
+            with self._lock:
+                entry = self._messages.get(wamid)
+                if entry is None:
+                    self.unmatched_statuses += 1
+                    continue
+                kind = entry["kind"]
+                if state == "delivered" and "delivered_at" not in entry:
+                    entry["delivered_at"] = ts
+                    self.counts[kind]["delivered"] += 1
+                    self.histograms[kind]["send_to_delivered"].observe(ts - entry["sent_at"])
+                    if entry["inbound_at"] is not None:
+                        self.histograms[kind]["inbound_to_delivered"].observe(ts - entry["inbound_at"])
+                elif state == "read":
+                    self.counts[kind]["read"] += 1
+                    # Read receipts are the last status we get for a message
+                    self._messages.pop(wamid, None)
+                elif state == "failed":
+                    self.counts[kind]["failed"] += 1
+                    errors = status.get("errors") or [{}]
+                    logger.warning(f"Message {wamid} ({kind}) failed: {errors[0].get('code')} {errors[0].get('title')}")
+                    self._messages.pop(wamid, None)
+
+    def report(self):
+        with self._lock:
+            kinds = {}
+            for kind, counts in self.counts.items():
+                attempted = counts["sent"] + counts["send_failed"]
+                kinds[kind] = {
+                    **counts,
+                    "send_failure_rate": counts["send_failed"] / attempted if attempted else 0.0,
+                    "delivery_failure_rate": counts["failed"] / counts["sent"] if counts["sent"] else 0.0,
+                    "latency": {name: h.snapshot() for name, h in self.histograms[kind].items()}
+                }
+            return {"tracked_messages": len(self._messages), "unmatched_statuses": self.unmatched_statuses, "kinds": kinds}
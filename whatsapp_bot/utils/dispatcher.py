@@ -0,0 +1,70 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils import deadline
+
+logger = logging.getLogger(__name__)
+
+class MessageDispatcher:
+    """
+    Per-user actor queues on a shared worker pool.
+
+    submit(key, fn, *args) appends the call to the queue for `key` (the user's
+    phone) and returns a Future. At most one worker drains a given queue at a
+    time, so calls for one user run strictly in arrival order while different
+    users run in parallel. A worker hands its queue back to the pool after
+    `batch` calls so a chatty user can't starve others, and a queue is dropped
+    as soon as it is empty, so idle users hold no memory.
+
+    Each call runs under its own deadline of `deadline_seconds`, started when it
+    leaves the queue: a message queued behind others still gets a full budget
+    for its Sheets and Razorpay writes.
+    """
+
+    def __init__(self, workers=8, batch=4, deadline_seconds=None):
+        self.batch = batch
+        self.deadline_seconds = deadline_seconds
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dispatch")
+
+    def submit(self, key, fn, *args):
+        future = Future()
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is None:
+                # No queue means nobody is draining this key: start a drain
+                self._queues[key] = deque([(fn, args, future)])
+                self._executor.submit(self._drain, key)
+            else:
+                queue.append((fn, args, future))
+        return future
+
+    def _drain(self, key):
+        for _ in range(self.batch):
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                fn, args, future = queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with deadline.scope(self.deadline_seconds, "dispatch"):
+                    result = fn(*args)
+                future.set_result(result)
+            except Exception as e:
+                logger.error(f"Dispatched call for {key} failed: {e}")
+                future.set_exception(e)
+        # Yield to other users; this key keeps its place via a fresh drain task
+        self._executor.submit(self._drain, key)
+
+    def pending(self):
+        """Queued calls per active key (for diagnostics)."""
+        with self._lock:
+            return {key: len(queue) for key, queue in self._queues.items()}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
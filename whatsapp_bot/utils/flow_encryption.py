@@ -1,6 +1,6 @@
 import os
-import json
 import base64
+from utils.json_codec import dumps_bytes, loads
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
@@ -45,7 +45,7 @@ def decrypt_request(body, private_key_pem):
     ).decryptor()
     
     decrypted_data_bytes = decryptor.update(encrypted_flow_data_body) + decryptor.finalize()
-    decrypted_data = json.loads(decrypted_data_bytes.decode("utf-8"))
+    decrypted_data = loads(decrypted_data_bytes)
     
     return decrypted_data, aes_key, iv
 
@@ -64,7 +64,7 @@ def encrypt_response(response, aes_key, iv):
     
     # Return Base64(Ciphertext + Tag) - NO IV PREPENDED
     return base64.b64encode(
-        encryptor.update(json.dumps(response).encode("utf-8")) +
+        encryptor.update(dumps_bytes(response)) +
         encryptor.finalize() +
         encryptor.tag
     ).decode("utf-8")
@@ -1,16 +1,24 @@
 import logging
 import datetime
-import uuid
 import os
+from concurrent.futures import ThreadPoolExecutor
 from services.sheets import GoogleSheetsService
 from services.whatsapp_api import WhatsAppAPI
 from services.razorpay_api import RazorpayAPI
+from services.media_manager import MediaManager
+from utils import message_templates
+from utils import deadline
+from utils.session_store import SessionStore
+from utils.flow_tokens import FlowTokenRegistry
+from utils.booking_ids import new_booking_id
+from utils.waitlist import Waitlist, CLAIM_PREFIX, PASS_PREFIX
 
 logger = logging.getLogger(__name__)
 
 # Simple in-memory state management
 # structure: { "phone_number": { "state": "STATE_NAME", "data": {...} } }
-user_sessions = {}
+# With SESSION_SNAPSHOT_PATH set, sessions survive restarts (see SessionStore)
+user_sessions = SessionStore(os.getenv("SESSION_SNAPSHOT_PATH"), ttl=int(os.getenv("SESSION_TTL_SECONDS", "3600")))
 
 # States
 STATE_START = "START"
@@ -21,12 +29,35 @@ STATE_RESCHEDULE_SELECT = "RESCHEDULE_SELECT"
 STATE_RESCHEDULE_DATE = "RESCHEDULE_DATE"
 STATE_RESCHEDULE_SLOT = "RESCHEDULE_SLOT"
 
+# How many days ahead we look for free slots when offering dates
+LOOKAHEAD_DAYS = int(os.getenv("AVAILABILITY_LOOKAHEAD_DAYS", "7"))
+# Session price (₹500)
+BOOKING_AMOUNT_PAISE = 50000
+
 class FlowHandler:
-    def __init__(self, sheet_service: GoogleSheetsService):
+    def __init__(self, sheet_service: GoogleSheetsService, wa_api: WhatsAppAPI = None, rz_api: RazorpayAPI = None,
+                 media: MediaManager = None):
         self.sheets = sheet_service
         self.sheets.connect()
-        self.wa_api = WhatsAppAPI()
-        self.rz_api = RazorpayAPI()
+        self.wa_api = wa_api or WhatsAppAPI()
+        self.rz_api = rz_api or RazorpayAPI()
+        self.media = media or MediaManager(self.wa_api)
+        # Booking Flows in flight; sending one prefetches what its screens will ask for
+        self.flow_tokens = FlowTokenRegistry()
+        self._prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="flow-prefetch")
+        # Users waiting for a full day; offered slots that cancellations and reschedules free up
+        self.waitlist = Waitlist(self)
+        self.sheets.slot_listeners.append(self.waitlist.slot_freed)
+
+    def handle_incoming(self, user_phone, message_body, flow_response=None):
+        """One parsed webhook message: a Flow reply, a text/interactive message, or both."""
+        response = None
+        if flow_response is not None:
+            logger.info(f"Flow Response: {flow_response}")
+            response = self.process_flow_booking(user_phone, flow_response)
+        if message_body is not None:
+            response = self.handle_message(user_phone, message_body)
+        return response
 
     def handle_message(self, user_phone, message_body):
         # Normalize state
@@ -40,6 +71,13 @@ class FlowHandler:
             user_sessions[user_phone] = {"state": STATE_START, "data": {}}
             return self.send_welcome_menu(user_phone)
 
+        # Waitlist buttons work from any state
+        if message_body == message_templates.WAITLIST_JOIN_BUTTON["id"]:
+            return self.join_waitlist(user_phone)
+        if message_body.startswith(CLAIM_PREFIX):
+            return self.claim_waitlist_offer(user_phone, message_body[len(CLAIM_PREFIX):])
+        if message_body.startswith(PASS_PREFIX):
+            return self.pass_waitlist_offer(user_phone, message_body[len(PASS_PREFIX):])
 
         # 2. STATE HANDLERS
         if current_state == STATE_START:
@@ -82,10 +120,12 @@ class FlowHandler:
             booking_id = message_body.strip()
             # Validate booking belongs to user
             active_bookings = self.sheets.get_user_active_bookings(user_phone)
-            if any(b['booking_id'] == booking_id for b in active_bookings):
+            booking = next((b for b in active_bookings if b['booking_id'] == booking_id), None)
+            if booking:
                 user_sessions[user_phone]["data"]["reschedule_booking_id"] = booking_id
+                user_sessions[user_phone]["data"]["reschedule_counselor_id"] = booking['counselor_id']
                 user_sessions[user_phone]["state"] = STATE_RESCHEDULE_DATE
-                return self.send_reschedule_date_selection(user_phone)
+                return self.send_reschedule_date_selection(user_phone, booking['counselor_id'])
             else:
                 self.wa_api.send_text(user_phone, "Invalid booking selection. Please try again.")
                 return {"status": "error", "msg": "invalid_booking"}
@@ -96,12 +136,14 @@ class FlowHandler:
             if selected_date:
                 user_sessions[user_phone]["data"]["new_date"] = selected_date
                 user_sessions[user_phone]["state"] = STATE_RESCHEDULE_SLOT
-                # Get counselor from original booking
-                booking_id = user_sessions[user_phone]["data"]["reschedule_booking_id"]
-                bookings = self.sheets.get_user_active_bookings(user_phone)
-                original_booking = next((b for b in bookings if b['booking_id'] == booking_id), None)
-                if original_booking:
-                    counselor_id = original_booking['counselor_id']
+                # Get counselor from original booking (remembered when it was selected)
+                counselor_id = user_sessions[user_phone]["data"].get("reschedule_counselor_id")
+                if counselor_id is None:
+                    booking_id = user_sessions[user_phone]["data"]["reschedule_booking_id"]
+                    bookings = self.sheets.get_user_active_bookings(user_phone)
+                    original_booking = next((b for b in bookings if b['booking_id'] == booking_id), None)
+                    counselor_id = original_booking['counselor_id'] if original_booking else None
+                if counselor_id is not None:
                     return self.send_reschedule_slot_selection(user_phone, selected_date, counselor_id)
                 else:
                     self.wa_api.send_text(user_phone, "Error finding booking. Please start over.")
@@ -132,44 +174,17 @@ class FlowHandler:
         booking_count = user_status['booking_count']
         has_active = len(user_status['active_bookings']) > 0
         
-        buttons = []
-        body_text = "Welcome to Serenity Wellness Center! 🌿\n\nHow can we help you today?"
-        
         # Logic: 
         # - If user has < 5 bookings, allow new bookings
         # - If user has active bookings, allow reschedule
         # - Always show Talk to Us
-        
-        if booking_count < 5:
-            buttons.append({"id": "book_btn", "title": "📅 Book Appointment"})
-        else:
-            # User at limit
-            body_text = "Welcome back! 🌿\n\nYou've reached your booking limit (5 bookings). You can reschedule existing appointments."
-        
-        if has_active:
-            buttons.append({"id": "reschedule_btn", "title": "🔄 Reschedule"})
-        
-        buttons.append({"id": "talk_btn", "title": "💬 Talk to Us"})
-        
-        # WhatsApp allows max 3 buttons, we should be safe
-        self.wa_api.send_interactive_buttons(
-            phone,
-            body_text,
-            buttons,
-            footer_text="Your wellness journey starts here"
-        )
+        # All four variants are prebuilt (max 3 buttons each)
+        self.wa_api.send_template(phone, message_templates.welcome_menu(booking_count < 5, has_active))
         return {"status": "sent_welcome"}
 
     def send_contact_info(self, phone):
         """Send contact information when user selects 'Talk to Us'"""
-        contact_message = (
-            "📞 *Contact Us*\\n\\n"
-            "We'd love to hear from you! Reach us at:\\n\\n"
-            "📧 Email: support@serenitywellness.com\\n"
-            "📱 Phone: +91 98765 43210\\n\\n"
-            "Our team is available Mon-Sat, 9 AM - 6 PM"
-        )
-        self.wa_api.send_text(phone, contact_message)
+        self.wa_api.send_template(phone, message_templates.CONTACT_INFO)
         # Reset to START state so they can choose again
         user_sessions[phone] = {"state": STATE_START, "data": {}}
         return {"status": "sent_contact_info"}
@@ -208,6 +223,9 @@ class FlowHandler:
             "department": department_data
         }
         
+        flow_token = self.flow_tokens.issue(phone)
+        self.prefetch_for_flow(flow_token)
+
         self.wa_api.send_flow_message(
             phone,
             flow_id,
@@ -215,36 +233,38 @@ class FlowHandler:
             "Book Your Session",
             "Select your counselor and schedule your appointment.",
             "Serenity Wellness Center",
-            flow_data=flow_data
+            flow_data=flow_data,
+            flow_token=flow_token
         )
         
         # We don't set local state yet, we wait for flow completion
         return {"status": "sent_flow_start"}
 
     def send_date_selection(self, phone):
-        today = datetime.date.today()
-        # Max 3 buttons allowed
-        dates = [
-            {"id": str(today), "title": "Today"},
-            {"id": str(today + datetime.timedelta(days=1)), "title": "Tomorrow"},
-            {"id": str(today + datetime.timedelta(days=2)), "title": "Day After"}
-        ]
-        
-        self.wa_api.send_interactive_buttons(
-            phone,
-            "Please select a date for your appointment:",
-            dates
-        )
+        counselor_id = user_sessions[phone]["data"].get("counselor_id")
+        dates = self.get_available_dates(counselor_id)
+        if not dates:
+            self.wa_api.send_text(
+                phone,
+                f"Sorry, there are no free slots in the next {LOOKAHEAD_DAYS} days. Type 'Hi' to choose another counselor."
+            )
+            user_sessions[phone] = {"state": STATE_START, "data": {}}
+            return {"status": "no_dates"}
+
+        template = message_templates.date_choices(tuple(dates), message_templates.DATE_PROMPT, datetime.date.today())
+        self.wa_api.send_template(phone, template)
         return {"status": "sent_date_buttons"}
 
     def send_slot_selection(self, phone, date_str):
         counselor_id = user_sessions[phone]["data"].get("counselor_id")
-        all_slots = ["09:00", "10:00", "11:00", "12:00", "14:00", "15:00", "16:00"]
-        booked = self.sheets.get_bookings_for_date(date_str, counselor_id)
-        available = [s for s in all_slots if s not in booked]
+        available = self.get_available_slots(counselor_id, date_str, phone)
         
         if not available:
-            self.wa_api.send_text(phone, f"No slots available on {date_str}. Please choose another date.")
+            self.wa_api.send_interactive_buttons(
+                phone,
+                f"No slots available on {date_str}. Please choose another date, or tap below and we'll message you if one opens up.",
+                [message_templates.WAITLIST_JOIN_BUTTON]
+            )
             return {"status": "no_slots"}
         
         # Interactive List for Slots
@@ -261,8 +281,8 @@ class FlowHandler:
 
     def generate_payment_link(self, phone):
         data = user_sessions[phone]["data"]
-        booking_id = str(uuid.uuid4())[:8]
-        amount_paise = 50000 
+        booking_id = new_booking_id()
+        amount_paise = BOOKING_AMOUNT_PAISE
         
         # Razorpay Link
         link = self.rz_api.create_payment_link(
@@ -288,6 +308,10 @@ class FlowHandler:
     
     def process_flow_booking(self, phone, flow_data):
         """Process booking from WhatsApp Flow response"""
+        issued = self.flow_tokens.pop(flow_data.get('flow_token'))
+        if issued and issued["phone"] != phone:
+            logger.warning(f"Flow token issued to {issued['phone']} completed by {phone}")
+
         # New Flow returns: { "counsellor": "..." }
         counselor_id = flow_data.get('counsellor') or flow_data.get('counsellor_id') or flow_data.get('counselor_id')
         
@@ -302,12 +326,153 @@ class FlowHandler:
         # Save Counselor ID
         user_sessions[phone]["data"]["counselor_id"] = counselor_id
         user_sessions[phone]["state"] = STATE_SELECT_DATE
-        
+
+        # Date and slot were picked inside the Flow (DATE_SELECT / SLOT_SELECT screens)
+        date_str, slot = flow_data.get('date'), flow_data.get('slot')
+        if date_str and slot:
+            if slot in self.get_available_slots(counselor_id, date_str, phone):
+                user_sessions[phone]["data"]["date"] = date_str
+                user_sessions[phone]["data"]["time_slot"] = slot
+                user_sessions[phone]["state"] = STATE_PAYMENT
+                return self.generate_payment_link(phone)
+            self.wa_api.send_text(phone, f"Sorry, {date_str} {slot} was just taken. Please choose another time.")
+            return self.send_date_selection(phone)
+
         # Acknowledge and Ask for Date (Hybrid approach: Flow -> Interactive Buttons)
-        self.wa_api.send_text(phone, f"Great! You selected counselor ID: {counselor_id}")
+        # The intro is a courtesy; the date list is what the user needs
+        if deadline.has_budget("flow.counselor_intro"):
+            self.send_counselor_intro(phone, counselor_id)
         return self.send_date_selection(phone)
 
+    def send_counselor_intro(self, phone, counselor_id):
+        counselor = self.get_counselor(counselor_id)
+        if not counselor:
+            return self.wa_api.send_text(phone, f"Great! You selected counselor ID: {counselor_id}")
+        caption = f"Great! You selected *{counselor['name']}*\n{counselor['description']}"
+        return self.send_counselor_image(phone, counselor, caption)
+
+    def send_payment_confirmation(self, phone, booking_id, wa_api=None):
+        """Sent through `wa_api` (default self.wa_api); with AsyncWhatsAppAPI the result is awaitable."""
+        wa_api = wa_api or self.wa_api
+        caption = f"✅ Payment Received! Your Booking {booking_id} is Confirmed."
+        if not deadline.has_budget("payment.confirmation_image"):
+            # Short on time: the confirmation itself, without the counselor lookup and photo
+            return wa_api.send_text(phone, caption)
+        row = self.sheets.find_booking_row(booking_id)
+        counselor = self.get_counselor(self.sheets.cache.values('Bookings')[row - 1][2]) if row else None
+        if not counselor:
+            return wa_api.send_text(phone, caption)
+        return self.send_counselor_image(phone, counselor, caption, wa_api)
+
+    def send_counselor_image(self, phone, counselor, caption, wa_api=None):
+        """Counselor photo by uploaded media ID; text only until the upload is cached."""
+        wa_api = wa_api or self.wa_api
+        media_id = self.media.media_id_for(counselor.get('image_url'))
+        if media_id:
+            return wa_api.send_image(phone, media_id=media_id, caption=caption)
+        return wa_api.send_text(phone, caption)
+
+    # --- WAITLIST ---
+    def join_waitlist(self, phone):
+        data = user_sessions[phone]["data"]
+        counselor_id, date_str = data.get("counselor_id"), data.get("date")
+        if not counselor_id or not date_str:
+            self.wa_api.send_text(phone, "Please pick a counselor and date first. Type 'Hi' to start.")
+            return {"status": "waitlist_no_selection"}
+        self.waitlist.join(phone, counselor_id, date_str)
+        position = self.waitlist.position(phone, counselor_id, date_str)
+        self.wa_api.send_text(
+            phone,
+            f"🔔 You're #{position} on the waitlist for {date_str}. We'll message you as soon as a slot opens up."
+        )
+        user_sessions[phone] = {"state": STATE_START, "data": {}}
+        return {"status": "waitlist_joined", "position": position}
+
+    def claim_waitlist_offer(self, phone, offer_id):
+        claimed = self.waitlist.claim(phone, offer_id)
+        if not claimed:
+            self.wa_api.send_text(phone, "Sorry, that slot is no longer held for you. Type 'Hi' to see other times.")
+            return {"status": "waitlist_offer_expired"}
+        counselor_id, date_str, slot = claimed
+        user_sessions[phone] = {
+            "state": STATE_PAYMENT,
+            "data": {"counselor_id": counselor_id, "date": date_str, "time_slot": slot}
+        }
+        return self.generate_payment_link(phone)
+
+    def pass_waitlist_offer(self, phone, offer_id):
+        if self.waitlist.decline(phone, offer_id):
+            self.wa_api.send_text(phone, "No problem, we've offered the slot to the next person. Type 'Hi' to book another time.")
+        return {"status": "waitlist_offer_passed"}
+
+    # --- FLOW PREFETCH ---
+    def prefetch_for_flow(self, flow_token, counselor_ids=None):
+        """
+        Warm the caches the Flow behind `flow_token` will read, in the background.
+        Without `counselor_ids` this ranks counselors for INIT (the ones the user
+        has active bookings with first) and loads every active counselor's
+        availability, which the date/slot screens and process_flow_booking read
+        through get_available_dates/slots; the data_exchange screens pass the
+        picked counselor to keep its availability fresh.
+        """
+        entry = self.flow_tokens.get(flow_token)
+        if entry is None:
+            return None
+        pending = entry["prefetch"]
+        if pending is not None and not pending.done():
+            return pending
+        entry["prefetch"] = self._prefetcher.submit(self._prefetch, entry, counselor_ids)
+        return entry["prefetch"]
+
+    def _prefetch(self, entry, counselor_ids):
+        try:
+            if counselor_ids is None:
+                active = self.sheets.get_user_active_bookings(entry["phone"])
+                own = [str(b.get('counselor_id')) for b in active]
+                others = [str(c['id']) for c in self.sheets.get_active_counselors()]
+                counselor_ids = list(dict.fromkeys(own + others))
+                entry["counselor_order"] = counselor_ids
+            for counselor_id in counselor_ids:
+                self.sheets.get_availability(counselor_id, LOOKAHEAD_DAYS)
+        except Exception as e:
+            logger.error(f"Flow prefetch for {entry['phone']} failed: {e}")
+
+    def counselors_for_flow(self, flow_token):
+        """Active counselors for the Flow's INIT screen, the user's own counselors first."""
+        counselors = self.sheets.get_active_counselors()
+        entry = self.flow_tokens.get(flow_token)
+        order = entry.get("counselor_order") if entry else None
+        if not order:
+            return counselors
+        rank = {counselor_id: i for i, counselor_id in enumerate(order)}
+        return sorted(counselors, key=lambda c: rank.get(str(c['id']), len(rank)))
+
     # --- HELPERS ---
+    def get_counselor(self, counselor_id):
+        for counselor in self.sheets.get_active_counselors():
+            if str(counselor['id']) == str(counselor_id):
+                return counselor
+        return None
+
+    def get_available_dates(self, counselor_id):
+        """Dates in the lookahead window that still have at least one free slot."""
+        availability = self.sheets.get_availability(counselor_id, LOOKAHEAD_DAYS)
+        return [d for d, slots in availability.items() if slots]
+
+    def get_available_slots(self, counselor_id, date_str, phone=None):
+        """Free slots on a day, minus those leased to another user's waitlist offer."""
+        leased = self.waitlist.leased_slots(counselor_id, date_str, phone)
+        availability = self.sheets.get_availability(counselor_id, LOOKAHEAD_DAYS)
+        if date_str in availability:
+            return [s for s in availability[date_str] if s not in leased] if leased else availability[date_str]
+        # Typed date outside the lookahead window
+        try:
+            all_slots = self.sheets.get_slot_calendar().slots_for(counselor_id, date_str)
+        except ValueError:
+            return []
+        booked = self.sheets.get_bookings_for_date(date_str, counselor_id)
+        return [s for s in all_slots if s not in booked and s not in leased]
+
     def parse_counselor_selection(self, text):
         return text.split('.')[0].strip()
 
@@ -367,27 +532,24 @@ class FlowHandler:
         user_sessions[phone]["state"] = STATE_RESCHEDULE_SELECT
         return {"status": "sent_reschedule_options"}
     
-    def send_reschedule_date_selection(self, phone):
+    def send_reschedule_date_selection(self, phone, counselor_id):
         """Send date options for rescheduling."""
-        today = datetime.date.today()
-        dates = [
-            {"id": str(today), "title": "Today"},
-            {"id": str(today + datetime.timedelta(days=1)), "title": "Tomorrow"},
-            {"id": str(today + datetime.timedelta(days=2)), "title": "Day After"}
-        ]
-        
-        self.wa_api.send_interactive_buttons(
-            phone,
-            "Select a new date for your appointment:",
-            dates
-        )
+        dates = self.get_available_dates(counselor_id)
+        if not dates:
+            self.wa_api.send_text(
+                phone,
+                f"Sorry, your counselor has no free slots in the next {LOOKAHEAD_DAYS} days. Type 'Hi' to start over."
+            )
+            user_sessions[phone] = {"state": STATE_START, "data": {}}
+            return {"status": "no_dates"}
+
+        template = message_templates.date_choices(tuple(dates), message_templates.RESCHEDULE_DATE_PROMPT, datetime.date.today())
+        self.wa_api.send_template(phone, template)
         return {"status": "sent_reschedule_date"}
     
     def send_reschedule_slot_selection(self, phone, date_str, counselor_id):
         """Send available time slots for rescheduling."""
-        all_slots = ["09:00", "10:00", "11:00", "12:00", "14:00", "15:00", "16:00"]
-        booked = self.sheets.get_bookings_for_date(date_str, counselor_id)
-        available = [s for s in all_slots if s not in booked]
+        available = self.get_available_slots(counselor_id, date_str, phone)
         
         if not available:
             self.wa_api.send_text(phone, f"No slots available on {date_str}. Please choose another date.")
@@ -0,0 +1,136 @@
+import os
+import time
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from utils.message_templates import date_title
+from utils import deadline
+from utils.webhook_parsing import build_data_exchange_response, build_init_response
+
+logger = logging.getLogger(__name__)
+
+# Screens of the booking Flow (see flow_schema.json):
+# COUNSELLOR_SELECT -> DATE_SELECT -> SLOT_SELECT -> complete (nfm_reply webhook)
+SCREEN_COUNSELLOR = "COUNSELLOR_SELECT"
+SCREEN_DATE = "DATE_SELECT"
+SCREEN_SLOT = "SLOT_SELECT"
+
+# Dropdown option limit we stay under
+MAX_OPTIONS = 20
+
+# Sent by the COUNSELLOR_SELECT screen of flow_schema.json (payload "flow_version").
+# Published Flows without it end after the counselor pick and get the SUCCESS response.
+FLOW_VERSION_IN_FLOW_BOOKING = "2"
+
+def build_date_select_response(counselor_id, dates, today, error_message=None):
+    data = {
+        "counsellor": str(counselor_id),
+        "dates": [{"id": d, "title": date_title(d, today)} for d in dates[:MAX_OPTIONS]]
+    }
+    if error_message:
+        data["error_message"] = error_message
+    return {"screen": SCREEN_DATE, "data": data}
+
+def build_slot_select_response(counselor_id, date_str, slots, today, error_message=None):
+    data = {
+        "counsellor": str(counselor_id),
+        "date": date_str,
+        "date_title": date_title(date_str, today),
+        "slots": [{"id": s, "title": s} for s in slots[:MAX_OPTIONS]]
+    }
+    if error_message:
+        data["error_message"] = error_message
+    return {"screen": SCREEN_SLOT, "data": data}
+
+def _error_response(screen, message, screen_data):
+    # Keeps the user on the current screen and shows `message` as a snackbar.
+    # The screen's own data (dropdown/radio options) must come along or the Flow rejects it.
+    return {"screen": screen, "data": dict(screen_data, error_message=message)}
+
+class FlowScreenServer:
+    """
+    Answers Flow data_exchange requests for the date and slot screens from the
+    in-memory availability cache, so a booking completes inside one Flow session.
+
+    Each request gets `budget_ms` to compute its screen. Availability lookups that
+    would overrun it (cold cache, slow Sheets) keep running in the background to
+    warm the cache, and the user stays on the current screen with a retry message
+    instead of the Flow timing out.
+    """
+
+    def __init__(self, flow_handler, budget_ms=None, workers=4):
+        self.flow_handler = flow_handler
+        self.budget = (budget_ms or float(os.getenv("FLOW_LATENCY_BUDGET_MS", "1500"))) / 1000.0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="flow-screens")
+        self.over_budget = 0
+
+    def _within_budget(self, started, fn, *args):
+        remaining = self.budget - (time.monotonic() - started)
+        # The Flow request's own deadline can be tighter than the screen budget
+        remaining = min(remaining, deadline.remaining(remaining))
+        if remaining <= 0:
+            raise FutureTimeout()
+        return self.executor.submit(deadline.bind(fn), *args).result(timeout=remaining)
+
+    def respond(self, decrypted_payload):
+        started = time.monotonic()
+        screen = decrypted_payload.get("screen")
+        data = decrypted_payload.get("data") or {}
+        counselor_id = data.get("counsellor")
+        if counselor_id == "DEBUG_ID":
+            counselor_id = "1"
+
+        if (screen not in (SCREEN_COUNSELLOR, SCREEN_DATE) or not counselor_id
+                or (screen == SCREEN_COUNSELLOR and str(data.get("flow_version", "")) != FLOW_VERSION_IN_FLOW_BOOKING)):
+            # Older published Flows have no DATE_SELECT screen and end after the counselor pick
+            return build_data_exchange_response(decrypted_payload)
+
+        token = decrypted_payload.get("flow_token")
+        try:
+            return self._respond_screen(started, screen, counselor_id, data, token)
+        finally:
+            # Keep the picked counselor's availability warm for the next screen and the booking
+            self.flow_handler.prefetch_for_flow(decrypted_payload.get("flow_token"), [counselor_id])
+
+    def _screen_data(self, screen, counselor_id, token):
+        """The data a screen was shown with, to resend alongside an error_message."""
+        if screen == SCREEN_COUNSELLOR:
+            return build_init_response(self.flow_handler.counselors_for_flow(token))["data"]
+        entry = self.flow_handler.flow_tokens.get(token)
+        dates = (entry or {}).get("dates", {}).get(str(counselor_id), [])
+        return build_date_select_response(counselor_id, dates, datetime.date.today())["data"]
+
+    def _respond_screen(self, started, screen, counselor_id, data, token=None):
+        today = datetime.date.today()
+        phone = self.flow_handler.flow_tokens.phone_for(token)
+        try:
+            if screen == SCREEN_COUNSELLOR:
+                dates = self._within_budget(started, self.flow_handler.get_available_dates, counselor_id)
+                if not dates:
+                    return _error_response(screen, "No free slots in the coming days. Please pick another counsellor.",
+                                           self._screen_data(screen, counselor_id, token))
+                self._remember_dates(token, counselor_id, dates)
+                return build_date_select_response(counselor_id, dates, today)
+
+            date_str = data.get("date")
+            if not date_str:
+                return _error_response(screen, "Please pick a date.", self._screen_data(screen, counselor_id, token))
+            slots = self._within_budget(started, self.flow_handler.get_available_slots, counselor_id, date_str, phone)
+            if not slots:
+                dates = self._within_budget(started, self.flow_handler.get_available_dates, counselor_id)
+                self._remember_dates(token, counselor_id, dates)
+                return build_date_select_response(counselor_id, dates, today, "That day just filled up. Please pick another date.")
+            return build_slot_select_response(counselor_id, date_str, slots, today)
+
+        except FutureTimeout:
+            self.over_budget += 1
+            deadline.record_miss(f"flow.{screen}")
+            logger.warning(f"Flow {screen} over its {self.budget * 1000:.0f}ms budget for counselor {counselor_id}")
+            return _error_response(screen, "Checking availability took too long. Please tap again.",
+                                   self._screen_data(screen, counselor_id, token))
+
+    def _remember_dates(self, token, counselor_id, dates):
+        # DATE_SELECT errors resend these without another availability lookup
+        entry = self.flow_handler.flow_tokens.get(token)
+        if entry is not None:
+            entry.setdefault("dates", {})[str(counselor_id)] = list(dates)
@@ -0,0 +1,63 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+class FlowTokenRegistry:
+    """
+    flow_token -> {"phone", "issued_at", ...} for booking Flows we sent.
+
+    The Flow endpoint only sees the token, so this is how INIT and data_exchange
+    know which user is on the other end. Entries live `ttl` seconds (a Flow left
+    open longer just loses the warm path) and at most `max_tokens` are kept,
+    oldest dropped first. Tokens start with `prefix`, which names the issuing
+    worker when several run (see utils/worker_routing.py).
+    """
+
+    def __init__(self, ttl=None, max_tokens=None):
+        self.ttl = ttl or float(os.getenv("FLOW_TOKEN_TTL_SECONDS", "900"))
+        self.max_tokens = max_tokens or int(os.getenv("FLOW_TOKEN_MAX", "10000"))
+        self.prefix = ""
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        # Issue order == expiry order, so only the front needs checking
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if now - entry["issued_at"] < self.ttl and len(self._entries) <= self.max_tokens:
+                break
+            self._entries.popitem(last=False)
+
+    def issue(self, phone):
+        token = f"{self.prefix}{uuid.uuid4()}"
+        now = time.monotonic()
+        with self._lock:
+            self._entries[token] = {"phone": phone, "issued_at": now, "prefetch": None}
+            self._expire(now)
+        return token
+
+    def get(self, token):
+        """The live entry for `token`, or None (unknown or expired)."""
+        if not token:
+            return None
+        with self._lock:
+            entry = self._entries.get(token)
+        if entry is None or time.monotonic() - entry["issued_at"] >= self.ttl:
+            return None
+        return entry
+
+    def phone_for(self, token):
+        entry = self.get(token)
+        return entry["phone"] if entry else None
+
+    def pop(self, token):
+        """Remove and return the entry once its Flow has completed."""
+        entry = self.get(token)
+        with self._lock:
+            self._entries.pop(token, None)
+        return entry
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,34 @@
+import json
+
+# Optional fast JSON backend. orjson is used when installed, otherwise the
+# stdlib json module. Both paths produce compact UTF-8 JSON.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+if orjson:
+    def dumps_bytes(obj):
+        return orjson.dumps(obj)
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    def dumps_bytes(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    def loads(data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf-8")
+        return json.loads(data)
+
+# orjson.JSONDecodeError subclasses this, so one except clause covers both backends
+JSONDecodeError = json.JSONDecodeError
@@ -0,0 +1,105 @@
+import datetime
+from functools import lru_cache
+from services.whatsapp_api import WhatsAppAPI
+from utils.json_codec import dumps_bytes
+from utils.delivery_tracker import message_kind
+
+class MessageTemplate:
+    """
+    A message whose content is fixed. The JSON body is encoded once; at send
+    time only the recipient is spliced in.
+    """
+
+    def __init__(self, message_data):
+        self.message_data = message_data
+        self.kind = message_kind(message_data)
+        # build_payload puts messaging_product and "to" first, so everything from
+        # "type" onwards is static and can be encoded once.
+        static = dumps_bytes({"type": message_data.get("type", "text"), **message_data})
+        self._tail = static[1:]
+
+    def render(self, to_phone):
+        return b'{"messaging_product":"whatsapp","to":' + dumps_bytes(to_phone) + b',' + self._tail
+
+# --- WELCOME MENU ---
+
+WELCOME_TEXT = "Welcome to Serenity Wellness Center! 🌿\n\nHow can we help you today?"
+WELCOME_LIMIT_TEXT = "Welcome back! 🌿\n\nYou've reached your booking limit (5 bookings). You can reschedule existing appointments."
+WELCOME_FOOTER = "Your wellness journey starts here"
+
+BOOK_BUTTON = {"id": "book_btn", "title": "📅 Book Appointment"}
+RESCHEDULE_BUTTON = {"id": "reschedule_btn", "title": "🔄 Reschedule"}
+TALK_BUTTON = {"id": "talk_btn", "title": "💬 Talk to Us"}
+
+def _build_welcome_menu(can_book, has_active):
+    buttons = []
+    body_text = WELCOME_TEXT
+    if can_book:
+        buttons.append(BOOK_BUTTON)
+    else:
+        body_text = WELCOME_LIMIT_TEXT
+    if has_active:
+        buttons.append(RESCHEDULE_BUTTON)
+    buttons.append(TALK_BUTTON)
+    return MessageTemplate(WhatsAppAPI.build_interactive_buttons(body_text, buttons, footer_text=WELCOME_FOOTER))
+
+# All four variants, keyed by (can_book, has_active)
+WELCOME_MENUS = {
+    (can_book, has_active): _build_welcome_menu(can_book, has_active)
+    for can_book in (True, False)
+    for has_active in (True, False)
+}
+
+def welcome_menu(can_book, has_active):
+    return WELCOME_MENUS[(bool(can_book), bool(has_active))]
+
+# --- CONTACT INFO ---
+
+CONTACT_INFO = MessageTemplate(WhatsAppAPI.build_text(
+    "📞 *Contact Us*\\n\\n"
+    "We'd love to hear from you! Reach us at:\\n\\n"
+    "📧 Email: support@serenitywellness.com\\n"
+    "📱 Phone: +91 98765 43210\\n\\n"
+    "Our team is available Mon-Sat, 9 AM - 6 PM"
+))
+
+# --- THROTTLING (utils/admission.py) ---
+
+SLOW_DOWN = MessageTemplate(WhatsAppAPI.build_text(
+    "You're sending messages a little too quickly. Please wait a moment, then send *menu* to continue."
+))
+BUSY = MessageTemplate(WhatsAppAPI.build_text(
+    "We're handling a lot of requests right now. Please try again in a minute 🙏"
+))
+
+# --- WAITLIST (utils/waitlist.py) ---
+
+WAITLIST_JOIN_BUTTON = {"id": "wl_join", "title": "🔔 Notify me"}
+
+# --- DATE PICKER ---
+
+DATE_PROMPT = "Please select a date for your appointment:"
+RESCHEDULE_DATE_PROMPT = "Select a new date for your appointment:"
+
+RELATIVE_DAY_TITLES = ["Today", "Tomorrow", "Day After"]
+
+def date_title(date_str, today):
+    day = datetime.date.fromisoformat(date_str)
+    offset = (day - today).days
+    if 0 <= offset < len(RELATIVE_DAY_TITLES):
+        return RELATIVE_DAY_TITLES[offset]
+    return day.strftime("%a %d %b")
+
+@lru_cache(maxsize=256)
+def date_choices(dates, body_text, today):
+    """
+    Date picker for the given available dates (tuple of YYYY-MM-DD).
+    Up to 3 dates are sent as buttons, more as an interactive list (max 10 rows).
+    """
+    if len(dates) <= 3:
+        buttons = [{"id": d, "title": date_title(d, today)} for d in dates]
+        return MessageTemplate(WhatsAppAPI.build_interactive_buttons(body_text, buttons))
+
+    rows = [{"id": d, "title": date_title(d, today), "description": d} for d in dates[:10]]
+    sections = [{"title": "Available Dates", "rows": rows}]
+    return MessageTemplate(WhatsAppAPI.build_interactive_list(body_text, "Select Date", sections))
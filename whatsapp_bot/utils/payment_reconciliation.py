@@ -0,0 +1,126 @@
+import os
+import time
+import logging
+import datetime
+import threading
+from services.sheets import GoogleSheetsService
+from services.razorpay_api import RazorpayAPI, PAYMENT_LINK_EXPIRY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Links are listed from this long before the oldest open hold (clock skew, slow inserts)
+LOOKBACK_MARGIN_SECONDS = 3600
+# A hold whose link expired longer ago than this is abandoned and no longer reconciled
+# (covers webhook retries and the reconciler itself being down for a while)
+RECONCILE_GRACE_SECONDS = int(os.getenv("RECONCILE_GRACE_SECONDS", str(6 * 3600)))
+
+def open_holds(sheet_service, now=None):
+    """
+    {booking_id: record} for holds that may still be paid: PENDING, not cancelled
+    and created within the link expiry plus RECONCILE_GRACE_SECONDS. Holds with
+    no readable timestamp can't bound the listing window and are left out.
+    """
+    oldest = (now or time.time()) - PAYMENT_LINK_EXPIRY_SECONDS - RECONCILE_GRACE_SECONDS
+    holds = {}
+    for r in sheet_service.cache.records('Bookings'):
+        if r.get('payment_status') != 'PENDING' or r.get('booking_status') == 'CANCELLED' or not r.get('booking_id'):
+            continue
+        created = _created_at(r)
+        if created is not None and created >= oldest:
+            holds[str(r.get('booking_id'))] = r
+    return holds
+
+def _created_at(record):
+    try:
+        return datetime.datetime.fromisoformat(str(record.get('timestamp'))).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+class PaymentReconciler:
+    """
+    Finds holds whose payment_link.paid webhook never arrived.
+
+    Lists Razorpay payment links page by page for the window covering every open
+    hold, matches them on notes.booking_id (set by RazorpayAPI.create_payment_link)
+    and marks all paid ones in a single batched sheet write. Listing stops early
+    once every open hold has been seen.
+    """
+
+    def __init__(self, sheet_service: GoogleSheetsService, rz_api: RazorpayAPI, wa_api=None,
+                 page_size=100, max_pages=500):
+        self.sheets = sheet_service
+        self.rz_api = rz_api
+        self.wa_api = wa_api
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _window_start(self, holds):
+        created = [ts for ts in (_created_at(r) for r in holds.values()) if ts]
+        if not created:
+            return None
+        return min(created) - LOOKBACK_MARGIN_SECONDS
+
+    def find_paid(self, holds):
+        """(corrections, stats): corrections are (booking_id, 'PAID', order_id) tuples."""
+        stats = {"pages": 0, "links_scanned": 0}
+        corrections = []
+        unseen = set(holds)
+        # Fixing the upper bound keeps page offsets stable while new links are created
+        from_ts, to_ts = self._window_start(holds), time.time()
+        skip = 0
+        while unseen and stats["pages"] < self.max_pages:
+            page = self.rz_api.list_payment_links(from_ts=from_ts, to_ts=to_ts, count=self.page_size, skip=skip)
+            stats["pages"] += 1
+            stats["links_scanned"] += len(page)
+            for link in page:
+                booking_id = str((link.get('notes') or {}).get('booking_id', ''))
+                if booking_id not in unseen:
+                    continue
+                unseen.discard(booking_id)
+                if link.get('status') == 'paid':
+                    corrections.append((booking_id, 'PAID', link.get('order_id') or link.get('id')))
+            if len(page) < self.page_size:
+                break
+            skip += self.page_size
+        return corrections, stats
+
+    def run_once(self, dry_run=False):
+        started = time.monotonic()
+        holds = open_holds(self.sheets)
+        corrections, stats = self.find_paid(holds) if holds else ([], {"pages": 0, "links_scanned": 0})
+        if corrections and not dry_run:
+            self.sheets.batch_update_booking_status(corrections)
+            logger.info(f"Reconciled {len(corrections)} paid bookings whose webhook was missed")
+            if self.wa_api:
+                for booking_id, _, _ in corrections:
+                    phone = holds[booking_id].get('user_phone')
+                    if phone:
+                        self.wa_api.send_text(phone, f"✅ Payment Received! Your Booking {booking_id} is Confirmed.")
+        stats.update({
+            "open_holds": len(holds),
+            "corrected": [c[0] for c in corrections],
+            "dry_run": dry_run,
+            "elapsed_s": round(time.monotonic() - started, 3)
+        })
+        return stats
+
+    # --- BACKGROUND LOOP ---
+
+    def _loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Payment reconciliation failed: {e}")
+
+    def start(self, interval=None):
+        if self._thread and self._thread.is_alive():
+            return
+        interval = interval or float(os.getenv("RECONCILE_INTERVAL_MINUTES", "15")) * 60
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name="payment-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
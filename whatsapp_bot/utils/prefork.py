@@ -0,0 +1,40 @@
+import gc
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Helpers for the multi-process (gunicorn, see gunicorn.conf.py) serving mode.
+# Workers share nothing at runtime: each owns its connections, its journal file
+# and its threads. File locks decide which worker runs process-wide singletons.
+
+# Lock files stay open (and locked) for the life of the process
+_held_locks = []
+
+def acquire_process_lock(path):
+    """Non-blocking exclusive flock on `path`. True if this process now holds it until it exits."""
+    import fcntl
+    f = open(path, "a+")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    _held_locks.append(f)
+    return True
+
+def claim_slot(base_path, slots):
+    """
+    First of base_path.0 .. base_path.{slots - 1} that no live process holds.
+    A replacement worker reclaims the slot (and any unapplied state) of one that died.
+    """
+    for n in range(slots):
+        path = f"{base_path}.{n}"
+        if acquire_process_lock(path + ".lock"):
+            return path
+    return None
+
+def freeze_shared_state():
+    """Move everything loaded so far out of the GC's reach so workers share it copy-on-write."""
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Froze {gc.get_freeze_count()} objects before forking workers")
@@ -0,0 +1,153 @@
+import os
+import re
+import time
+import random
+import logging
+import cProfile
+import threading
+from flask import g, request, has_request_context
+from utils.admin_auth import is_admin_request
+
+logger = logging.getLogger(__name__)
+
+# On-demand request profiling for the Flask app.
+#
+#   PROFILE_REQUESTS=true       profile a sample of all requests
+#   PROFILE_SAMPLE_RATE=0.05    fraction of requests profiled (default 0.05)
+#   PROFILE_MODE=cprofile       "cprofile" (deterministic) or "sampling" (pyinstrument, if installed)
+#   PROFILE_DIR=profiles        output directory
+#   PROFILE_MAX_FILES=20        profiles kept per route/action, oldest deleted first
+#   PROFILE_ON_DEMAND=true      lets a single request opt in with "X-Profile: <ADMIN_TOKEN>"
+#
+# When neither PROFILE_REQUESTS nor PROFILE_ON_DEMAND is set, no hooks are registered
+# (ADMIN_TOKEN alone, which the admin endpoints need, doesn't turn profiling on).
+#
+# Profilers only see the thread they run on. Work a profiled request hands to the
+# message dispatcher is wrapped with profile_job() and written as its own profile
+# (`<route>__<action>_job__...`), next to the request's, which only shows the wait.
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+    SamplingProfiler = None
+
+_SAFE_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+def tag_action(action):
+    """Label the current request's profile with an action (e.g. Flow INIT vs data_exchange)."""
+    if getattr(g, "profiler", None) is not None:
+        g.profile_action = str(action)
+
+def profile_job(fn):
+    """`fn`, profiled on the thread that runs it if the current request is being profiled."""
+    if not has_request_context() or getattr(g, "profiler", None) is None:
+        return fn
+    owner = g.profile_owner
+    route = _SAFE_RE.sub("_", request.path.strip("/") or "root")
+    action = _SAFE_RE.sub("_", g.get("profile_action", request.method))
+    prefix = f"{route}__{action}_job__"
+
+    def run(*args):
+        try:
+            profiler, started = owner._begin()
+        except ValueError as e:
+            # Python 3.12+ allows one active cProfile per process
+            logger.warning(f"Job not profiled: {e}")
+            return fn(*args)
+        try:
+            return fn(*args)
+        finally:
+            owner._finish(profiler, started, prefix)
+    return run
+
+class RequestProfiler:
+    def __init__(self, output_dir, sample_rate=0.05, max_files=20, mode="cprofile",
+                 always_on=False, admin_token=None):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self.mode = mode if (mode != "sampling" or SamplingProfiler) else "cprofile"
+        self.always_on = always_on
+        self.admin_token = admin_token
+        self._retention_lock = threading.Lock()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        always_on = os.getenv("PROFILE_REQUESTS", "false").lower() == "true"
+        on_demand = os.getenv("PROFILE_ON_DEMAND", "false").lower() == "true"
+        admin_token = os.getenv("ADMIN_TOKEN") if on_demand else None
+        if not always_on and not admin_token:
+            return None
+        return cls(
+            os.getenv("PROFILE_DIR", "profiles"),
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0.05")),
+            max_files=int(os.getenv("PROFILE_MAX_FILES", "20")),
+            mode=os.getenv("PROFILE_MODE", "cprofile"),
+            always_on=always_on,
+            admin_token=admin_token
+        )
+
+    def install(self, app):
+        app.before_request(self._start)
+        app.teardown_request(self._stop)
+        logger.info(f"Request profiling enabled (mode={self.mode}, sample={self.sample_rate}, dir={self.output_dir})")
+
+    def _requested_by_admin(self):
+        return bool(self.admin_token) and is_admin_request(request.headers, "X-Profile")
+
+    def _should_profile(self):
+        if self._requested_by_admin():
+            return True
+        return self.always_on and random.random() < self.sample_rate
+
+    def _begin(self):
+        if self.mode == "sampling":
+            profiler = SamplingProfiler()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler, time.perf_counter()
+
+    def _start(self):
+        if not self._should_profile():
+            return
+        g.profiler, g.profile_started = self._begin()
+        g.profile_owner = self
+
+    def _stop(self, exc=None):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return
+        route = _SAFE_RE.sub("_", request.path.strip("/") or "root")
+        action = _SAFE_RE.sub("_", g.pop("profile_action", request.method))
+        self._finish(profiler, g.pop("profile_started"), f"{route}__{action}__")
+
+    def _finish(self, profiler, started, prefix):
+        """Stop `profiler` and write it as `<prefix><ms timestamp>_<elapsed>ms`."""
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if self.mode == "sampling":
+            profiler.stop()
+        else:
+            profiler.disable()
+
+        filename = f"{prefix}{int(time.time() * 1000)}_{elapsed_ms:.0f}ms"
+        try:
+            if self.mode == "sampling":
+                with open(os.path.join(self.output_dir, filename + ".html"), "w") as f:
+                    f.write(profiler.output_html())
+            else:
+                profiler.dump_stats(os.path.join(self.output_dir, filename + ".prof"))
+            self._enforce_retention(prefix)
+        except OSError as e:
+            logger.error(f"Failed to write profile: {e}")
+
+    def _enforce_retention(self, prefix):
+        with self._retention_lock:
+            files = sorted(f for f in os.listdir(self.output_dir) if f.startswith(prefix))
+            for old in files[:max(0, len(files) - self.max_files)]:
+                try:
+                    os.remove(os.path.join(self.output_dir, old))
+                except OSError:
+                    pass
@@ -0,0 +1,196 @@
+import os
+import heapq
+import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.sheets import GoogleSheetsService
+from services.whatsapp_api import WhatsAppAPI
+from utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Hours before the appointment at which a reminder goes out
+DEFAULT_REMINDER_OFFSETS = "24,1"
+# A failed send is retried this long after, until the appointment starts
+REMINDER_RETRY_SECONDS = int(os.getenv("REMINDER_RETRY_SECONDS", "120"))
+
+class ReminderScheduler:
+    """
+    Plans appointment reminders for PAID, ACTIVE bookings and sends them when due.
+
+    Jobs live in a heap ordered by send time. Due jobs are sent in batches through a
+    bounded thread pool and a token bucket (Graph API throughput). Every successful
+    send is appended (and fsync'd) to a ledger file, so a restart re-plans from the
+    sheet without double-sending, and reminders that fell due while we were down
+    still go out as long as the appointment hasn't started (only the latest one
+    that is due: a booking made 3h ahead gets the 1h reminder, not a 24h one now).
+    Before sending, each job is checked against the booking as it is now, so
+    cancelled and rescheduled bookings don't get reminders for the old slot.
+    A failed send goes back on the heap REMINDER_RETRY_SECONDS later, and is
+    dropped once a later reminder for the same booking has gone out.
+    """
+
+    def __init__(self, sheet_service: GoogleSheetsService, wa_api: WhatsAppAPI,
+                 ledger_path=None, offsets_hours=None, rate_per_sec=None,
+                 max_workers=None, replan_interval=300):
+        self.sheets = sheet_service
+        self.wa_api = wa_api
+        self.ledger_path = ledger_path or os.getenv("REMINDER_LEDGER_PATH", "reminders_sent.log")
+        offsets = offsets_hours or os.getenv("REMINDER_OFFSETS_HOURS", DEFAULT_REMINDER_OFFSETS)
+        self.offsets_hours = sorted({int(h) for h in str(offsets).split(',') if h.strip()}, reverse=True)
+        self.rate_limiter = TokenBucket(rate_per_sec or float(os.getenv("REMINDER_RATE_PER_SEC", "20")))
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv("REMINDER_MAX_WORKERS", "8")),
+            thread_name_prefix="reminder"
+        )
+        self.replan_interval = replan_interval
+
+        # heap entries: (send_at, key, booking)
+        self.heap = []
+        self.scheduled = set()
+        self.sent = self._load_ledger()
+        self._ledger_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_plan = None
+
+    # --- LEDGER ---
+
+    def _load_ledger(self):
+        sent = set()
+        try:
+            with open(self.ledger_path, "r") as f:
+                for line in f:
+                    key = line.strip()
+                    if key:
+                        sent.add(key)
+        except FileNotFoundError:
+            pass
+        return sent
+
+    def _mark_sent(self, key):
+        with self._ledger_lock:
+            with open(self.ledger_path, "a") as f:
+                f.write(key + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.sent.add(key)
+
+    # --- PLANNING ---
+
+    @staticmethod
+    def appointment_time(booking):
+        try:
+            return datetime.datetime.strptime(
+                f"{booking.get('date')} {booking.get('time_slot')}", "%Y-%m-%d %H:%M"
+            )
+        except (TypeError, ValueError):
+            return None
+
+    def plan(self, now=None):
+        """Read bookings once and push any reminder jobs not yet scheduled or sent."""
+        now = now or datetime.datetime.now()
+        added = 0
+        for booking in self.sheets.get_paid_active_bookings():
+            appointment = self.appointment_time(booking)
+            if not appointment or appointment <= now:
+                continue
+            # Offsets already passed are dropped, except the latest one if none is left ahead
+            passed = [h for h in self.offsets_hours if appointment - datetime.timedelta(hours=h) <= now]
+            keep_passed = min(passed) if len(passed) == len(self.offsets_hours) else None
+            for hours in self.offsets_hours:
+                if hours in passed and hours != keep_passed:
+                    continue
+                key = f"{booking.get('booking_id')}:{booking.get('date')}:{booking.get('time_slot')}:{hours}h"
+                if key in self.sent or key in self.scheduled:
+                    continue
+                send_at = appointment - datetime.timedelta(hours=hours)
+                heapq.heappush(self.heap, (send_at, key, booking))
+                self.scheduled.add(key)
+                added += 1
+        self._last_plan = now
+        logger.info(f"Reminder plan: {added} new jobs, {len(self.heap)} pending")
+        return added
+
+    # --- SENDING ---
+
+    def _send(self, key, booking):
+        self.rate_limiter.acquire()
+        text = (
+            f"⏰ Reminder: your appointment is on {booking.get('date')} at {booking.get('time_slot')}.\n\n"
+            f"Booking ID: {booking.get('booking_id')}\n"
+            f"Type 'Hi' if you need to reschedule."
+        )
+        result = self.wa_api.send_text(str(booking.get('user_phone')), text)
+        if result is not None:
+            self._mark_sent(key)
+        return result is not None
+
+    def pop_due(self, now):
+        due = []
+        current = None
+        while self.heap and self.heap[0][0] <= now:
+            send_at, key, booking = heapq.heappop(self.heap)
+            self.scheduled.discard(key)
+            appointment = self.appointment_time(booking)
+            # Skip reminders for appointments that already started (e.g. long downtime),
+            # and retries overtaken by a later reminder
+            if key in self.sent or (appointment and appointment <= now) or self._superseded(key):
+                continue
+            if current is None:
+                current = {b.get('booking_id'): b for b in self.sheets.get_paid_active_bookings()}
+            # Cancelled, or moved to another slot since the job was planned
+            live = current.get(booking.get('booking_id'))
+            if not live or (live.get('date'), live.get('time_slot')) != (booking.get('date'), booking.get('time_slot')):
+                continue
+            due.append((key, booking))
+        return due
+
+    def _superseded(self, key):
+        """True if a reminder closer to the appointment has already been sent for this booking."""
+        base, hours = key.rsplit(":", 1)
+        hours = int(hours.rstrip("h"))
+        return any(f"{base}:{h}h" in self.sent for h in self.offsets_hours if h < hours)
+
+    def run_once(self, now=None):
+        """Send every due reminder; failed ones are re-queued. Returns (sent, failed)."""
+        now = now or datetime.datetime.now()
+        due = self.pop_due(now)
+        if not due:
+            return 0, 0
+        results = list(self.executor.map(lambda job: self._send(*job), due))
+        retry_at = now + datetime.timedelta(seconds=REMINDER_RETRY_SECONDS)
+        for (key, booking), ok in zip(due, results):
+            if not ok:
+                heapq.heappush(self.heap, (retry_at, key, booking))
+                self.scheduled.add(key)
+        sent = sum(1 for ok in results if ok)
+        failed = len(results) - sent
+        if failed:
+            logger.warning(f"{failed} reminders failed; retrying in {REMINDER_RETRY_SECONDS}s")
+        return sent, failed
+
+    def _loop(self, tick):
+        while not self._stop.is_set():
+            try:
+                now = datetime.datetime.now()
+                if not self._last_plan or (now - self._last_plan).total_seconds() >= self.replan_interval:
+                    self.plan(now)
+                self.run_once(now)
+            except Exception as e:
+                logger.error(f"Reminder scheduler error: {e}")
+            self._stop.wait(tick)
+
+    def start(self, tick=30):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(tick,), name="reminder-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.executor.shutdown(wait=True)
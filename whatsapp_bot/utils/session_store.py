@@ -0,0 +1,146 @@
+import os
+import zlib
+import time
+import atexit
+import struct
+import logging
+import threading
+from utils.json_codec import dumps_bytes, loads
+
+logger = logging.getLogger(__name__)
+
+# File layout: MAGIC | u32 entry count | zlib([[phone, last_seen, session], ...])
+MAGIC = b"WBSESS1\x00"
+_COUNT = struct.Struct("<I")
+
+def write_sessions(path, entries):
+    """Atomically write {phone: (last_seen, session)}."""
+    payload = zlib.compress(dumps_bytes([[p, ts, s] for p, (ts, s) in entries.items()]), 6)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(_COUNT.pack(len(entries)))
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def read_sessions(path):
+    """{phone: (last_seen, session)} from `path`; empty if missing or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            blob = f.read()
+    except FileNotFoundError:
+        return {}
+    try:
+        if blob[:len(MAGIC)] != MAGIC:
+            raise ValueError("bad magic")
+        rows = loads(zlib.decompress(blob[len(MAGIC) + _COUNT.size:]))
+        return {phone: (ts, session) for phone, ts, session in rows}
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable session snapshot {path}: {e}")
+        return {}
+
+class SessionStore(dict):
+    """
+    The `user_sessions` dict, with warm restarts.
+
+    Behaves like a plain dict of phone -> session. When `path` is set, sessions
+    are written there periodically and at interpreter exit. After a restart the
+    file is only read on the first lookup of a phone that isn't in memory, and
+    each saved session is promoted back individually on that phone's next
+    message. Sessions idle for longer than `ttl` seconds are never restored and
+    are evicted from memory by the background saver.
+    """
+
+    def __init__(self, path=None, ttl=3600):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.restored = 0
+        self._last_seen = {}
+        self._dormant = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- DICT HOOKS ---
+
+    def __getitem__(self, phone):
+        if not dict.__contains__(self, phone):
+            self._restore(phone)
+        session = dict.__getitem__(self, phone)
+        self._last_seen[phone] = time.time()
+        return session
+
+    def __setitem__(self, phone, session):
+        self._last_seen[phone] = time.time()
+        dict.__setitem__(self, phone, session)
+
+    def __contains__(self, phone):
+        return dict.__contains__(self, phone) or self._restore(phone)
+
+    def _restore(self, phone):
+        if not self.path:
+            return False
+        with self._lock:
+            if self._dormant is None:
+                self._dormant = read_sessions(self.path)
+            entry = self._dormant.pop(phone, None)
+        if entry is None:
+            return False
+        last_seen, session = entry
+        if time.time() - last_seen > self.ttl:
+            return False
+        dict.__setitem__(self, phone, session)
+        self._last_seen[phone] = last_seen
+        self.restored += 1
+        return True
+
+    # --- PERSISTENCE ---
+
+    def evict_expired(self):
+        cutoff = time.time() - self.ttl
+        for phone, last_seen in list(self._last_seen.items()):
+            if last_seen < cutoff:
+                self._last_seen.pop(phone, None)
+                self.pop(phone, None)
+
+    def save(self):
+        """Merge live sessions into the file (newest wins) and drop expired entries."""
+        if not self.path:
+            return 0
+        self.evict_expired()
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            # Other workers share the file: keep their newer entries
+            entries = read_sessions(self.path)
+            for phone, session in list(self.items()):
+                last_seen = self._last_seen.get(phone, 0)
+                if last_seen >= entries.get(phone, (0, None))[0]:
+                    entries[phone] = (last_seen, session)
+            entries = {p: e for p, e in entries.items() if e[0] >= cutoff}
+            write_sessions(self.path, entries)
+        return len(entries)
+
+    def _loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.save()
+            except Exception as e:
+                logger.error(f"Session snapshot failed: {e}")
+
+    def start(self, interval=30):
+        """Save every `interval` seconds and once more at shutdown."""
+        if not self.path or (self._thread and self._thread.is_alive()):
+            return
+        atexit.register(self.stop)
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name="session-store", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self.save()
+        except Exception as e:
+            logger.error(f"Session snapshot failed: {e}")
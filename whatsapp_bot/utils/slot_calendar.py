@@ -0,0 +1,100 @@
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rows of the Schedules sheet:
+#   counselor_id | kind   | day                 | start | end   | slot_minutes
+#   1            | weekly | Mon                 | 09:00 | 13:00 | 60
+#   1            | weekly | Mon                 | 14:00 | 17:00 | 60      <- lunch break is the gap
+#   1            | closed | 2024-12-25          |       |       |         <- holiday
+#   1            | hours  | 2024-12-31          | 09:00 | 12:00 | 30      <- replaces that day's weekly hours
+# A closed row wins over hours rows for the same date, whatever the row order.
+# Counselors with no weekly rows keep the default grid every day.
+
+DEFAULT_SLOTS = ("09:00", "10:00", "11:00", "12:00", "14:00", "15:00", "16:00")
+DEFAULT_SLOT_MINUTES = 60
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+def _minutes(hhmm):
+    hours, minutes = str(hhmm).strip().split(":")
+    return int(hours) * 60 + int(minutes)
+
+def expand_slots(start, end, slot_minutes):
+    """Slot start times from start (inclusive) while a full slot fits before end."""
+    step = int(slot_minutes or DEFAULT_SLOT_MINUTES)
+    first, last = _minutes(start), _minutes(end)
+    return [f"{m // 60:02d}:{m % 60:02d}" for m in range(first, last - step + 1, step)]
+
+class SlotCalendar:
+    """
+    Compiled per-counselor schedules. slots_for() is two dict lookups; all rule
+    parsing happens once in compile(). Identical slot lists are shared between
+    counselors, so hundreds of counselors on a few standard rotas cost little memory.
+    """
+
+    def __init__(self, weekly=None, overrides=None, default_slots=DEFAULT_SLOTS):
+        # counselor_id -> 7-tuple (Mon..Sun) of slot tuples
+        self.weekly = weekly or {}
+        # counselor_id -> {date_str: slot tuple}; () means closed
+        self.overrides = overrides or {}
+        self.default_slots = tuple(default_slots)
+
+    @classmethod
+    def compile(cls, rules, default_slots=DEFAULT_SLOTS):
+        interned = {}
+
+        def intern(slots):
+            slots = tuple(sorted(set(slots)))
+            return interned.setdefault(slots, slots)
+
+        weekly_lists = {}
+        override_lists = {}
+        closed = set()
+        for rule in rules:
+            try:
+                counselor_id = str(rule.get('counselor_id', '')).strip()
+                kind = str(rule.get('kind', '')).strip().lower()
+                day = str(rule.get('day', '')).strip()
+                if not counselor_id:
+                    continue
+                if kind == 'weekly':
+                    weekday = WEEKDAYS.index(day[:3].lower())
+                    days = weekly_lists.setdefault(counselor_id, [[] for _ in range(7)])
+                    days[weekday].extend(expand_slots(rule['start'], rule['end'], rule.get('slot_minutes')))
+                elif kind == 'closed':
+                    closed.add((counselor_id, str(datetime.date.fromisoformat(day))))
+                elif kind == 'hours':
+                    dates = override_lists.setdefault(counselor_id, {})
+                    dates.setdefault(str(datetime.date.fromisoformat(day)), []).extend(
+                        expand_slots(rule['start'], rule['end'], rule.get('slot_minutes'))
+                    )
+                else:
+                    logger.warning(f"Unknown schedule rule kind '{kind}' for counselor {counselor_id}")
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Skipping invalid schedule rule {rule}: {e}")
+        for counselor_id, date_str in closed:
+            override_lists.setdefault(counselor_id, {})[date_str] = []
+
+        weekly = {cid: tuple(intern(d) for d in days) for cid, days in weekly_lists.items()}
+        overrides = {
+            cid: {date_str: intern(slots) for date_str, slots in dates.items()}
+            for cid, dates in override_lists.items()
+        }
+        return cls(weekly, overrides, intern(default_slots))
+
+    def slots_for(self, counselor_id, date):
+        """All bookable slot times for a counselor on a date (datetime.date or YYYY-MM-DD)."""
+        counselor_id = str(counselor_id)
+        if isinstance(date, str):
+            date_str = date
+            date = datetime.date.fromisoformat(date)
+        else:
+            date_str = str(date)
+        overrides = self.overrides.get(counselor_id)
+        if overrides and date_str in overrides:
+            return overrides[date_str]
+        weekly = self.weekly.get(counselor_id)
+        if weekly is None:
+            return self.default_slots
+        return weekly[date.weekday()]
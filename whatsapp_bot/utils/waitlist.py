@@ -0,0 +1,259 @@
+import os
+import time
+import fcntl
+import secrets
+import logging
+import datetime
+import threading
+from contextlib import contextmanager
+from services.razorpay_api import PAYMENT_LINK_EXPIRY_SECONDS
+from utils.rate_limit import TokenBucket
+from utils import message_templates
+from utils.json_codec import dumps_bytes, loads
+
+logger = logging.getLogger(__name__)
+
+CLAIM_PREFIX = "wl_claim:"
+PASS_PREFIX = "wl_pass:"
+
+# A claimed slot stays leased until its payment link can no longer be paid (the
+# link is created just after the claim and carries expire_by), plus time for the
+# payment webhook to land; a PENDING hold alone doesn't mark the slot booked.
+# Relies on RazorpayAPI sending expire_by: a link without it never stops being payable.
+CLAIM_LEASE_SECONDS = PAYMENT_LINK_EXPIRY_SECONDS + 120
+
+class Waitlist:
+    """
+    Users waiting for a slot with one counselor on one date.
+
+    Waiters are queued per (counselor_id, date), first come first served. When
+    a paid booking gives up its slot (GoogleSheetsService.slot_listeners:
+    cancellation or reschedule) the slot is offered to the first waiter. The
+    slot is leased to them for `lease_seconds`: other users don't see it, and the
+    waiter can claim it with one tap, which creates the hold and payment link;
+    a claimed slot stays leased for CLAIM_LEASE_SECONDS, until the link can no
+    longer be paid. An unclaimed or passed offer moves on to the next waiter.
+
+    Offers are sent by a background thread in batches of `batch_size`, paced by
+    a token bucket (`notify_rate` messages/sec), so a mass cancellation doesn't
+    burst past the Graph API limits. With `path` (WAITLIST_STATE_PATH) the
+    queues, offers and freed slots live in that file under an flock, so every
+    gunicorn worker sees the same waitlist and only one of them needs to run
+    the sender thread; without it they live in this process's memory.
+    """
+
+    def __init__(self, flow_handler, lease_seconds=None, notify_rate=None, batch_size=20, max_per_key=200, path=None):
+        self.flow_handler = flow_handler
+        self.lease_seconds = lease_seconds or float(os.getenv("WAITLIST_LEASE_SECONDS", "600"))
+        self.bucket = TokenBucket(notify_rate or float(os.getenv("WAITLIST_NOTIFY_RATE", "5")), batch_size)
+        self.batch_size = batch_size
+        self.max_per_key = max_per_key
+        self.path = path or os.getenv("WAITLIST_STATE_PATH")
+        self._lock = threading.Lock()
+        # "counselor_id|date" -> [[phone, joined_at], ...] in arrival order
+        # offer_id -> {"key": [counselor_id, date], "slot", "phone", "expires_at", "claimed"}
+        # pending: freed [counselor_id, date, slot] waiting for the sender thread
+        self._memory = {"queues": {}, "offers": {}, "pending": []}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.counters = {"joined": 0, "offered": 0, "claimed": 0, "passed": 0, "expired": 0, "unmatched": 0}
+
+    # --- STATE ---
+
+    @contextmanager
+    def _state(self, write=False):
+        """The waitlist state, locked; written back afterwards if `write`."""
+        with self._lock:
+            if not self.path:
+                yield self._memory
+                return
+            with open(f"{self.path}.lock", "a+") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                state = self._read()
+                yield state
+                if write:
+                    tmp = f"{self.path}.{os.getpid()}.tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(dumps_bytes(state))
+                    os.replace(tmp, self.path)
+
+    def _read(self):
+        try:
+            with open(self.path, "rb") as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable waitlist state {self.path}: {e}")
+        return {"queues": {}, "offers": {}, "pending": []}
+
+    @staticmethod
+    def _key(counselor_id, date_str):
+        return f"{counselor_id}|{date_str}"
+
+    # --- WAITERS ---
+
+    def join(self, phone, counselor_id, date_str):
+        with self._state(write=True) as state:
+            queue = state["queues"].setdefault(self._key(counselor_id, date_str), [])
+            if any(waiter == phone for waiter, _ in queue):
+                return False
+            if len(queue) >= self.max_per_key:
+                return False
+            queue.append([phone, time.time()])
+            self.counters["joined"] += 1
+        return True
+
+    def position(self, phone, counselor_id, date_str):
+        with self._state() as state:
+            queue = state["queues"].get(self._key(counselor_id, date_str), [])
+            for n, (waiter, _) in enumerate(queue, 1):
+                if waiter == phone:
+                    return n
+            return None
+
+    def leased_slots(self, counselor_id, date_str, phone=None):
+        """Slots on this day held for a waiter other than `phone`."""
+        key = [str(counselor_id), str(date_str)]
+        with self._state() as state:
+            return {o["slot"] for o in state["offers"].values() if o["key"] == key and o["phone"] != phone}
+
+    # --- FREED SLOTS ---
+
+    def slot_freed(self, counselor_id, date_str, slot):
+        """Slot listener: queue the slot for the next batch of offers."""
+        with self._state(write=True) as state:
+            if not state["queues"].get(self._key(counselor_id, date_str)):
+                self.counters["unmatched"] += 1
+                return
+            state["pending"].append([str(counselor_id), str(date_str), str(slot)])
+        self._wake.set()
+
+    def _next_waiter(self, key):
+        with self._state(write=True) as state:
+            queue = state["queues"].get(self._key(*key))
+            if not queue:
+                state["queues"].pop(self._key(*key), None)
+                return None
+            phone, _ = queue.pop(0)
+            return phone
+
+    def _offer(self, key, slot):
+        """Lease `slot` to the next waiter and message them. False if rate-limited."""
+        counselor_id, date_str = key
+        if datetime.date.fromisoformat(date_str) < datetime.date.today():
+            with self._state(write=True) as state:
+                state["queues"].pop(self._key(*key), None)
+            return True
+        if slot not in self.flow_handler.get_available_slots(counselor_id, date_str):
+            # Re-booked (or leased) in the meantime
+            return True
+        if not self.bucket.try_acquire():
+            return False
+        phone = self._next_waiter(key)
+        if phone is None:
+            self.bucket.refund()
+            return True
+
+        offer_id = secrets.token_hex(4)
+        with self._state(write=True) as state:
+            state["offers"][offer_id] = {"key": list(key), "slot": slot, "phone": phone,
+                                         "expires_at": time.time() + self.lease_seconds, "claimed": False}
+            self.counters["offered"] += 1
+        try:
+            counselor = self.flow_handler.get_counselor(counselor_id)
+            name = counselor['name'] if counselor else f"counselor {counselor_id}"
+            day = message_templates.date_title(date_str, datetime.date.today())
+            self.flow_handler.wa_api.send_interactive_buttons(
+                phone,
+                f"Good news! A slot opened up with {name}: *{day} at {slot}*.\n"
+                f"It's held for you for {int(self.lease_seconds // 60)} minutes.",
+                [{"id": f"{CLAIM_PREFIX}{offer_id}", "title": "✅ Book it"},
+                 {"id": f"{PASS_PREFIX}{offer_id}", "title": "Pass"}]
+            )
+        except Exception as e:
+            logger.error(f"Waitlist offer to {phone} failed: {e}")
+        return True
+
+    # --- CLAIMS ---
+
+    def claim(self, phone, offer_id):
+        """(counselor_id, date, slot) if `phone` holds a live offer `offer_id`, else None."""
+        with self._state(write=True) as state:
+            offer = state["offers"].get(offer_id)
+            if not offer or offer["phone"] != phone or offer["claimed"] or time.time() >= offer["expires_at"]:
+                return None
+            offer["claimed"] = True
+            # Keep the lease for as long as the payment link can be paid
+            offer["expires_at"] = time.time() + CLAIM_LEASE_SECONDS
+            self.counters["claimed"] += 1
+            return tuple(offer["key"]) + (offer["slot"],)
+
+    def decline(self, phone, offer_id):
+        with self._state(write=True) as state:
+            offer = state["offers"].get(offer_id)
+            if not offer or offer["phone"] != phone or offer["claimed"]:
+                return False
+            # Expire now; the sender thread offers the slot to the next waiter
+            offer["expires_at"] = 0
+            offer["passed"] = True
+            self.counters["passed"] += 1
+        self._wake.set()
+        return True
+
+    def _expire_leases(self):
+        now = time.time()
+        with self._state(write=True) as state:
+            expired = [o for o in state["offers"].values() if now >= o["expires_at"]]
+            state["offers"] = {oid: o for oid, o in state["offers"].items() if now < o["expires_at"]}
+            for offer in expired:
+                if not offer["claimed"] and not offer.get("passed"):
+                    self.counters["expired"] += 1
+        for offer in expired:
+            # Still free (not paid for) -> next waiter
+            self.slot_freed(*offer["key"], offer["slot"])
+
+    # --- SENDER THREAD ---
+
+    def run_once(self):
+        self._expire_leases()
+        handled = 0
+        while handled < self.batch_size:
+            with self._state() as state:
+                if not state["pending"]:
+                    break
+                counselor_id, date_str, slot = state["pending"][0]
+            if not self._offer((counselor_id, date_str), slot):
+                break
+            # Only the sender thread takes from the front; others append at the back
+            with self._state(write=True) as state:
+                state["pending"].pop(0)
+            handled += 1
+        return handled
+
+    def _loop(self, interval):
+        while not self._stop.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Waitlist run failed: {e}")
+
+    def start(self, interval=1.0):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name="waitlist", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self):
+        with self._state() as state:
+            waiting = sum(len(q) for q in state["queues"].values())
+            leases = len(state["offers"])
+            pending = len(state["pending"])
+        return {**self.counters, "waiting": waiting, "active_leases": leases, "pending": pending}
@@ -0,0 +1,140 @@
+import os
+import logging
+from utils.json_codec import dumps, loads, JSONDecodeError
+
+logger = logging.getLogger(__name__)
+
+# Shared request parsing for the sync (app.py) and async (asgi_app.py) servers,
+# so both serving modes behave identically.
+
+def parse_json_body(raw):
+    """Decode a raw request body with the fast JSON backend. Returns None if empty or invalid."""
+    if not raw:
+        return None
+    try:
+        return loads(raw)
+    except JSONDecodeError:
+        return None
+
+def parse_incoming_message(data):
+    """
+    Extract the user message from a Meta Cloud API webhook body.
+    Returns (from_number, msg_body, flow_response) or None if there is no message.
+    msg_body is None when the message is a Flow (nfm_reply) response.
+    """
+    entry = data.get('entry', [])[0]
+    changes = entry.get('changes', [])[0]
+    value = changes.get('value', {})
+    messages = value.get('messages', [])
+
+    if not messages:
+        return None
+
+    msg = messages[0]
+    from_number = msg.get('from') # User Phone
+    msg_type = msg.get('type')
+    flow_response = None
+    if msg_type == 'text':
+        msg_body = msg.get('text', {}).get('body', '')
+    elif msg_type == 'interactive':
+        interactive = msg.get('interactive', {})
+        if interactive.get('type') == 'button_reply':
+            msg_body = interactive.get('button_reply', {}).get('id')
+        elif interactive.get('type') == 'list_reply':
+            msg_body = interactive.get('list_reply', {}).get('id')
+        elif interactive.get('type') == 'nfm_reply':
+            # WhatsApp Flow response - processed directly, not as a regular message
+            nfm_reply = interactive.get('nfm_reply', {})
+            flow_response = loads(nfm_reply.get('response_json', '{}'))
+            msg_body = None
+        else:
+            msg_body = ""
+    else:
+        msg_body = ""
+
+    return from_number, msg_body, flow_response
+
+def parse_statuses(data):
+    """The `value.statuses` delivery events (sent/delivered/read/failed) of a webhook body."""
+    try:
+        return data['entry'][0]['changes'][0]['value'].get('statuses', [])
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return []
+
+def load_flow_private_key():
+    """Load the Flow private key from env (FLOW_PRIVATE_KEY) or private.pem. Returns None if missing."""
+    private_key = os.getenv("FLOW_PRIVATE_KEY")
+    if private_key:
+        private_key = private_key.replace('\\n', '\n')
+
+    if not private_key:
+        try:
+            with open("private.pem", "r") as f:
+                private_key = f.read()
+        except FileNotFoundError:
+            return None
+    return private_key
+
+def build_init_response(counselors):
+    """Build the COUNSELLOR_SELECT screen payload for a Flow INIT request."""
+    department_data = []
+    for c in counselors:
+        department_data.append({
+            "id": str(c['id']),
+            "title": str(c['name'])
+        })
+
+    if not department_data:
+        logger.warning("No counselors found in Sheet! Adding dummy data.")
+        department_data.append({
+            "id": "DUMMY",
+            "title": "Dr. Placeholder"
+        })
+
+    logger.info(f"INIT Payload Data (Department): {dumps(department_data)}")
+
+    return {
+        "screen": "COUNSELLOR_SELECT",
+        "data": {
+            "department": department_data,
+            "counsellor": department_data,
+            "counselors": department_data
+        }
+    }
+
+def build_data_exchange_response(decrypted_payload):
+    """Build the SUCCESS screen payload for a Flow data_exchange request."""
+    request_data = decrypted_payload.get("data", {})
+    return {
+        "screen": "SUCCESS",
+        "data": {
+            "extension_message_response": {
+                "params": {
+                    "flow_token": decrypted_payload.get("flow_token"),
+                    "counsellor_id": request_data.get("counsellor") if request_data.get("counsellor") != "DEBUG_ID" else "1"
+                }
+            }
+        }
+    }
+
+def parse_paid_payment_event(event):
+    """
+    Extract (booking_id, order_id, phone) from a Razorpay payment_link.paid event.
+    Returns None for other events or when no booking_id was stored in the notes.
+    """
+    if event.get('event') != 'payment_link.paid':
+        return None
+
+    payload = event.get('payload', {})
+    payment_link = payload.get('payment_link', {})
+    entity = payment_link.get('entity', {})
+
+    # We store booking_id in 'notes' -> 'booking_id' (see RazorpayAPI.create_payment_link)
+    notes = entity.get('notes', {})
+    booking_id = notes.get('booking_id')
+    if not booking_id:
+        return None
+
+    order_id = entity.get('order_id') or entity.get('id') # fallback to plink id
+    phone = entity.get('customer', {}).get('contact')
+    return booking_id, order_id, phone
@@ -0,0 +1,66 @@
+import re
+import time
+import random
+import hashlib
+import logging
+import threading
+from utils.json_codec import dumps, loads, JSONDecodeError
+
+logger = logging.getLogger(__name__)
+
+# Free text we keep verbatim when recording; anything else a user typed is redacted.
+KNOWN_COMMANDS = {'hi', 'hello', 'start', 'reset', 'menu', 'book', 'talk', 'reschedule'}
+PHONE_KEYS = {'from', 'wa_id', 'contact', 'recipient_id', 'display_phone_number'}
+REDACT_KEYS = {'name', 'email', 'caption'}
+PHONE_RE = re.compile(r'\+?\d{8,15}')
+
+def pseudonymize_phone(phone):
+    """Stable fake number, so one user's messages still replay as one conversation."""
+    digest = int(hashlib.sha256(str(phone).encode('utf-8')).hexdigest(), 16)
+    return "99" + str(digest % (10 ** 10)).zfill(10)
+
+def sanitize(obj, parent_key=None):
+    """Return a copy of a webhook body with phone numbers, names and free text removed."""
+    if isinstance(obj, dict):
+        clean = {}
+        for key, value in obj.items():
+            if key in PHONE_KEYS and isinstance(value, (str, int)):
+                clean[key] = pseudonymize_phone(value)
+            elif key in REDACT_KEYS and isinstance(value, str):
+                clean[key] = "redacted"
+            elif key == 'body' and parent_key == 'text' and isinstance(value, str):
+                clean[key] = value if value.strip().lower() in KNOWN_COMMANDS else "redacted"
+            else:
+                clean[key] = sanitize(value, key)
+        return clean
+    if isinstance(obj, list):
+        return [sanitize(v, parent_key) for v in obj]
+    if isinstance(obj, str) and parent_key in ('description', 'reference_id'):
+        return PHONE_RE.sub(lambda m: pseudonymize_phone(m.group(0)), obj)
+    return obj
+
+class WebhookRecorder:
+    """
+    Appends sanitized inbound request bodies to a JSONL file for later replay
+    with scripts/load_test.py. Enabled in app.py by WEBHOOK_RECORD_PATH.
+    """
+
+    def __init__(self, path, sample_rate=1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+
+    def record(self, route, raw_body):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        try:
+            body = loads(raw_body) if raw_body else None
+        except JSONDecodeError:
+            return
+        line = dumps({"t": time.time(), "path": route, "body": sanitize(body)})
+        try:
+            with self._lock:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            logger.error(f"Failed to record webhook: {e}")
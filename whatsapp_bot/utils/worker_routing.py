@@ -0,0 +1,132 @@
+import os
+import time
+import zlib
+import logging
+import threading
+import httpx
+import requests
+from werkzeug.serving import make_server
+from services.async_http import get_async_client
+from utils import deadline
+from utils.prefork import claim_slot
+
+logger = logging.getLogger(__name__)
+
+# Set on requests forwarded by another worker; they are always handled where they land
+ROUTED_HEADER = "X-Routed-From"
+
+# Upper bound per forwarded request; inside a request the deadline cuts it shorter
+ROUTE_TIMEOUT_SECONDS = float(os.getenv("ROUTE_TIMEOUT_SECONDS", "10"))
+
+class OwnerTimeout(Exception):
+    """The owning worker took a forwarded request but didn't answer in time (it may still be handling it)."""
+
+class WorkerRouter:
+    """
+    Sends each phone's requests to the one worker that owns its state.
+
+    Conversation state, per-phone dispatch queues, admission buckets and Flow
+    tokens live in worker memory, and gunicorn hands a request to whichever
+    worker is free. Each worker claims a slot 0..workers-1 and also serves the
+    app on 127.0.0.1:(port_base + slot); a phone belongs to slot
+    crc32(phone) % workers, and a Flow token to the slot that issued it (its
+    `w<slot>.` prefix). A request that lands elsewhere is forwarded to its owner
+    unchanged and the owner's response is returned. If the owner can't be
+    reached (it is being restarted) the request is handled where it landed.
+    """
+
+    def __init__(self, slot, workers, port_base=None, timeout=None):
+        self.slot = slot
+        self.workers = workers
+        self.port_base = port_base or int(os.getenv("ROUTE_PORT_BASE", "5100"))
+        self.timeout = timeout or ROUTE_TIMEOUT_SECONDS
+        self.token_prefix = f"w{slot}."
+        self.counters = {"forwarded": 0, "unreachable": 0, "timed_out": 0}
+        self._session = requests.Session()
+        self._server = None
+
+    @classmethod
+    def claim(cls, workers, base_path=None, wait=10.0):
+        """Router for the first free slot, waiting up to `wait`s for a replaced worker to exit. None if none frees up."""
+        base_path = base_path or os.getenv("WORKER_SLOT_PATH", "worker_slot")
+        give_up = time.monotonic() + wait
+        while True:
+            path = claim_slot(base_path, workers)
+            if path:
+                return cls(int(path.rsplit(".", 1)[1]), workers)
+            if time.monotonic() >= give_up:
+                return None
+            time.sleep(0.5)
+
+    # --- OWNERS ---
+
+    def owner(self, phone):
+        return zlib.crc32(str(phone).encode()) % self.workers
+
+    def owner_of_token(self, token):
+        """Slot that issued `token`, or None for tokens without a slot prefix."""
+        prefix, _, rest = str(token or "").partition(".")
+        if not rest or not prefix.startswith("w") or not prefix[1:].isdigit():
+            return None
+        slot = int(prefix[1:])
+        return slot if slot < self.workers else None
+
+    def is_remote(self, owner):
+        return owner is not None and owner != self.slot
+
+    # --- FORWARDING ---
+
+    def forward(self, owner, method, path, body, headers):
+        """
+        (status, content_type, body) of the owner's response, or None if it
+        couldn't be reached. Raises OwnerTimeout if it didn't answer in time.
+        """
+        try:
+            response = self._session.request(
+                method, self._url(owner, path), data=body, headers=self._headers(headers),
+                timeout=deadline.timeout("route.forward", self.timeout)
+            )
+        except requests.ReadTimeout:
+            raise self._timed_out(owner, path)
+        except requests.RequestException as e:
+            return self._unreachable(owner, path, e)
+        self.counters["forwarded"] += 1
+        return response.status_code, response.headers.get("Content-Type"), response.content
+
+    async def forward_async(self, owner, method, path, body, headers):
+        """forward() on the shared httpx client, for the ASGI app."""
+        try:
+            response = await get_async_client().request(
+                method, self._url(owner, path), content=body, headers=self._headers(headers),
+                timeout=deadline.timeout("route.forward", self.timeout)
+            )
+        except httpx.ReadTimeout:
+            raise self._timed_out(owner, path)
+        except httpx.HTTPError as e:
+            return self._unreachable(owner, path, e)
+        self.counters["forwarded"] += 1
+        return response.status_code, response.headers.get("Content-Type"), response.content
+
+    def _url(self, owner, path):
+        return f"http://127.0.0.1:{self.port_base + owner}{path}"
+
+    def _headers(self, headers):
+        return {**headers, ROUTED_HEADER: str(self.slot)}
+
+    def _timed_out(self, owner, path):
+        self.counters["timed_out"] += 1
+        return OwnerTimeout(f"worker {owner} didn't answer {path} in time")
+
+    def _unreachable(self, owner, path, error):
+        logger.warning(f"Worker {owner} unreachable, handling {path} on worker {self.slot}: {error}")
+        self.counters["unreachable"] += 1
+        return None
+
+    def serve(self, app):
+        """Serve `app` on this slot's loopback port, for requests forwarded by other workers."""
+        self._server = make_server("127.0.0.1", self.port_base + self.slot, app, threaded=True)
+        threading.Thread(target=self._server.serve_forever, name="worker-route", daemon=True).start()
+        logger.info(f"Worker slot {self.slot}/{self.workers} taking forwarded requests on port {self.port_base + self.slot}")
+
+    def stats(self):
+        return {**self.counters, "slot": self.slot, "workers": self.workers}
@@ -1,112 +0,0 @@
-import os
-import json
-import base64
-from app import process_flow_request
-from utils.flow_encryption import encrypt_response, decrypt_request
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.primitives import hashes
-
-# Mock dependencies
-os.environ["FLOW_PRIVATE_KEY"] = open("private.pem").read()
-# We need a public key to encrypt the request (Simulating Meta)
-# But wait, to simulate an INCOMING request, we need to specific AES key.
-# Actually, we can just call process_flow_request with a Mock Encrypted Body.
-
-def generate_mock_request():
-    # 1. Generate temp AES Key & IV
-    aes_key = os.urandom(32)
-    iv = os.urandom(12)
-    
-    # 2. Payload
-    payload = {
-        "action": "INIT",
-        "flow_token": "debug_token_123",
-        "screen": "",
-        "version": "3.0"
-    }
-    
-    # 3. Encrypt Payload
-    aesgcm = AESGCM(aes_key)
-    encrypted_flow_data = aesgcm.encrypt(iv, json.dumps(payload).encode('utf-8'), b"")
-    encrypted_flow_data_b64 = base64.b64encode(encrypted_flow_data).decode('utf-8')
-    iv_b64 = base64.b64encode(iv).decode('utf-8')
-    
-    # 4. Encrypt AES Key with Public Key (We need to read public.pem)
-    try:
-        with open("public.pem", "rb") as f:
-            public_key = serialization.load_pem_public_key(f.read())
-            
-        encrypted_aes_key = public_key.encrypt(
-            aes_key,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
-        encrypted_aes_key_b64 = base64.b64encode(encrypted_aes_key).decode('utf-8')
-        
-    except FileNotFoundError:
-        print("❌ ERROR: public.pem not found. Cannot simulate request.")
-        return None
-
-    return {
-        "encrypted_flow_data": encrypted_flow_data_b64,
-        "encrypted_aes_key": encrypted_aes_key_b64,
-        "initial_vector": iv_b64
-    }
-
-def run_test():
-    print("🚀 Simulating INIT Request...")
-    req_body = generate_mock_request()
-    
-    if not req_body:
-        return
-
-    # Call the actual Function
-    # Note: process_flow_request returns a Flask Response object
-    # We need to mock the Flask request context or update app.py to be callable.
-    # Actually, process_flow_request takes 'body'. Easy.
-    
-    try:
-        flask_response = process_flow_request(req_body)
-        
-        # The response is a raw plaintext body (Encrypted B64) or JSON error
-        try:
-            resp_data = flask_response.get_data(as_text=True)
-        except:
-            resp_data = flask_response # If it returned json directly (error case)
-            
-        print(f"📦 Server returned: {resp_data[:50]}...")
-        
-        # Now we need to DECRYPT this response to verify content.
-        # But we don't have the AES key easily accessible here unless we stored it from generate_mock_request.
-        # Wait, the AES key used for response is the SAME one we sent.
-        
-        # Let's verify the LOGS instead? No, user wants to see output.
-        # I need to refactor to keep the key.
-        pass
-
-    except Exception as e:
-        print(f"❌ Crash: {e}")
-
-if __name__ == "__main__":
-    # Simplified Test: Just instantiate FlowHandler and check `sheets.get_active_counselors` validation
-    from services.sheets import GoogleSheetsService
-    s = GoogleSheetsService()
-    counselors = s.get_active_counselors()
-    print(f"\n✅ Sheet Data Fetch:")
-    print(json.dumps(counselors, indent=2))
-    
-    if not counselors:
-        print("⚠️ WARNING: No counselors returned!")
-    else:
-        print("✅ Data looks valid. Checking keys...")
-        first = counselors[0]
-        if 'id' in first and 'name' in first:
-             print("✅ Keys 'id' and 'name' present.")
-        else:
-             print("❌ MISSING KEYS in Sheet Data!")
-